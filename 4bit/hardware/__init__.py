@@ -3,4 +3,5 @@ from .gpu import *
 from .nic import *
 from .ram import *
 from .ssd import *
-from .serial import *
\ No newline at end of file
+from .serial import *
+from .snapshot import *
\ No newline at end of file
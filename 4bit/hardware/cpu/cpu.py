@@ -1,233 +1,392 @@
+import os
+import tempfile
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
 from hardware.ram.ram import RAM
 from hardware.nic.nic import NIC
-from hardware.serial.serial_io import SerialIO
+from hardware.serial.serial_io import SerialIO, BufferedSerialIO
 from hardware.ssd.ssd import SSD
 from hardware.gpu.gpu import GPU
 
+from hardware.cpu.registers import RegisterFile
+from hardware.cpu.trace import Tracer, TRACE_SUMMARY, TRACE_INSTRUCTIONS
+from hardware.cpu.profiler import Profiler
+
 import hardware.cpu.cpu_errors as cpu_errors
+import hardware.ram.ram_errors as ram_errors
+
+_context_ram = None # the program image shared by every hardware context in a worker process
+
+def _load_context_image(filename: str, jump_table: list[int], max_mem_size: int) -> None:
+    global _context_ram
+    _context_ram = RAM.open_image("context", 0, filename, max_mem_size)
+    _context_ram.set_jump_table(jump_table)
+
+def _close_contexts(pool: ProcessPoolExecutor, filename: str) -> None:
+    pool.shutdown()
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+def _run_context(core: int, pc: int, word_bits: int, max_cycles: int | None) -> tuple[int | None, int, list[str]]:
+    serial_io = BufferedSerialIO()
+    cpu = CPU(f"core {core}", 1, _context_ram, serial_io, word_bits)
+    cpu.pc = pc
+
+    try:
+        exit_code = cpu.run(max_cycles)
+    finally:
+        _context_ram.unsubscribe(cpu._invalidate)
+
+    return exit_code, cpu.cycle, serial_io.messages
 
 class CPU:
-    def __init__(self, device_name: str, cores: int, accessible_ram: RAM, accessible_serial_io: SerialIO) -> None:
+    def __init__(self, device_name: str, cores: int, accessible_ram: RAM, accessible_serial_io: SerialIO, word_bits: int = 32, tracer: Tracer | None = None, gpu: GPU | None = None, profiler: Profiler | None = None) -> None:
         """
         Create a new CPU object
 
         :param device_name:
         :param cores:
+        :param word_bits: how many bits wide each register is, results wrap around past this
+        :param tracer: where to record executed instructions, tracing is off when not given
+        :param gpu: where the GPU instruction hands data-parallel work off to, see GPU.submit
+        :param profiler: where to count and time executed instructions and RAM accesses, profiling is off when not given
         """
         self.device_name = device_name
         self.cores = cores
         self.threads = cores * 2
 
-        self.reg_0 = None
-        self.reg_1 = None
-        self.reg_2 = None
-        self.reg_3 = None
-        self.reg_4 = None
-        self.reg_5 = None
-        self.reg_6 = None
-        self.reg_7 = None
-
-        self.regs = [self.reg_0, self.reg_1, self.reg_2, self.reg_3, self.reg_4, self.reg_5, self.reg_6, self.reg_7]
+        self.regs = RegisterFile(8, word_bits)
 
         self.ram = accessible_ram
         self.serial_io = accessible_serial_io
+        self.jump_table = accessible_ram.jump_table
+        self.gpu = gpu
 
         self.cycle = 0
+        self.pc = 1
 
-        self.instruction_set = {
-            0: lambda idx1, addr, immediate=None: self.MOV(idx1, addr, immediate),
-            1: lambda reg1, reg2, output_reg: self.ADD(reg1, reg2, output_reg),
-            2: lambda reg1, reg2, output_reg: self.SUB(reg1, reg2, output_reg),
-            3: lambda reg1, reg2, output_reg: self.MUL(reg1, reg2, output_reg),
-            4: lambda reg1, reg2, output_reg: self.DIV(reg1, reg2, output_reg),
-            5: lambda reg1: self.OUT(reg1),
-            15: lambda misc=None, code="0000": self.EXIT(misc, code)
-        }
-
-        self.current_instruction = None
-
-        self._cycle()
-
-    def _cycle(self) -> None:
-        self.reg_0, self.reg_1, self.reg_2, self.reg_3, self.reg_4, self.reg_5, self.reg_6, self.reg_7 = self.regs
-        self.cycle += 1
-        self.get_next_instruction()
+        self.halted = False
+        self.exit_code = None
 
-    def _count_binary_half_byte(self, instruction: str) -> int:
-        code = int(instruction, 2)
-        return code
-
-    def _verify_regs(self, regs: list[str]) -> bool:
-        for reg in regs:
-            if reg < 0 or reg > len(self.regs):
-                return False, i
-        return True, None
-
-    def get_next_instruction(self) -> None:
-        try:
-            addr = f"0x{self.cycle}"
-            self.current_instruction = self.ram.get_instruction(addr)
-            if len(self.current_instruction) < 2:
-                self._cycle()
-        except Exception as e:
-            raise Exception("Ran out of instructions!")
-        self.execute()
-
-    def execute(self) -> None:
-        instructions = self.current_instruction
-
-        op = self._count_binary_half_byte(instructions[0])
-
-        if op in self.instruction_set:
-            self.instruction_set[op](*instructions[1:])
-            self._cycle()
-        else:
-            error_msg = f"The instruction {instructions[0]} is not a valid operation"
-            raise cpu_errors.InvalidInstructionError(error_msg)
-
-    def MOV(self, idx1: str, addr: str, immediate: int | None = None) -> None:
-        idx1 = self._count_binary_half_byte(idx1)
-
-        regs = self.regs
-
-        if not self._verify_regs([idx1]):
-            error_msg = f"Register index out of range: {idx1}"
-            raise cpu_errors.InvalidRegisterError(error_msg)
-
-        if immediate is None:
-            addr = f"0x{self._count_binary_half_byte(addr)}"
-
-            instr = self.ram.get_instruction(addr)
-            regs[idx1] = instr[0]
-            print(f"Moved number from address {addr} to register {idx1}")
-        else:
-            regs[idx1] = immediate
-            print(f"Moved immediate {immediate} to register {idx1}")
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.profiler = profiler
 
-        self.regs = regs # this unpacking makes all the values fall into place
-
-        self._cycle()
-
-    def ADD(self, idx1: str, idx2: str, idxo: str) -> None:
-        idx1 = self._count_binary_half_byte(idx1)
-        idx2 = self._count_binary_half_byte(idx2)
-        idxo = self._count_binary_half_byte(idxo)
-
-        regs = self.regs
-
-        my_regs = [idx1, idx2, idxo]
-        i = self._verify_regs(my_regs)
-        if not i[0]:
-            error_msg = f"Register index out of range: {my_regs[i[1]]}"
-            raise cpu_errors.InvalidRegisterError(error_msg)
+        self.instruction_set = {
+            0: self.MOV,
+            1: self.ADD,
+            2: self.SUB,
+            3: self.MUL,
+            4: self.DIV,
+            5: self.OUT,
+            6: self.CMP,
+            7: self.JMP,
+            8: self.JZ,
+            9: self.JNZ,
+            10: self.GPU_RUN,
+            15: self.EXIT
+        }
+        # which operands of each opcode are register indices, these get checked once at decode time
+        self.register_operands = {
+            0: (0,),
+            1: (0, 1, 2),
+            2: (0, 1, 2),
+            3: (0, 1, 2),
+            4: (0, 1, 2),
+            5: (0,),
+            6: (0, 1),
+            7: (),
+            8: (),
+            9: (),
+            10: (0,),
+            15: ()
+        }
+        # which opcodes take an index into the jump table as their operand
+        self.jump_operands = {7, 8, 9}
 
-        num1 = self._count_binary_half_byte(regs[idx1])
-        num2 = self._count_binary_half_byte(regs[idx2])
+        self.decoded = {}  # pc -> (handler, operands), handler is None for data entries
+        self.decoded_forms = {}  # identical instructions share one decoded form
 
-        op = str(bin(num1 + num2))[2:]
-        regs[idxo] = op
+        # the worker pool of run_cores, the image file its workers map and the jump table they got,
+        # kept between calls until RAM changes
+        self.contexts: tuple[ProcessPoolExecutor, str, list[int]] | None = None
+        self.contexts_stale = False
+        self._contexts_finalizer = None
 
-        print(f"Added {num1} to {num2} and sent to register {idxo}")
+        self.ram.subscribe(self._invalidate)
+        if profiler is not None:
+            self.ram.subscribe(profiler.ram_write)
 
-        self.regs = regs
+    def run(self, max_cycles: int | None = None) -> int | None:
+        """
+        Run the fetch-decode-execute loop until the program exits or the cycle budget is used up
 
-        self._cycle()
+        Can be called again after running out of cycles to resume where it stopped
 
-    def SUB(self, idx1: str, idx2: str, idxo: str) -> None:
-        idx1 = self._count_binary_half_byte(idx1)
-        idx2 = self._count_binary_half_byte(idx2)
-        idxo = self._count_binary_half_byte(idxo)
+        :param max_cycles: how many cycles to run for before returning, None means no limit
+        :return: the exit code if the program halted, None if it ran out of cycles first
+        """
+        last_cycle = None if max_cycles is None else self.cycle + max_cycles
+        decoded = self.decoded
 
-        regs = self.regs
+        tracer = self.tracer
+        trace_instructions = tracer.level >= TRACE_INSTRUCTIONS
+        first_cycle = self.cycle
+        start = time.perf_counter()
 
-        my_regs = [idx1, idx2, idxo]
-        i = self._verify_regs(my_regs)
-        if not i[0]:
-            error_msg = f"Register index out of range: {my_regs[i[1]]}"
-            raise cpu_errors.InvalidRegisterError(error_msg)
+        try:
+            if self.profiler is not None:
+                self._run_profiled(last_cycle, trace_instructions)
+            else:
+                while not self.halted:
+                    if last_cycle is not None and self.cycle >= last_cycle:
+                        break
+
+                    self.cycle += 1
+                    pc = self.pc
+                    entry = decoded.get(pc)
+                    if entry is None:
+                        entry = self.decode(pc)
+                    self.pc = pc + 1
+
+                    handler, operands = entry
+                    if handler is not None:
+                        if trace_instructions:
+                            tracer.instruction(self.cycle, pc, handler.__name__, operands)
+                        handler(*operands)
+        except Exception:
+            if tracer:
+                tracer.dump()
+            raise
+
+        if tracer.level >= TRACE_SUMMARY:
+            tracer.summary(first_cycle, self.cycle, time.perf_counter() - start, self.exit_code)
+
+        return self.exit_code
+
+    def _run_profiled(self, last_cycle: int | None, trace_instructions: bool) -> None:
+        # the same loop as run, timing every instruction, kept apart so run doesn't pay for profiling when it is off
+        decoded = self.decoded
+        tracer = self.tracer
+        profiler = self.profiler
+        record = profiler.record
+        clock = time.perf_counter
+
+        while not self.halted:
+            if last_cycle is not None and self.cycle >= last_cycle:
+                break
+
+            self.cycle += 1
+            pc = self.pc
+            entry = decoded.get(pc)
+            if entry is None:
+                entry = self.decode(pc)
+            self.pc = pc + 1
+            profiler.ram_reads += 1 # a fetch, even when the decoded form was cached
+
+            handler, operands = entry
+            if handler is not None:
+                if trace_instructions:
+                    tracer.instruction(self.cycle, pc, handler.__name__, operands)
+                start = clock()
+                handler(*operands)
+                record(pc, handler.__name__, clock() - start)
+
+    def run_cores(self, max_cycles: int | None = None, entry_points: list[int] | None = None) -> list[int | None]:
+        """
+        Run one hardware context per core, each in its own process so they execute in parallel
 
-        num1 = self._count_binary_half_byte(regs[idx1])
-        num2 = self._count_binary_half_byte(regs[idx2])
+        Every context has its own registers and program counter and runs against this CPU's RAM. The RAM image is
+        written to a file once, which every worker maps read-only, so all contexts share one copy of the program.
+        The worker processes are kept for the next call until RAM changes, see close().
+        Once all contexts finish, their output is written to this CPU's serial port one core after another.
+        The contexts aren't profiled
 
-        op = str(bin(num1 - num2))[2:]
-        regs[idxo] = op
+        :param max_cycles: the cycle budget of each context, None means no limit
+        :param entry_points: the address each core starts executing at, every core starts at this CPU's program counter by default
+        :return: the exit code of each core, None for cores that ran out of cycles
+        """
+        if entry_points is None:
+            entry_points = [self.pc] * self.cores
+        if len(entry_points) > self.cores:
+            error_msg = f"Cannot start {len(entry_points)} contexts on {self.cores} cores"
+            raise cpu_errors.NotEnoughCoresError(error_msg)
+
+        if self.contexts is None or self.contexts_stale or self.contexts[2] != self.jump_table:
+            self.close()
+            fd, filename = tempfile.mkstemp(prefix=f"zev-{os.getpid()}-", suffix=".ram")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.ram.image())
+
+            jump_table = list(self.jump_table)
+            initargs = (filename, jump_table, self.ram.max_mem_size)
+            pool = ProcessPoolExecutor(max_workers=self.cores, initializer=_load_context_image, initargs=initargs)
+            self.contexts = (pool, filename, jump_table)
+            self.contexts_stale = False
+            self._contexts_finalizer = weakref.finalize(self, _close_contexts, pool, filename)
+
+        pool = self.contexts[0]
+        futures = [pool.submit(_run_context, core, pc, self.regs.word_bits, max_cycles) for core, pc in enumerate(entry_points)]
+        results = [future.result() for future in futures]
+
+        exit_codes = []
+        for exit_code, cycles, messages in results:
+            for message in messages:
+                self.serial_io.output(message)
+            self.cycle += cycles
+            exit_codes.append(exit_code)
+
+        return exit_codes
+
+    def close(self) -> None:
+        """
+        Stop the worker processes run_cores keeps between calls and remove the image file they map,
+        otherwise that happens when the CPU is garbage collected or the interpreter exits
+        """
+        if self._contexts_finalizer is not None:
+            self._contexts_finalizer()
+            self._contexts_finalizer = None
+        self.contexts = None
 
-        print(f"Subtracted {num2} from {num1} and sent to register {idxo}")
+    def predecode(self) -> int:
+        """
+        Decode every instruction in RAM ahead of time, starting from the current program counter
 
-        self.regs = regs
+        :return: how many entries were decoded
+        """
+        pc = self.pc
+        while True:
+            try:
+                self.decode(pc)
+            except cpu_errors.OutOfInstructionsError:
+                return pc - self.pc
+            pc += 1
+
+    def decode(self, pc: int) -> tuple:
+        """
+        Turn the RAM entry at an address into (handler, operands) and cache it
 
-        self._cycle()
+        :param pc: the address to decode
+        :return: the bound handler (None for data entries) and its operands
+        """
+        try:
+            instruction = self.ram.get_instruction(pc)
+        except ram_errors.MemoryNotFoundError:
+            error_msg = f"Ran out of instructions at address {pc}"
+            raise cpu_errors.OutOfInstructionsError(error_msg)
+
+        key = tuple(instruction)
+        entry = self.decoded_forms.get(key)
+        if entry is None:
+            entry = self._decode_instruction(instruction)
+            self.decoded_forms[key] = entry
+
+        self.decoded[pc] = entry
+        return entry
+
+    def _decode_instruction(self, instruction: list[int]) -> tuple:
+        if len(instruction) < 2:
+            return None, ()
+
+        op = instruction[0]
+        if op not in self.instruction_set:
+            error_msg = f"The instruction {op:04b} is not a valid operation"
+            raise cpu_errors.InvalidInstructionError(error_msg)
 
-    def MUL(self, idx1: str, idx2: str, idxo: str) -> None:
-        idx1 = self._count_binary_half_byte(idx1)
-        idx2 = self._count_binary_half_byte(idx2)
-        idxo = self._count_binary_half_byte(idxo)
+        operands = instruction[1:]
 
-        regs = self.regs
+        for i in self.register_operands[op]:
+            if not self._verify_reg(operands[i]):
+                error_msg = f"Register index out of range: {operands[i]}"
+                raise cpu_errors.InvalidRegisterError(error_msg)
 
-        my_regs = [idx1, idx2, idxo]
-        i = self._verify_regs(my_regs)
-        if not i[0]:
-            error_msg = f"Register index out of range: {my_regs[i[1]]}"
-            raise cpu_errors.InvalidRegisterError(error_msg)
+        if op in self.jump_operands and operands[0] >= len(self.jump_table):
+            error_msg = f"Jump index out of range: {operands[0]}, the program has {len(self.jump_table)} labels"
+            raise cpu_errors.InvalidInstructionError(error_msg)
 
-        num1 = self._count_binary_half_byte(regs[idx1])
-        num2 = self._count_binary_half_byte(regs[idx2])
+        if op == 10 and self.gpu is None:
+            error_msg = f"The GPU instruction needs a GPU, but CPU {self.device_name} does not have one"
+            raise cpu_errors.InvalidInstructionError(error_msg)
 
-        op = str(bin(num1 * num2))[2:]
-        regs[idxo] = op
+        return self.instruction_set[op], tuple(operands)
 
-        print(f"Multiplied {num2} by {num1} and sent to register {idxo}")
+    def _invalidate(self, addr: int) -> None:
+        self.decoded.pop(addr, None)
+        self.contexts_stale = True
 
-        self.regs = regs
+    def _verify_reg(self, reg: int) -> bool:
+        return 0 <= reg < len(self.regs)
 
-        self._cycle()
+    def MOV(self, idx1: int, addr: int, immediate: int | None = None) -> None:
+        if immediate is None:
+            if self.profiler is not None:
+                self.profiler.ram_reads += 1
+            instr = self.ram.get_instruction(addr)
+            self.regs.store(idx1, instr[0])
+        else:
+            self.regs.store(idx1, immediate)
 
-    def DIV(self, idx1: str, idx2: str, idxo: str) -> None:
-        idx1 = self._count_binary_half_byte(idx1)
-        idx2 = self._count_binary_half_byte(idx2)
-        idxo = self._count_binary_half_byte(idxo)
+    def ADD(self, idx1: int, idx2: int, idxo: int) -> None:
+        values = self.regs.values
+        num1 = values[idx1]
+        num2 = values[idx2]
 
-        regs = self.regs
+        self.regs.store(idxo, num1 + num2)
 
-        my_regs = [idx1, idx2, idxo]
-        i = self._verify_regs(my_regs)
-        if not i[0]:
-            error_msg = f"Register index out of range: {my_regs[i[1]]}"
-            raise cpu_errors.InvalidRegisterError(error_msg)
+    def SUB(self, idx1: int, idx2: int, idxo: int) -> None:
+        values = self.regs.values
+        num1 = values[idx1]
+        num2 = values[idx2]
 
-        num1 = self._count_binary_half_byte(regs[idx1])
-        num2 = self._count_binary_half_byte(regs[idx2])
+        self.regs.store(idxo, num1 - num2)
 
-        op = str(bin(int(num1 / num2)))[2:]
-        regs[idxo] = op
+    def MUL(self, idx1: int, idx2: int, idxo: int) -> None:
+        values = self.regs.values
+        num1 = values[idx1]
+        num2 = values[idx2]
 
-        print(f"Divided {num1} by {num2} and sent to register {idxo}")
+        self.regs.store(idxo, num1 * num2)
 
-        self.regs = regs
+    def DIV(self, idx1: int, idx2: int, idxo: int) -> None:
+        values = self.regs.values
+        num1 = values[idx1]
+        num2 = values[idx2]
 
-        self._cycle()
+        if num2 == 0:
+            error_msg = f"Cannot divide register {idx1} by register {idx2} because it holds 0"
+            raise cpu_errors.DivisionByZeroError(error_msg)
 
-    def OUT(self, idxo: str) -> None:
-        idxo = self._count_binary_half_byte(idxo)
+        # truncate toward zero like hardware division does, floor division would round negatives down
+        quotient = abs(num1) // abs(num2)
+        if (num1 < 0) != (num2 < 0):
+            quotient = -quotient
+        self.regs.store(idxo, quotient)
 
-        if not self._verify_regs([idxo]):
-            error_msg = f"Register index out of range: {idxo}"
-            raise cpu_errors.InvalidRegisterError(error_msg)
+    def OUT(self, idxo: int) -> None:
+        self.serial_io.output(str(self.regs.values[idxo]))
 
-        num = self.regs[idxo]
-        if num is not None:
-            self.serial_io.output(self.serial_io, str(int(num, 2)))
+    def CMP(self, idx1: int, idx2: int) -> None:
+        values = self.regs.values
+        self.regs.zero = values[idx1] == values[idx2]
 
-            print(f"Outputted the number in register {idxo}")
-        else:
-            self.serial_io.output(self.serial_io, None)
+    def JMP(self, target: int) -> None:
+        self.pc = self.jump_table[target]
 
-        self._cycle()
+    def JZ(self, target: int) -> None:
+        if self.regs.zero:
+            self.pc = self.jump_table[target]
 
-    def EXIT(self, misc: str, code: str) -> None:
-        code = self._count_binary_half_byte(code)
+    def JNZ(self, target: int) -> None:
+        if not self.regs.zero:
+            self.pc = self.jump_table[target]
 
-        print(f"Exiting exectuing with code: {code}")
+    def GPU_RUN(self, idxo: int) -> None:
+        # runs everything the host submitted to the GPU, the CPU waits for it to finish
+        self.regs.store(idxo, self.gpu.run())
 
-        exit(code)
\ No newline at end of file
+    def EXIT(self, misc: int | None = None, code: int = 0) -> None:
+        self.exit_code = code
+        self.halted = True
\ No newline at end of file
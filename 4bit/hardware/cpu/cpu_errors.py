@@ -4,4 +4,16 @@ class InvalidInstructionError(Exception):
 
 class InvalidRegisterError(Exception):
     def __init__(self, message: str):
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+class OutOfInstructionsError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class DivisionByZeroError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class NotEnoughCoresError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
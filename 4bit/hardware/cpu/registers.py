@@ -0,0 +1,51 @@
+from array import array
+
+import hardware.cpu.cpu_errors as cpu_errors
+
+class RegisterFile:
+    __slots__ = ("values", "word_bits", "mask", "sign_bit", "overflow", "zero")
+
+    def __init__(self, count: int = 8, word_bits: int = 32) -> None:
+        """
+        Create a bank of fixed-width signed integer registers
+
+        Values that do not fit in the word width wrap around (two's complement) and set the overflow flag,
+        comparisons set the zero flag that conditional jumps read
+
+        :param count: how many registers there are
+        :param word_bits: how many bits each register holds, from 1 to 64
+        """
+        if word_bits < 1 or word_bits > 64:
+            error_msg = f"Registers can be 1 to 64 bits wide, not {word_bits}"
+            raise cpu_errors.InvalidRegisterError(error_msg)
+
+        self.values = array("q", [0] * count)
+        self.word_bits = word_bits
+        self.mask = (1 << word_bits) - 1
+        self.sign_bit = 1 << (word_bits - 1)
+        self.overflow = False
+        self.zero = False
+
+    def __str__(self):
+        return f"Registers: {list(self.values)}, {self.word_bits} bits wide"
+    def __repr__(self):
+        return self.__str__()
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, idx: int) -> int:
+        return self.values[idx]
+
+    def __setitem__(self, idx: int, value: int) -> None:
+        self.store(idx, value)
+
+    def store(self, idx: int, value: int) -> None:
+        """
+        Store a value in a register, wrapping it to the word width
+
+        :param idx: the register index
+        :param value: the (possibly out of range) result to store
+        """
+        wrapped = ((value + self.sign_bit) & self.mask) - self.sign_bit
+        self.overflow = wrapped != value
+        self.values[idx] = wrapped
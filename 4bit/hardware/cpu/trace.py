@@ -0,0 +1,56 @@
+import sys
+from collections import deque
+from typing import TextIO
+
+TRACE_OFF = 0
+TRACE_SUMMARY = 1 # one event per call to CPU.run
+TRACE_INSTRUCTIONS = 2 # one event per executed instruction
+
+class Tracer:
+    def __init__(self, level: int = TRACE_OFF, capacity: int = 4096) -> None:
+        """
+        Create a tracer that keeps the most recent CPU events in a ring buffer
+
+        Events are plain tuples and only get formatted when the trace is dumped
+
+        :param level: TRACE_OFF, TRACE_SUMMARY or TRACE_INSTRUCTIONS
+        :param capacity: how many events to keep, older ones are dropped
+        """
+        self.level = level
+        self.events = deque(maxlen=capacity)
+
+    def __str__(self):
+        return f"Tracer at level {self.level}, holding {len(self.events)}/{self.events.maxlen} events"
+    def __repr__(self):
+        return self.__str__()
+    def __bool__(self):
+        return self.level > TRACE_OFF
+
+    def instruction(self, cycle: int, pc: int, op: str, operands: tuple) -> None:
+        self.events.append((cycle, pc, op, operands))
+
+    def summary(self, first_cycle: int, last_cycle: int, seconds: float, exit_code: int | None) -> None:
+        self.events.append((last_cycle, None, "RUN", (first_cycle, seconds, exit_code)))
+
+    def clear(self) -> None:
+        self.events.clear()
+
+    def format_event(self, event: tuple) -> str:
+        cycle, pc, op, operands = event
+        if pc is None:
+            first_cycle, seconds, exit_code = operands
+            cycles = cycle - first_cycle
+            rate = cycles / seconds if seconds else 0
+            status = "still running" if exit_code is None else f"exited with code {exit_code}"
+            return f"[cycle {cycle}] ran {cycles} cycles in {seconds:.6f}s ({rate:.0f} cycles/s), {status}"
+
+        return f"[cycle {cycle}] @{pc}: {op} {' '.join(str(operand) for operand in operands)}"
+
+    def dump(self, file: TextIO = sys.stderr) -> None:
+        """
+        Write every buffered event, oldest first
+
+        :param file: where to write the trace, defaults to stderr
+        """
+        for event in self.events:
+            print(self.format_event(event), file=file)
@@ -1,5 +1,327 @@
+import threading
+from typing import Optional
+
+import numpy as np
+
 from hardware.gpu.gpu_ram import GPU_RAM
 
+import hardware.gpu.gpu_errors as gpu_errors
+
+# GPU instructions are [opcode, operands...], every operand is the id of a buffer in the GPU's memory
+OPCODES = {
+    "ADD": 0,     # ADD dst a b -> dst = a + b, elementwise
+    "SUB": 1,     # SUB dst a b -> dst = a - b
+    "MUL": 2,     # MUL dst a b -> dst = a * b
+    "DIV": 3,     # DIV dst a b -> dst = a / b, truncated toward zero
+    "SUM": 4,     # SUM dst a -> dst = [a[0] + a[1] + ...]
+    "MIN": 5,     # MIN dst a -> dst = [smallest element of a]
+    "MAX": 6,     # MAX dst a -> dst = [largest element of a]
+    "GATHER": 7,  # GATHER dst a idx -> dst[i] = a[idx[i]]
+    "SCATTER": 8, # SCATTER dst idx a -> dst[idx[i]] = a[i], dst keeps its other elements
+}
+
 class GPU:
-    def __init__(self, device_name: str, cores: int, accessable_gpu_ram: list[GPU_RAM]) -> None:
-        pass
\ No newline at end of file
+    def __init__(self, device_name: str, cores: int, accessable_gpu_ram: list[GPU_RAM], word_bits: int = 32, max_mem_size: int = 64000000, batch_size: int = 256) -> None:
+        """
+        Create a GPU that runs instructions from its GPU-RAM sticks over whole buffers at once
+
+        Every instruction is one NumPy operation across all elements of its buffers, a buffer with one element
+        is broadcast against longer ones. The GPU counts one cycle per `cores` elements an instruction touches,
+        so a wider GPU gets through the same work in fewer cycles
+
+        Every stick is its own stream, instructions on one stick run in the order they were submitted.
+        After start(), a consumer thread per stick runs instructions as they arrive, while the CPU keeps submitting
+
+        :param device_name:
+        :param cores: how many lanes run side by side
+        :param accessable_gpu_ram: the sticks instructions are submitted to and fetched from, one stream each
+        :param word_bits: how many bits wide each element is, results wrap around past this like the CPU's registers
+        :param max_mem_size: how many bytes the GPU's buffers can hold together
+        :param batch_size: how many instructions are fetched from GPU-RAM at once
+        """
+        if word_bits < 1 or word_bits > 64:
+            error_msg = f"GPU elements can be 1 to 64 bits wide, not {word_bits}"
+            raise gpu_errors.InvalidInstructionError(error_msg)
+
+        self.device_name = device_name
+        self.cores = cores
+        self.gpu_ram = accessable_gpu_ram
+        self.batch_size = batch_size
+
+        self.word_bits = word_bits
+        self.mask = (1 << word_bits) - 1
+        self.sign_bit = 1 << (word_bits - 1)
+
+        self.max_mem_size = max_mem_size
+        self.current_size = 0
+        self.buffers: dict[int, np.ndarray] = {}
+
+        self.cycle = 0
+        self.executed = 0
+        self.reported = 0 # executed as of the last run(), which returns the difference
+
+        self.lock = threading.Lock() # buffers are only touched by one thread at a time
+        self.done = threading.Condition(threading.Lock()) # notified whenever a consumer finishes a batch
+        self.completed = [0] * len(self.gpu_ram) # instructions taken off each stick and finished, run or not
+        self.consumers: list[threading.Thread] = []
+        self.error: Exception | None = None # the first failure of a consumer, raised by synchronize()
+
+        self.instruction_set = {
+            0: self.ADD,
+            1: self.SUB,
+            2: self.MUL,
+            3: self.DIV,
+            4: self.SUM,
+            5: self.MIN,
+            6: self.MAX,
+            7: self.GATHER,
+            8: self.SCATTER
+        }
+        # how many buffer operands each opcode takes
+        self.operand_counts = {0: 3, 1: 3, 2: 3, 3: 3, 4: 2, 5: 2, 6: 2, 7: 3, 8: 3}
+
+    def __str__(self):
+        pending = sum(len(stick) for stick in self.gpu_ram)
+        return f"GPU: {self.device_name}, {self.cores} cores, {len(self.buffers)} buffers using {self.current_size} of {self.max_mem_size} bytes, {pending} instructions pending"
+    def __repr__(self):
+        return self.__str__()
+
+    def _wrap(self, values: np.ndarray) -> np.ndarray:
+        # int64 arithmetic already wraps at 64 bits, narrower words wrap the same way the registers do
+        if self.word_bits == 64:
+            return values
+        return ((values + self.sign_bit) & self.mask) - self.sign_bit
+
+    def _buffer(self, buffer: int) -> np.ndarray:
+        values = self.buffers.get(buffer)
+        if values is None:
+            error_msg = f"Cannot read GPU buffer {buffer} because it does not exist"
+            raise gpu_errors.BufferNotFoundError(error_msg)
+        return values
+
+    def _store(self, buffer: int, values: np.ndarray) -> None:
+        old = self.buffers.get(buffer)
+        new_size = self.current_size - (old.nbytes if old is not None else 0) + values.nbytes
+        if new_size > self.max_mem_size:
+            error_msg = f"Cannot store {values.nbytes} bytes in GPU buffer {buffer} because GPU {self.device_name} would hold {new_size} of its {self.max_mem_size} bytes"
+            raise gpu_errors.OutOfMemoryError(error_msg)
+
+        self.buffers[buffer] = values
+        self.current_size = new_size
+
+    def upload(self, buffer: int, values) -> None:
+        """
+        Copy values into a buffer in the GPU's memory, replacing what it held
+
+        :param buffer: the id of the buffer
+        :param values: a sequence of integers, or a NumPy array
+        """
+        values = self._wrap(np.array(values, dtype=np.int64, ndmin=1))
+        with self.lock:
+            self._store(buffer, values)
+
+    def download(self, buffer: int) -> np.ndarray:
+        """
+        Call synchronize() first when consumers are running, so every submitted instruction has written its result
+
+        :param buffer: the id of the buffer
+        :return: a copy of the buffer's values
+        """
+        with self.lock:
+            return self._buffer(buffer).copy()
+
+    def free(self, buffer: int) -> None:
+        with self.lock:
+            values = self.buffers.pop(buffer, None)
+            if values is not None:
+                self.current_size -= values.nbytes
+
+    def submit(self, instructions: list[list[int]], stream: int = 0, block: bool = True, timeout: Optional[float] = None) -> int:
+        """
+        Queue instructions on a GPU-RAM stick, waiting for room while the stick is full
+
+        :param instructions: each one an opcode from OPCODES followed by its buffer ids
+        :param stream: which stick to queue them on
+        :param block: whether to wait for room, instead of raising OutOfMemoryError once the stick is full,
+                      only while the consumers are running since nothing else would make room
+        :param timeout: how many seconds to wait for room for each instruction at most, None waits forever
+        :return: how many instructions were queued
+        """
+        if not 0 <= stream < len(self.gpu_ram):
+            error_msg = f"Cannot submit to stream {stream} because GPU {self.device_name} has {len(self.gpu_ram)} GPU-RAM sticks"
+            raise gpu_errors.InvalidInstructionError(error_msg)
+        return self.gpu_ram[stream].enqueue_many(instructions, block and bool(self.consumers), timeout)
+
+    def start(self) -> None:
+        """
+        Start a consumer thread per GPU-RAM stick that runs instructions as soon as they are submitted
+        """
+        if self.consumers:
+            return
+        for stream, stick in enumerate(self.gpu_ram):
+            stick.open()
+            consumer = threading.Thread(target=self._consume, args=(stream,), name=f"gpu-{self.device_name}-{stream}", daemon=True)
+            consumer.start()
+            self.consumers.append(consumer)
+
+    def stop(self) -> None:
+        """
+        Let the consumers run what is still queued, then stop them
+        """
+        for stick in self.gpu_ram:
+            stick.close()
+        for consumer in self.consumers:
+            consumer.join()
+        self.consumers = []
+        for stick in self.gpu_ram:
+            stick.open()
+
+    def _consume(self, stream: int) -> None:
+        stick = self.gpu_ram[stream]
+        while True:
+            batch = stick.dequeue_many(self.batch_size)
+            if not batch:
+                return # closed and drained
+            self._execute_batch(stream, batch)
+
+    def _execute_batch(self, stream: int, batch: list[list[int]]) -> None:
+        try:
+            with self.lock:
+                if self.error is None: # after a failure later instructions would read what never got written
+                    for instruction in batch:
+                        self.execute(instruction)
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.done:
+                self.completed[stream] += len(batch)
+                self.done.notify_all()
+
+    def synchronize(self) -> None:
+        """
+        Wait until every instruction submitted so far has run, raising the error of the first one that failed
+        """
+        with self.done:
+            self.done.wait_for(lambda: all(self.completed[stream] >= stick.enqueued for stream, stick in enumerate(self.gpu_ram)))
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def run(self) -> int:
+        """
+        Run every submitted instruction, on this thread unless the consumers are running
+
+        :return: how many instructions ran since the last run
+        """
+        if self.consumers:
+            self.synchronize()
+        else:
+            for stream, stick in enumerate(self.gpu_ram):
+                while batch := stick.dequeue_many(self.batch_size, block=False):
+                    self._execute_batch(stream, batch)
+            self._raise_error()
+
+        executed, self.reported = self.executed - self.reported, self.executed
+        return executed
+
+    def execute(self, instruction: list[int]) -> None:
+        """
+        Run one instruction straight away, without going through GPU-RAM, not while the consumers are running
+
+        :param instruction: an opcode from OPCODES followed by its buffer ids
+        """
+        op = instruction[0]
+        if op not in self.instruction_set:
+            error_msg = f"The GPU instruction {op} is not a valid operation"
+            raise gpu_errors.InvalidInstructionError(error_msg)
+
+        operands = instruction[1:]
+        if len(operands) != self.operand_counts[op]:
+            error_msg = f"The GPU instruction {op} takes {self.operand_counts[op]} operands, not {len(operands)}"
+            raise gpu_errors.InvalidInstructionError(error_msg)
+
+        elements = self.instruction_set[op](*operands)
+        self.cycle += -(-elements // self.cores) # one cycle per `cores` elements, rounded up
+        self.executed += 1
+
+    def _elementwise(self, a: int, b: int, operation) -> np.ndarray:
+        values_a = self._buffer(a)
+        values_b = self._buffer(b)
+        if len(values_a) != len(values_b) and len(values_a) != 1 and len(values_b) != 1:
+            error_msg = f"Cannot combine GPU buffers {a} and {b} because they hold {len(values_a)} and {len(values_b)} elements"
+            raise gpu_errors.ShapeMismatchError(error_msg)
+        return operation(values_a, values_b)
+
+    def ADD(self, dst: int, a: int, b: int) -> int:
+        result = self._wrap(self._elementwise(a, b, np.add))
+        self._store(dst, result)
+        return len(result)
+
+    def SUB(self, dst: int, a: int, b: int) -> int:
+        result = self._wrap(self._elementwise(a, b, np.subtract))
+        self._store(dst, result)
+        return len(result)
+
+    def MUL(self, dst: int, a: int, b: int) -> int:
+        result = self._wrap(self._elementwise(a, b, np.multiply))
+        self._store(dst, result)
+        return len(result)
+
+    def DIV(self, dst: int, a: int, b: int) -> int:
+        if not self._buffer(b).all():
+            error_msg = f"Cannot divide GPU buffer {a} by GPU buffer {b} because it holds 0"
+            raise gpu_errors.DivisionByZeroError(error_msg)
+
+        # truncate toward zero like the CPU does, floor division would round negatives down
+        def truncate(values_a, values_b):
+            quotient = np.abs(values_a) // np.abs(values_b)
+            return np.where((values_a < 0) != (values_b < 0), -quotient, quotient)
+
+        result = self._wrap(self._elementwise(a, b, truncate))
+        self._store(dst, result)
+        return len(result)
+
+    def _reduce(self, dst: int, a: int, reduction) -> int:
+        values = self._buffer(a)
+        if len(values) == 0:
+            error_msg = f"Cannot reduce GPU buffer {a} because it is empty"
+            raise gpu_errors.ShapeMismatchError(error_msg)
+        self._store(dst, self._wrap(np.array([reduction(values)], dtype=np.int64)))
+        return len(values)
+
+    def SUM(self, dst: int, a: int) -> int:
+        return self._reduce(dst, a, np.sum)
+
+    def MIN(self, dst: int, a: int) -> int:
+        return self._reduce(dst, a, np.min)
+
+    def MAX(self, dst: int, a: int) -> int:
+        return self._reduce(dst, a, np.max)
+
+    def _indices(self, idx: int, length: int, target: int) -> np.ndarray:
+        indices = self._buffer(idx)
+        if len(indices) and (indices.min() < 0 or indices.max() >= length):
+            error_msg = f"GPU buffer {idx} holds indices outside of GPU buffer {target}, which has {length} elements"
+            raise gpu_errors.IndexOutOfRangeError(error_msg)
+        return indices
+
+    def GATHER(self, dst: int, a: int, idx: int) -> int:
+        values = self._buffer(a)
+        result = values[self._indices(idx, len(values), a)]
+        self._store(dst, result)
+        return len(result)
+
+    def SCATTER(self, dst: int, idx: int, a: int) -> int:
+        target = self._buffer(dst).copy()
+        indices = self._indices(idx, len(target), dst)
+        values = self._buffer(a)
+        if len(values) != len(indices) and len(values) != 1:
+            error_msg = f"Cannot scatter GPU buffer {a} through GPU buffer {idx} because they hold {len(values)} and {len(indices)} elements"
+            raise gpu_errors.ShapeMismatchError(error_msg)
+
+        target[indices] = values
+        self._store(dst, target)
+        return len(indices)
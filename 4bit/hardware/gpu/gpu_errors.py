@@ -0,0 +1,23 @@
+class InvalidInstructionError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class BufferNotFoundError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class ShapeMismatchError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class IndexOutOfRangeError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class DivisionByZeroError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class OutOfMemoryError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
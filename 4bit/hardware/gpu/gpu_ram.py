@@ -1,71 +1,165 @@
-from sys import getsizeof as sizeof
+import threading
+from collections import deque
+from typing import Iterable, Optional
 
+import hardware.ram.ram_errors as ram_errors
+
+SLOT_SIZE = 16 # bytes of bookkeeping every queued instruction is charged for
+FIELD_SIZE = 8 # bytes every opcode or operand is charged for
+
+def instruction_size(instruction: list[int]) -> int:
+    """
+    :return: how many bytes of a stick's budget an instruction takes up while it is queued
+    """
+    return SLOT_SIZE + FIELD_SIZE * len(instruction)
 
 class GPU_RAM:
     def __init__(self, stick_name: str, stick_num: int, max_mem_size: int = 1000000) -> None:
         """
-        Create a 'GPU-RAM Stick' object that stores memory in key-valie pairs
+        Create a 'GPU-RAM Stick' object, a bounded first in first out queue of instructions for the GPU
+
+        A producer (the CPU) enqueues instructions while a consumer (the GPU) dequeues them from another thread.
+        When the stick is full, producers wait for the consumer to make room, or get an OutOfMemoryError if they don't wait
 
         :param stick_name: what this piece of memory is called
         :param stick_num: which stick of GPU-RAM in the array is this
-        :param max_mem_size: how many bytes this object can store, default is 1000000 bytes or 1MB
+        :param max_mem_size: how many bytes of queued instructions this object can hold, default is 1000000 bytes or 1MB
         """
         self.device_name: str = stick_name
         self.stick_num: int = stick_num
         self.max_mem_size: int = max_mem_size
 
-        self.memory = {}
-        self.current_size = sizeof(self.memory)
+        self.queue: deque[list[int]] = deque()
+        self.current_size: int = 0
+
+        self.enqueued: int = 0 # how many instructions were ever added, the address of the next one is enqueued + 1
+        self.dequeued: int = 0
+        self.full_waits: int = 0 # how many times a producer had to wait for room
+        self.closed: bool = False
+
+        # one lock, waited on for room by producers and for instructions by consumers
+        self.condition = threading.Condition()
 
-        if self.current_size > self.max_mem_size:
+        if self.max_mem_size < instruction_size([0]):
             error_msg = f"Cannot create GPU-RAM Stick {self.device_name} because it does not have enough memory"
-            del self
             raise ram_errors.OutOfMemoryError(error_msg)
 
     def __str__(self):
-        return f"GPU-RAM Stick: {self.device_name}, Size: {self.current_size} bytes, Max Size: {self.max_mem_size} bytes"
-
+        return f"GPU-RAM Stick: {self.device_name}, {len(self.queue)} instructions queued, Size: {self.current_size} bytes, Max Size: {self.max_mem_size} bytes"
     def __repr__(self):
         return self.__str__()
-
     def __bool__(self):
         return self.current_size < self.max_mem_size
+    def __len__(self):
+        return len(self.queue)
+
+    def close(self) -> None:
+        """
+        Stop accepting instructions, consumers still get everything that is queued and then an empty batch
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
 
-    def add_instruction(self, instructions: list[int]) -> str:
+    def open(self) -> None:
+        """
+        Accept instructions again after close
         """
-        Add instructions to GPU-RAM
+        with self.condition:
+            self.closed = False
 
-        FOR ALL OPCODES - LOOK IN ../opcodes.txt
+    def _wait(self, predicate, block: bool, timeout: Optional[float]) -> bool:
+        if predicate():
+            return True
+        if not block:
+            return False
+        return self.condition.wait_for(predicate, timeout)
 
-        instructions should be a list of instances of 4 binary digits per instruction
+    def add_instruction(self, instructions: list[int], block: bool = True, timeout: Optional[float] = None) -> str:
+        """
+        Add one instruction to the back of the queue
 
-        :param instructions: a list of bytes that are machine code instructions
+        FOR ALL OPCODES - LOOK AT OPCODES IN gpu.py
+
+        :param instructions: an opcode followed by its operands
+        :param block: whether to wait for room when the stick is full, instead of raising OutOfMemoryError
+        :param timeout: how many seconds to wait for room at most, None waits forever
         :return: the address of the added instruction
         """
-        addr = f"{self.stick_num}x{len(self.memory) + 1}"
-        self.memory[addr] = instructions
+        with self.condition: # reentrant, so the address is read before another producer adds anything
+            self.enqueue_many([instructions], block, timeout)
+            return f"{self.stick_num}x{self.enqueued}"
 
-        self.current_size = sizeof(self.memory)
-        if self.current_size > self.max_mem_size:
-            error_msg = f"Cannot add instruction {instruction} to GPU-RAM because it exceeds GPU-RAM size"
-            del self.memory[addr]
-            raise ram_errors.OutOfMemoryError(error_msg)
+    def enqueue_many(self, instructions: Iterable[list[int]], block: bool = True, timeout: Optional[float] = None) -> int:
+        """
+        Add instructions to the back of the queue, in order
 
-        return addr
+        As many instructions as fit are added at once, the rest wait for the consumer to make room.
+        Without waiting, the instructions that fit stay queued and OutOfMemoryError is raised for the rest
 
-    def get_instruction(self, addr: int) -> list[int]:
+        :param instructions: each one an opcode followed by its operands
+        :param block: whether to wait for room when the stick is full, instead of raising OutOfMemoryError
+        :param timeout: how many seconds to wait for room for each instruction at most, None waits forever
+        :return: how many instructions were added
+        """
+        added = 0
+        with self.condition:
+            for instruction in instructions:
+                size = instruction_size(instruction)
+                if size > self.max_mem_size:
+                    error_msg = f"Cannot add instruction {instruction} to GPU-RAM because it is larger than the whole stick"
+                    raise ram_errors.OutOfMemoryError(error_msg)
+                if self.closed:
+                    error_msg = f"Cannot add instruction {instruction} to GPU-RAM Stick {self.device_name} because it is closed"
+                    raise ram_errors.OutOfMemoryError(error_msg)
+
+                fits = lambda: self.closed or self.current_size + size <= self.max_mem_size
+                if not fits():
+                    self.condition.notify_all() # let consumers take what is queued so far before waiting for room
+                    self.full_waits += block
+                    if not self._wait(fits, block, timeout) or self.closed:
+                        error_msg = f"Cannot add instruction {instruction} to GPU-RAM because it exceeds GPU-RAM size"
+                        raise ram_errors.OutOfMemoryError(error_msg)
+
+                self.queue.append(instruction)
+                self.current_size += size
+                self.enqueued += 1
+                added += 1
+
+            self.condition.notify_all()
+        return added
+
+    def get_instruction(self, block: bool = True, timeout: Optional[float] = None) -> list[int]:
         """
-        Get an instruction from GPU-RAM
-        Deletes the instructions as soon as its gotten
+        Take the instruction at the front of the queue
 
-        :param addr: the address of the instruction
-        :return: the instruction stored at the address
+        :param block: whether to wait for an instruction when the queue is empty
+        :param timeout: how many seconds to wait at most, None waits forever
+        :return: the instruction
         """
-        instruction = self.memory.get(addr)
-        if instruction is None:
-            error_msg = f"Cannot get instruction from address {addr} because it does not exist"
+        instructions = self.dequeue_many(1, block, timeout)
+        if not instructions:
+            error_msg = f"Cannot get instruction from GPU-RAM Stick {self.device_name} because it is empty"
             raise ram_errors.MemoryNotFoundError(error_msg)
+        return instructions[0]
 
-        del self.memory[addr]
+    def dequeue_many(self, max_count: int, block: bool = True, timeout: Optional[float] = None) -> list[list[int]]:
+        """
+        Take up to max_count instructions from the front of the queue, waiting for at least one
 
-        return instruction
\ No newline at end of file
+        :param max_count: how many instructions to take at most
+        :param block: whether to wait for an instruction when the queue is empty
+        :param timeout: how many seconds to wait at most, None waits forever
+        :return: the instructions in the order they were added, empty if none came or the stick was closed
+        """
+        with self.condition:
+            if not self._wait(lambda: self.queue or self.closed, block, timeout):
+                return []
+
+            count = min(max_count, len(self.queue))
+            instructions = [self.queue.popleft() for _ in range(count)]
+            self.current_size -= sum(instruction_size(instruction) for instruction in instructions)
+            self.dequeued += count
+            if count:
+                self.condition.notify_all() # wake producers waiting for room
+            return instructions
@@ -0,0 +1,347 @@
+import time
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import hardware.ssd.ssd_errors as ssd_errors
+
+CACHE_DIRECTORY = "http_cache" # where the SSD tier keeps its entries
+CACHEABLE_STATUS = (200, 203, 300, 301, 308, 404, 410)
+# the headers a 304 response can update on the stored entry
+REVALIDATION_HEADERS = ("Cache-Control", "Date", "ETag", "Expires", "Last-Modified", "Vary")
+
+def _directives(header: Optional[str]) -> dict[str, Optional[str]]:
+    directives = {}
+    for directive in (header or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class CacheEntry:
+    def __init__(self, url: str, status_code: int, headers: dict, body: bytes, vary: dict, stored_at: float) -> None:
+        """
+        One cached response
+
+        :param url:
+        :param status_code:
+        :param headers: the response headers
+        :param body: the response body
+        :param vary: the request headers named by the response's Vary header, and their values when it was stored
+        :param stored_at: when the response was received or last revalidated, as a unix timestamp
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.body = body
+        self.vary = vary
+        self.stored_at = stored_at
+
+    def __len__(self):
+        return len(self.body)
+
+    def lifetime(self) -> float:
+        """
+        :return: how many seconds the response stays fresh for, from Cache-Control max-age or else Expires
+        """
+        directives = _directives(self.headers.get("Cache-Control"))
+        if "no-cache" in directives:
+            return 0
+        if directives.get("max-age") is not None:
+            try:
+                return int(directives["max-age"])
+            except ValueError:
+                return 0
+
+        expires = _http_date(self.headers.get("Expires"))
+        if expires is not None:
+            date = _http_date(self.headers.get("Date")) or self.stored_at
+            return expires - date
+        return 0
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        try:
+            age = int(self.headers.get("Age", 0))
+        except ValueError:
+            age = 0
+        return now - self.stored_at + age < self.lifetime()
+
+    def validators(self) -> dict[str, str]:
+        """
+        :return: the conditional request headers that ask the server whether this response changed
+        """
+        headers = {}
+        if "ETag" in self.headers:
+            headers["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return headers
+
+    def matches(self, request_headers: Optional[dict]) -> bool:
+        request_headers = CaseInsensitiveDict(request_headers or {})
+        return all(request_headers.get(name) == value for name, value in self.vary.items())
+
+    def to_response(self) -> requests.Response:
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.body
+        response.url = self.url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+
+    def dump(self) -> bytes:
+        meta = {"url": self.url, "status_code": self.status_code, "headers": dict(self.headers), "vary": self.vary, "stored_at": self.stored_at}
+        return json.dumps(meta).encode() + b"\n" + self.body
+
+    @classmethod
+    def load(cls, content: bytes) -> "CacheEntry":
+        meta, _, body = content.partition(b"\n")
+        meta = json.loads(meta)
+        return cls(meta["url"], meta["status_code"], meta["headers"], body, meta["vary"], meta["stored_at"])
+
+class HTTPCache:
+    def __init__(self, max_bytes: int = 10000000, ssd=None, ssd_max_bytes: int = 0) -> None:
+        """
+        Cache GET responses for the NIC, honoring Cache-Control, Expires, ETag and Last-Modified
+
+        Fresh responses are served without touching the network, stale ones are revalidated with
+        If-None-Match / If-Modified-Since and served from the cache when the server answers 304 Not Modified.
+        Entries live in a memory tier, the least recently used ones move down to the SSD tier when there is one
+
+        :param max_bytes: how many bytes of response bodies the memory tier holds
+        :param ssd: an SSD or BlockSSD to keep entries evicted from memory on, None for memory only
+        :param ssd_max_bytes: how many bytes of entries the SSD tier holds, has to be positive when there is an ssd
+        """
+        if ssd is not None and ssd_max_bytes <= 0:
+            error_msg = f"Cannot give the cache an SSD tier of {ssd_max_bytes} bytes, pass a positive ssd_max_bytes with the ssd"
+            raise ValueError(error_msg)
+
+        self.max_bytes = max_bytes
+        self.current_size = 0
+        self.memory: OrderedDict[str, CacheEntry] = OrderedDict() # least recently used first
+
+        self.ssd = ssd
+        self.ssd_max_bytes = ssd_max_bytes
+        self.ssd_size = 0
+        self.ssd_entries: OrderedDict[str, int] = OrderedDict() # url -> stored bytes, least recently used first
+
+        self.lock = threading.RLock() # the NIC's batch requests use the cache from many threads
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0 # found but too old to serve without asking the server
+        self.revalidations = 0 # stale entries the server confirmed with 304
+        self.evictions = 0
+        self.ssd_hits = 0
+
+        self.loop = None
+        if self.ssd is not None:
+            # the SSD is async, all of its calls run on one private event loop so they are never interleaved by threads
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name="http-cache-ssd", daemon=True).start()
+            try:
+                self._ssd_call(self.ssd.create_directory("", CACHE_DIRECTORY))
+            except ssd_errors.DirectoryAlreadyExistsError:
+                pass
+
+    def __str__(self):
+        return f"HTTP cache: {len(self.memory)} in memory, {len(self.ssd_entries)} on SSD, {self.hits} hits, {self.revalidations} revalidations, {self.misses} misses"
+    def __repr__(self):
+        return self.__str__()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "ssd_hits": self.ssd_hits,
+            "stale": self.stale,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.current_size,
+            "ssd_entries": len(self.ssd_entries),
+            "ssd_bytes": self.ssd_size,
+        }
+
+    def close(self) -> None:
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = None
+
+    def _ssd_call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _ssd_path(self, url: str) -> str:
+        return f"{CACHE_DIRECTORY}/{hashlib.sha256(url.encode()).hexdigest()}"
+
+    def _ssd_store(self, entry: CacheEntry) -> None:
+        content = entry.dump()
+        if len(content) > self.ssd_max_bytes:
+            return
+
+        self._ssd_drop(entry.url)
+        while self.ssd_entries and self.ssd_size + len(content) > self.ssd_max_bytes:
+            url, _ = self.ssd_entries.popitem(last=False)
+            self._ssd_remove(url)
+            self.evictions += 1
+
+        path = self._ssd_path(entry.url)
+        try:
+            self._ssd_call(self.ssd.create_file(CACHE_DIRECTORY, path.split("/")[-1]))
+        except ssd_errors.FileAlreadyExistsError:
+            pass # left over from an earlier cache on the same SSD
+        try:
+            self._ssd_call(self.ssd.write_to_file(path, content, write_binary=True))
+        except ssd_errors.StorageFullError:
+            self._ssd_call(self.ssd.delete_file(path))
+            return
+
+        self.ssd_entries[entry.url] = len(content)
+        self.ssd_size += len(content)
+
+    def _ssd_remove(self, url: str) -> None:
+        try:
+            self._ssd_call(self.ssd.delete_file(self._ssd_path(url)))
+        except ssd_errors.FileNotFoundError:
+            pass
+
+    def _ssd_drop(self, url: str) -> None:
+        size = self.ssd_entries.pop(url, None)
+        if size is not None:
+            self.ssd_size -= size
+            self._ssd_remove(url)
+
+    def _remember(self, entry: CacheEntry) -> None:
+        # put an entry in the memory tier, moving least recently used entries down to the SSD tier until it fits
+        self._forget_memory(entry.url)
+        if len(entry) > self.max_bytes:
+            if self.ssd is not None:
+                self._ssd_store(entry)
+            return
+
+        while self.memory and self.current_size + len(entry) > self.max_bytes:
+            _, old = self.memory.popitem(last=False)
+            self.current_size -= len(old)
+            if self.ssd is not None:
+                self._ssd_store(old)
+            else:
+                self.evictions += 1
+
+        self.memory[entry.url] = entry
+        self.current_size += len(entry)
+
+    def _forget_memory(self, url: str) -> None:
+        old = self.memory.pop(url, None)
+        if old is not None:
+            self.current_size -= len(old)
+
+    def lookup(self, url: str, request_headers: Optional[dict] = None) -> tuple[Optional[CacheEntry], bool]:
+        """
+        Find the cached response for a GET
+
+        :param url:
+        :param request_headers: the headers of the request, compared against the entry's Vary headers,
+                                a Cache-Control: no-cache or max-age=0 in them asks for revalidation
+        :return: the entry, None if nothing usable is cached, and whether it can be served without asking the server
+        """
+        directives = _directives(CaseInsensitiveDict(request_headers or {}).get("Cache-Control"))
+        revalidate = "no-cache" in directives or directives.get("max-age") == "0"
+
+        with self.lock:
+            entry = self.memory.get(url)
+            if entry is not None:
+                self.memory.move_to_end(url)
+            elif url in self.ssd_entries:
+                try:
+                    entry = CacheEntry.load(self._ssd_call(self.ssd.read_file(self._ssd_path(url), read_binary=True)))
+                except ssd_errors.FileNotFoundError:
+                    entry = None
+                self._ssd_drop(url)
+                if entry is not None:
+                    self.ssd_hits += 1
+                    self._remember(entry) # promoted back to memory
+
+            if entry is None or not entry.matches(request_headers):
+                self.misses += 1
+                return None, False
+
+            fresh = not revalidate and entry.is_fresh()
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale += 1
+            return entry, fresh
+
+    def store(self, url: str, response: requests.Response, request_headers: Optional[dict] = None) -> None:
+        """
+        Cache the response to a GET, if its status and headers allow it
+
+        :param url: the URL the request was sent to, responses are cached under it even after a redirect
+        :param response: what the server sent back
+        :param request_headers: the headers of the request
+        """
+        directives = _directives(response.headers.get("Cache-Control"))
+        vary = response.headers.get("Vary", "")
+        if response.status_code not in CACHEABLE_STATUS or "no-store" in directives or vary.strip() == "*":
+            return
+
+        request_headers = CaseInsensitiveDict(request_headers or {})
+        vary = {name.strip(): request_headers.get(name.strip()) for name in vary.split(",") if name.strip()}
+        entry = CacheEntry(url, response.status_code, dict(response.headers), response.content, vary, time.time())
+        if entry.lifetime() <= 0 and not entry.validators():
+            return # could never be served, stale right away and can't be revalidated
+
+        with self.lock:
+            self._remember(entry)
+
+    def revalidated(self, entry: CacheEntry, not_modified: requests.Response) -> CacheEntry:
+        """
+        Refresh a stale entry after the server answered its conditional request with 304 Not Modified
+
+        :param entry: the entry the conditional request was made for
+        :param not_modified: the 304 response
+        :return: the refreshed entry
+        """
+        for name in REVALIDATION_HEADERS:
+            if name in not_modified.headers:
+                entry.headers[name] = not_modified.headers[name]
+        entry.headers.pop("Age", None)
+        entry.stored_at = time.time()
+
+        with self.lock:
+            self.revalidations += 1
+            self._remember(entry)
+        return entry
+
+    def invalidate(self, url: str) -> None:
+        """
+        Forget the cached response for a URL, for example after a request that changed it
+        """
+        with self.lock:
+            self._forget_memory(url)
+            if self.ssd is not None:
+                self._ssd_drop(url)
+
+    def clear(self) -> None:
+        with self.lock:
+            for url in list(self.memory):
+                self._forget_memory(url)
+            if self.ssd is not None:
+                for url in list(self.ssd_entries):
+                    self._ssd_drop(url)
@@ -1,94 +1,277 @@
+import time
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util import Retry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Iterable, Iterator
+
+from hardware.nic.http_cache import HTTPCache
+
+Timeout = float | tuple[float, float] # seconds, or (connect, read) seconds
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS") # methods that don't change the resource, anything else drops its cached response
+CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since", "If-Match", "If-Unmodified-Since", "Range")
+
+class NICRequest:
+    def __init__(self, method: str, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, data: Optional[dict] = None, files: Optional[dict] = None, timeout: Optional[Timeout] = None):
+        """
+        Describe one request for NIC.send_requests
+
+        :param method: the HTTP method, like "GET" or "POST"
+        :param url:
+        :param headers:
+        :param json_body:
+        :param data:
+        :param files:
+        :param timeout: overrides the NIC's default timeout
+        """
+        self.method = method.upper()
+        self.url = url
+        self.headers = headers
+        self.json_body = json_body
+        self.data = data
+        self.files = files
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f"NICRequest: {self.method} {self.url}"
+
+class NICResult:
+    def __init__(self, index: int, request: NICRequest, response: Optional[requests.Response], error: Optional[Exception], seconds: float):
+        """
+        The outcome of one request sent by NIC.send_requests, exactly one of response and error is set
+
+        :param index: the position of the request in the batch
+        :param request: what was sent
+        :param response: the response, None if the request failed
+        :param error: why the request failed, None if it got a response
+        :param seconds: how long the request took
+        """
+        self.index = index
+        self.request = request
+        self.response = response
+        self.error = error
+        self.seconds = seconds
+
+    def __repr__(self):
+        outcome = self.response.status_code if self.response is not None else repr(self.error)
+        return f"NICResult: {self.request.method} {self.request.url} -> {outcome}"
+    def __bool__(self):
+        return self.error is None
 
 class NIC:
-    def __init__(self, device_name: str):
+    def __init__(self, device_name: str, pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.1, timeout: Optional[Timeout] = (3.05, 30), cache: Optional[HTTPCache] = None):
         """
         Create a new NIC object
 
+        Requests go through one session with a pool of keep-alive connections per host, so repeated
+        requests to the same peer reuse their TCP (and TLS) connection instead of opening a new one
+
         :param device_name:
+        :param pool_size: how many connections to keep open per host
+        :param retries: how many times to retry a request that failed to connect or got a 502/503/504 back, idempotent methods only
+        :param backoff_factor: the delay between retries grows as backoff_factor * 2 ** (retry - 1) seconds
+        :param timeout: the default timeout of every request, None waits forever
+        :param cache: an HTTPCache to serve repeated GETs from, None sends every request to the network
         """
         self.device_name = device_name
+        self.timeout = timeout
+        self.cache = cache
+        self.pool_size = pool_size
+        self.executor = None # started by the first batch, see send_requests
+
+        # a read timeout isn't retried, the peer is already slow and a retry would multiply the wait
+        retry = Retry(total=retries, read=False, backoff_factor=backoff_factor, status_forcelist=(502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def __repr__(self):
         return f"NIC: {self.device_name}"
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close every pooled connection, the NIC can't send requests afterwards, its cache is left open
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _request(self, method: str, url: str, timeout: Optional[Timeout], **kwargs) -> requests.Response:
+        if self.cache is None:
+            return self.session.request(method, url, timeout=self.timeout if timeout is None else timeout, **kwargs)
+        if method == "GET":
+            return self._cached_get(url, timeout, **kwargs)
+
+        response = self.session.request(method, url, timeout=self.timeout if timeout is None else timeout, **kwargs)
+        if method not in SAFE_METHODS and response.status_code < 400:
+            self.cache.invalidate(url)
+        return response
+
+    def _cached_get(self, url: str, timeout: Optional[Timeout], headers: Optional[dict] = None, params=None, **body) -> requests.Response:
+        timeout = self.timeout if timeout is None else timeout
+        if params:
+            url = requests.Request("GET", url, params=params).prepare().url # the query string is part of the cache key
+
+        request_headers = CaseInsensitiveDict(headers or {})
+        caller_managed = "no-store" in request_headers.get("Cache-Control", "") or any(name in request_headers for name in CONDITIONAL_HEADERS)
+        if caller_managed or any(value is not None for value in body.values()):
+            # the caller manages caching of this request itself, or it has a body (json, data or files)
+            # the response depends on and the cache key doesn't cover
+            return self.session.request("GET", url, timeout=timeout, headers=headers, **body)
+
+        entry, fresh = self.cache.lookup(url, headers)
+        if fresh:
+            return entry.to_response()
+
+        if entry is not None:
+            request_headers.update(entry.validators())
+        response = self.session.request("GET", url, timeout=timeout, headers=request_headers)
+        if response.status_code == 304 and entry is not None:
+            return self.cache.revalidated(entry, response).to_response()
+
+        self.cache.store(url, response, headers)
+        response.from_cache = False
+        return response
+
+    def _send(self, index: int, request: NICRequest) -> NICResult:
+        start = time.perf_counter()
+        try:
+            response = self._request(request.method, request.url, request.timeout, headers=request.headers, json=request.json_body, data=request.data, files=request.files)
+            return NICResult(index, request, response, None, time.perf_counter() - start)
+        except Exception as e:
+            return NICResult(index, request, None, e, time.perf_counter() - start)
+
+    def send_requests_as_completed(self, batch: Iterable[NICRequest], max_concurrency: Optional[int] = None) -> Iterator[NICResult]:
+        """
+        Send many requests at the same time, yielding each result as soon as its request finishes
+
+        At most max_concurrency requests are in flight at once, the next one is sent as soon as one finishes.
+        A request that fails doesn't stop the batch, its error is captured in its result
+
+        :param batch: the requests to send
+        :param max_concurrency: how many requests can be in flight at once, at most and by default the connection pool size
+        :return: one result per request, in the order they finished
+        """
+        limit = max(1, min(max_concurrency or self.pool_size, self.pool_size))
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix=f"nic-{self.device_name}")
+
+        pending = set()
+        for index, request in enumerate(batch):
+            if len(pending) >= limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(self.executor.submit(self._send, index, request))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def send_requests(self, batch: Iterable[NICRequest], max_concurrency: Optional[int] = None) -> list[NICResult]:
+        """
+        Send many requests at the same time, so the batch takes about as long as its slowest request
+
+        :param batch: the requests to send
+        :param max_concurrency: how many requests can be in flight at once, at most and by default the connection pool size
+        :return: one result per request, in the same order as batch
+        """
+        results = list(self.send_requests_as_completed(batch, max_concurrency))
+        results.sort(key=lambda result: result.index)
+        return results
 
-    def send_get_request(self, url: str, headers: Optional[dict] = None) -> requests.Response:
+    def send_get_request(self, url: str, headers: Optional[dict] = None, timeout: Optional[Timeout] = None) -> requests.Response:
         """
-        Send a GET request to the specified URL with the specified headers
+        Send a GET request to the specified URL with the specified headers,
+        with a cache the response may come from it, cached responses have response.from_cache set
 
         :param url:
         :param headers:
+        :param timeout: overrides the NIC's default timeout
         :return:
         """
-        response = requests.get(url, headers=headers)
+        response = self._request("GET", url, timeout, headers=headers)
         return response
 
-    def send_post_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, data: Optional[dict] = None, files: Optional[dict] = None) -> requests.Response:
+    def send_post_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, data: Optional[dict] = None, files: Optional[dict] = None, timeout: Optional[Timeout] = None) -> requests.Response:
         """
         Send a POST request to the specified URL with the specified headers and a JSON body and/or form data and/or files
 
         :param url:
         :param headers:
         :param json_body:
+        :param timeout: overrides the NIC's default timeout
         :return:
         """
-        response = requests.post(url, headers=headers, json=json_body, data=data, files=files)
+        response = self._request("POST", url, timeout, headers=headers, json=json_body, data=data, files=files)
         return response
 
-    def send_put_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, data: Optional[dict] = None, files: Optional[dict] = None) -> requests.Response:
+    def send_put_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, data: Optional[dict] = None, files: Optional[dict] = None, timeout: Optional[Timeout] = None) -> requests.Response:
         """
         Send a PUT request to the specified URL with the specified headers and a JSON body and/or form data and/or files
 
         :param url:
         :param headers:
         :param json_body:
+        :param timeout: overrides the NIC's default timeout
         :return:
         """
-        response = requests.put(url, headers=headers, json=json_body, data=data, files=files)
+        response = self._request("PUT", url, timeout, headers=headers, json=json_body, data=data, files=files)
         return response
 
-    def send_patch_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, data: Optional[dict] = None, files: Optional[dict] = None) -> requests.Response:
+    def send_patch_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, data: Optional[dict] = None, files: Optional[dict] = None, timeout: Optional[Timeout] = None) -> requests.Response:
         """
         Send a PUT request to the specified URL with the specified headers and a JSON body and/or form data and/or files
 
         :param url:
         :param headers:
         :param json_body:
+        :param timeout: overrides the NIC's default timeout
         :return:
         """
-        response = requests.patch(url, headers=headers, json=json_body, data=data, files=files)
+        response = self._request("PATCH", url, timeout, headers=headers, json=json_body, data=data, files=files)
         return response
 
-    def send_delete_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None) -> requests.Response:
+    def send_delete_request(self, url: str, headers: Optional[dict] = None, json_body: Optional[dict] = None, timeout: Optional[Timeout] = None) -> requests.Response:
         """
         Send a DELETE request to the specified URL with the specified headers
 
         :param url:
         :param headers:
+        :param timeout: overrides the NIC's default timeout
         :return:
         """
-        response = requests.delete(url, headers=headers, json=json_body)
+        response = self._request("DELETE", url, timeout, headers=headers, json=json_body)
         return response
 
-    def send_head_request(self, url: str, headers: Optional[dict] = None) -> requests.Response:
+    def send_head_request(self, url: str, headers: Optional[dict] = None, timeout: Optional[Timeout] = None) -> requests.Response:
         """
         Send a HEAD request to the specified URL with the specified headers
 
         :param url:
         :param headers:
+        :param timeout: overrides the NIC's default timeout
         :return:
         """
-        response = requests.head(url, headers=headers)
+        response = self._request("HEAD", url, timeout, headers=headers)
         return response
 
-    def send_options_request(self, url: str, headers: Optional[dict] = None) -> requests.Response:
+    def send_options_request(self, url: str, headers: Optional[dict] = None, timeout: Optional[Timeout] = None) -> requests.Response:
         """
         Send an OPTIONS request to the specified URL with the specified headers
 
         :param url:
         :param headers:
+        :param timeout: overrides the NIC's default timeout
         :return:
         """
-        response = requests.options(url, headers=headers)
+        response = self._request("OPTIONS", url, timeout, headers=headers)
         return response
\ No newline at end of file
@@ -1,11 +1,21 @@
-from sys import getsizeof as sizeof
+import mmap
+import os
+import struct
 
 import hardware.ram.ram_errors as ram_errors
 
+MAX_FIELDS = 4
+SLOT = struct.Struct(f"<B{MAX_FIELDS}q") # how many fields are in use, then up to four signed 64-bit fields
+SLOT_SIZE = SLOT.size
+FIELD_MIN = -(1 << 63)
+FIELD_MAX = (1 << 63) - 1 # fields hold anything a register of the widest word can
+
 class RAM:
     def __init__(self, stick_name: str, stick_num: int, max_mem_size: int = 1000000) -> None:
         """
-        Create a 'RAM-Stick' object that stores memory in key-valie pairs
+        Create a 'RAM-Stick' object that stores instructions in fixed-size slots of one contiguous block of memory
+
+        Addresses are integers starting at 1, every address takes up SLOT_SIZE bytes
 
         :param stick_name: what this piece of memory is called
         :param stick_num: which stick of RAM in the array is this
@@ -13,24 +23,45 @@ class RAM:
         """
         self.device_name: str = stick_name
         self.stick_num: int = stick_num
-        self.max_mem_size: int = max_mem_size + 64 # account for the size of the actual dict
+        self.max_mem_size: int = max_mem_size
 
-        self.memory = {}
-        self.current_size = sizeof(self.memory)
-        
-        if self.current_size > self.max_mem_size:
+        self.capacity: int = max_mem_size // SLOT_SIZE # how many addresses fit in the stick
+        if self.capacity < 1:
             error_msg = f"Cannot create RAM Stick {self.device_name} because it does not have enough memory"
-            del self
             raise ram_errors.OutOfMemoryError(error_msg)
 
+        # anonymous memory is reserved up front but the OS only backs the pages that get written
+        self.memory = mmap.mmap(-1, self.capacity * SLOT_SIZE)
+        self.size: int = 0 # how many addresses are in use
+        self.current_size: int = 0
+
+        self.jump_table = [] # jump index -> address, filled in from the labels of the loaded program
+
+        self.listeners = []
+
     def __str__(self):
         return f"RAM Stick: {self.device_name}, Size: {self.current_size} bytes, Max Size: {self.max_mem_size} bytes"
     def __repr__(self):
         return self.__str__()
     def __bool__(self):
         return self.current_size < self.max_mem_size
+    def __len__(self):
+        return self.size
 
-    def add_instruction(self, instructions: list[str]) -> str:
+    def _encode(self, instructions: list[str]) -> bytes:
+        if len(instructions) > MAX_FIELDS:
+            error_msg = f"Cannot store instruction {instructions} because it has more than {MAX_FIELDS} fields"
+            raise ram_errors.InvalidInstructionError(error_msg)
+
+        fields = [int(field, 2) for field in instructions]
+        for field in fields:
+            if field < FIELD_MIN or field > FIELD_MAX:
+                error_msg = f"Cannot store instruction {instructions} because its fields must fit in a signed 64-bit word"
+                raise ram_errors.InvalidInstructionError(error_msg)
+
+        return SLOT.pack(len(fields), *fields, *[0] * (MAX_FIELDS - len(fields)))
+
+    def add_instruction(self, instructions: list[str]) -> int:
         """
         Add instructions to RAM
 
@@ -39,26 +70,169 @@ class RAM:
         :param instructions: a list of bytes that are machine code instructions
         :return: the address of the added instruction
         """
-        addr = f"{self.stick_num}x{len(self.memory) + 1}"
-        self.memory[addr] = instructions
+        if self.size >= self.capacity:
+            error_msg = f"Cannot add instruction {instructions} to RAM because there is not enough memory. Instruction is {SLOT_SIZE} bytes, total memory is {self.current_size} bytes"
+            raise ram_errors.OutOfMemoryError(error_msg)
 
-        self.current_size = sizeof(self.memory)
-        if self.current_size > self.max_mem_size:
-            error_msg = f"Cannot add instruction {instructions} to RAM because there is not enough memory. Instruction is {sizeof(instructions)} bytes, total memory is {self.current_size} bytes"
-            del self.memory[addr]
+        slot = self._encode(instructions)
+
+        offset = self.size * SLOT_SIZE
+        self.memory[offset:offset + SLOT_SIZE] = slot
+        self.size += 1
+        self.current_size += SLOT_SIZE
+
+        self._notify(self.size)
+
+        return self.size
+
+    def load(self, instructions: list[list[str]]) -> int:
+        """
+        Add many instructions to RAM at once
+
+        Either all of the instructions are stored or none are
+
+        :param instructions: a list of machine code instructions, see add_instruction
+        :return: the address of the first added instruction
+        """
+        if self.size + len(instructions) > self.capacity:
+            error_msg = f"Cannot load {len(instructions)} instructions to RAM because there is not enough memory. They need {len(instructions) * SLOT_SIZE} bytes, {self.max_mem_size - self.current_size} bytes are free"
             raise ram_errors.OutOfMemoryError(error_msg)
-        
-        return addr
-        
+
+        block = b"".join(self._encode(instruction) for instruction in instructions)
+
+        first = self.size + 1
+        offset = self.size * SLOT_SIZE
+        self.memory[offset:offset + len(block)] = block
+        self.size += len(instructions)
+        self.current_size += len(block)
+
+        if self.listeners:
+            for addr in range(first, self.size + 1):
+                self._notify(addr)
+
+        return first
+
+    def set_instruction(self, addr: int, instructions: list[str]) -> None:
+        """
+        Overwrite the instruction stored at an existing address
+
+        :param addr: the address of the instruction
+        :param instructions: a list of bytes that are machine code instructions
+        """
+        if addr < 1 or addr > self.size:
+            error_msg = f"Cannot set instruction at address {addr} because it does not exist"
+            raise ram_errors.MemoryNotFoundError(error_msg)
+
+        offset = (addr - 1) * SLOT_SIZE
+        self.memory[offset:offset + SLOT_SIZE] = self._encode(instructions)
+        self._notify(addr)
+
+    def set_jump_table(self, targets: list[int]) -> None:
+        """
+        Replace the jump table that jump instructions index into
+
+        The table is updated in place, so a CPU holding on to it sees the new targets
+
+        :param targets: the address every jump index leads to
+        """
+        for target in targets:
+            if target < 1 or target > self.capacity:
+                error_msg = f"Cannot set jump target {target} because it is outside of RAM Stick {self.device_name}"
+                raise ram_errors.MemoryNotFoundError(error_msg)
+
+        self.jump_table[:] = targets
+
+    def clear(self) -> None:
+        """
+        Forget every stored instruction, jump target and subscriber so the stick can be reused for another program
+        """
+        self.size = 0
+        self.current_size = 0
+        self.jump_table.clear()
+        self.listeners.clear()
+
+    def subscribe(self, listener) -> None:
+        """
+        Register a callback that gets called with the address of every write, used to invalidate decoded instructions
+
+        :param listener: a callable taking the written address
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener) -> None:
+        self.listeners.remove(listener)
+
+    def image(self) -> bytes:
+        """
+        Copy out the raw bytes of every address in use, see load_image
+
+        :return: the contents of RAM
+        """
+        return self.memory[:self.current_size]
+
+    def load_image(self, image: bytes) -> None:
+        """
+        Replace the contents of RAM with raw bytes taken from image()
+
+        :param image: the contents to load
+        """
+        if len(image) > self.capacity * SLOT_SIZE or len(image) % SLOT_SIZE:
+            error_msg = f"Cannot load a {len(image)} byte image into RAM Stick {self.device_name}, it holds {self.capacity * SLOT_SIZE} bytes in {SLOT_SIZE} byte slots"
+            raise ram_errors.OutOfMemoryError(error_msg)
+
+        self.memory[:len(image)] = image
+        self.size = len(image) // SLOT_SIZE
+        self.current_size = len(image)
+
+        if self.listeners:
+            for addr in range(1, self.size + 1):
+                self._notify(addr)
+
+    @classmethod
+    def open_image(cls, stick_name: str, stick_num: int, filename: str, max_mem_size: int = 1000000) -> "RAM":
+        """
+        Map a file holding an image() as a read-only RAM stick
+
+        The file's pages are shared by every process that maps it, so read-only copies of a program cost no extra memory.
+        Writing to the stick raises TypeError
+
+        :param stick_name: what this piece of memory is called
+        :param stick_num: which stick of RAM in the array is this
+        :param filename: the file the image was written to
+        :param max_mem_size: how many bytes the stick the image came from could store, jump targets are checked against it
+        :return: the stick
+        """
+        stick = cls(stick_name, stick_num, max_mem_size)
+        if os.path.getsize(filename) == 0:
+            return stick # an empty file can't be mapped, and there is nothing to share
+
+        with open(filename, "rb") as f:
+            image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(image) > stick.capacity * SLOT_SIZE or len(image) % SLOT_SIZE:
+            image.close()
+            error_msg = f"Cannot map a {len(image)} byte image as RAM Stick {stick_name}, it holds {stick.capacity * SLOT_SIZE} bytes in {SLOT_SIZE} byte slots"
+            raise ram_errors.OutOfMemoryError(error_msg)
+
+        stick.memory.close()
+        stick.memory = image
+        stick.size = len(image) // SLOT_SIZE
+        stick.current_size = len(image)
+        return stick
+
+    def _notify(self, addr: int) -> None:
+        for listener in self.listeners:
+            listener(addr)
+
     def get_instruction(self, addr: int) -> list[int]:
         """
         Get an instruction from RAM
         :param addr: the address of the instruction
         :return: the instruction stored at the address
         """
-        instruction = self.memory.get(addr)
-        if instruction is None:
+        if addr < 1 or addr > self.size:
             error_msg = f"Cannot get instruction from address {addr} because it does not exist"
             raise ram_errors.MemoryNotFoundError(error_msg)
 
-        return instruction
\ No newline at end of file
+        length, *fields = SLOT.unpack_from(self.memory, (addr - 1) * SLOT_SIZE)
+
+        return fields[:length]
@@ -4,4 +4,8 @@ class MemoryNotFoundError(Exception):
 
 class OutOfMemoryError(Exception):
     def __init__(self, message: str):
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+class InvalidInstructionError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
@@ -0,0 +1,385 @@
+import asyncio
+import threading
+
+from hardware.ram.ram import RAM, SLOT, SLOT_SIZE
+
+import hardware.ram.ram_errors as ram_errors
+import hardware.ssd.ssd_errors as ssd_errors
+
+class VirtualMemory:
+    def __init__(self, device_name: str, ram: RAM, ssd, page_size: int = 256) -> None:
+        """
+        Create virtual memory that holds more instructions than fit in a RAM stick, by paging the cold ones out to an SSD
+
+        Addresses are split into pages of page_size addresses. The RAM stick's memory is divided into frames
+        that hold the resident pages, a page that isn't resident gets paged in from the SSD when it is accessed,
+        evicting another page picked by the CLOCK policy (the first page not used since the clock hand last passed it).
+        Evicted pages are only written to the SSD if they changed since they were paged in
+
+        The capacity is the frames plus as many page files as the SSD had room for when the virtual memory was created,
+        a page that is resident gives up its page file whenever another page needs one, so the SSD never runs out
+
+        Stands in for a RAM stick anywhere one is used, like the CPU's accessible_ram
+
+        :param device_name:
+        :param ram: the stick whose memory holds the resident pages, its own contents are overwritten
+        :param ssd: an SSD or BlockSSD to keep the pages that aren't resident on, as one file per page
+        :param page_size: how many addresses a page holds
+        """
+        self.device_name: str = device_name
+        self.ram: RAM = ram
+        self.ssd = ssd
+        self.page_size: int = page_size
+        self.page_bytes: int = page_size * SLOT_SIZE
+
+        self.frames: int = ram.capacity // page_size
+        if page_size < 1 or self.frames < 1:
+            error_msg = f"Cannot create virtual memory {device_name} because RAM Stick {ram.device_name} holds {ram.capacity} addresses, less than one page of {page_size}"
+            raise ram_errors.OutOfMemoryError(error_msg)
+
+        self.size: int = 0 # how many addresses are in use
+        self.current_size: int = 0
+
+        self.memory = ram.memory
+        self.page_table: dict[int, int] = {} # resident page -> frame
+        self.frame_pages: list[int | None] = [None] * self.frames # frame -> the page it holds
+        self.referenced = bytearray(self.frames) # set on every access, cleared by the clock hand as it passes
+        self.dirty = bytearray(self.frames) # the frame changed since its page was paged in
+        self.hand: int = 0
+        self.swapped: set[int] = set() # pages that have a page file on the SSD
+
+        self.page_faults: int = 0
+        self.page_ins: int = 0
+        self.page_outs: int = 0
+        self.evictions: int = 0
+
+        self.jump_table = [] # jump index -> address, filled in from the labels of the loaded program
+        self.listeners = []
+
+        # the SSD is async, all of its calls run on one private event loop
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name=f"swap-{device_name}", daemon=True).start()
+
+        self.swap_directory: str = f"swap_{device_name}"
+        try:
+            self._ssd_call(self.ssd.create_directory("", self.swap_directory))
+        except ssd_errors.DirectoryAlreadyExistsError:
+            # page files left over from an earlier run mean nothing to this one
+            self._ssd_call(self.ssd.delete_directory(self.swap_directory))
+            self._ssd_call(self.ssd.create_directory("", self.swap_directory))
+
+        # every page has to fit either in a frame or in a page file on the SSD
+        self.swap_pages: int = ssd.free_files(self.page_bytes)
+        self.capacity: int = (self.frames + self.swap_pages) * page_size
+        self.max_mem_size: int = self.capacity * SLOT_SIZE
+
+    def __str__(self):
+        return f"Virtual Memory: {self.device_name}, {self.size} of {self.capacity} addresses in use, {len(self.page_table)} of {self.frames} pages resident, {self.page_faults} page faults"
+    def __repr__(self):
+        return self.__str__()
+    def __bool__(self):
+        return self.size < self.capacity
+    def __len__(self):
+        return self.size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "page_faults": self.page_faults,
+            "page_ins": self.page_ins,
+            "page_outs": self.page_outs,
+            "evictions": self.evictions,
+            "resident_pages": len(self.page_table),
+            "frames": self.frames,
+            "swapped_pages": len(self.swapped),
+            "swap_pages": self.swap_pages,
+        }
+
+    def close(self) -> None:
+        """
+        Delete the page files from the SSD, the virtual memory can't be used afterwards
+        """
+        if self.loop is None:
+            return
+        try:
+            self._ssd_call(self.ssd.delete_directory(self.swap_directory))
+        except ssd_errors.DirectoryNotFoundError:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
+
+    def _ssd_call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _page_path(self, page: int) -> str:
+        return f"{self.swap_directory}/{page}"
+
+    def _release_swap(self, incoming: int) -> None:
+        # every page file is taken, but as long as there are no more pages than the capacity,
+        # either the page being paged in or a resident page has one it doesn't need while it's in memory
+        if incoming in self.swapped:
+            victim, frame = incoming, None # already read, see _fault
+        else:
+            frame = next(frame for frame, page in enumerate(self.frame_pages) if page in self.swapped)
+            victim = self.frame_pages[frame]
+
+        self._ssd_call(self.ssd.delete_file(self._page_path(victim)))
+        self.swapped.discard(victim)
+        if frame is not None:
+            self.dirty[frame] = 1 # its frame is the only copy now
+
+    def _page_out(self, frame: int, incoming: int) -> None:
+        # the page stays resident until it is safely on the SSD, so a full SSD doesn't lose it
+        page = self.frame_pages[frame]
+        if self.dirty[frame]:
+            offset = frame * self.page_bytes
+            try:
+                if page not in self.swapped:
+                    if len(self.swapped) >= self.swap_pages:
+                        self._release_swap(incoming)
+                    self._ssd_call(self.ssd.create_file(self.swap_directory, str(page)))
+                    self.swapped.add(page)
+                self._ssd_call(self.ssd.write_to_file(self._page_path(page), bytes(self.memory[offset:offset + self.page_bytes]), write_binary=True))
+            except ssd_errors.StorageFullError:
+                error_msg = f"Cannot page out page {page} of virtual memory {self.device_name} because SSD {self.ssd.device_name} is full"
+                raise ram_errors.OutOfMemoryError(error_msg)
+            self.page_outs += 1
+        # a clean page's file already holds what its frame does
+
+        del self.page_table[page]
+        self.frame_pages[frame] = None
+        self.evictions += 1
+
+    def _victim(self) -> int:
+        # CLOCK: skip (and clear) frames used since the hand last passed them
+        while True:
+            frame = self.hand
+            self.hand = (self.hand + 1) % self.frames
+            if self.frame_pages[frame] is None or not self.referenced[frame]:
+                return frame
+            self.referenced[frame] = 0
+
+    def _fault(self, page: int) -> int:
+        self.page_faults += 1
+
+        # read before evicting, so the eviction can take over this page's file if it needs one
+        content = None
+        if page in self.swapped:
+            content = self._ssd_call(self.ssd.read_file(self._page_path(page), read_binary=True))
+
+        if len(self.page_table) < self.frames:
+            frame = self.frame_pages.index(None)
+        else:
+            frame = self._victim()
+            self._page_out(frame, page)
+
+        offset = frame * self.page_bytes
+        if content is not None:
+            self.memory[offset:offset + self.page_bytes] = content
+            self.page_ins += 1
+            self.dirty[frame] = page not in self.swapped
+        else:
+            self.memory[offset:offset + self.page_bytes] = bytes(self.page_bytes) # a page that was never written
+            self.dirty[frame] = 1
+
+        self.page_table[page] = frame
+        self.frame_pages[frame] = page
+        return frame
+
+    def _frame(self, page: int) -> int:
+        frame = self.page_table.get(page)
+        if frame is None:
+            frame = self._fault(page)
+        self.referenced[frame] = 1
+        return frame
+
+    def _discard_unused(self) -> None:
+        # pages past the last address in use hold nothing, their files and frames would only take up room
+        first_unused = -(-self.size // self.page_size)
+        for page in [page for page in self.swapped if page >= first_unused]:
+            self._ssd_call(self.ssd.delete_file(self._page_path(page)))
+            self.swapped.discard(page)
+        for page in [page for page in self.page_table if page >= first_unused]:
+            self.frame_pages[self.page_table.pop(page)] = None
+
+    def _write(self, addr: int, slot: bytes) -> None:
+        page, index = divmod(addr - 1, self.page_size)
+        frame = self._frame(page)
+        offset = frame * self.page_bytes + index * SLOT_SIZE
+        self.memory[offset:offset + SLOT_SIZE] = slot
+        self.dirty[frame] = 1
+
+    def add_instruction(self, instructions: list[str]) -> int:
+        """
+        Add instructions to virtual memory
+
+        :param instructions: a list of bytes that are machine code instructions
+        :return: the address of the added instruction
+        """
+        if self.size >= self.capacity:
+            error_msg = f"Cannot add instruction {instructions} to virtual memory {self.device_name} because its RAM and SSD are full"
+            raise ram_errors.OutOfMemoryError(error_msg)
+
+        self._write(self.size + 1, self.ram._encode(instructions))
+        self.size += 1
+        self.current_size += SLOT_SIZE
+
+        self._notify(self.size)
+        return self.size
+
+    def load(self, instructions: list[list[str]]) -> int:
+        """
+        Add many instructions to virtual memory at once
+
+        Either all of the instructions are stored or none are, the capacity is checked before anything is written
+        and an SSD that fails partway through leaves the memory as it was
+
+        :param instructions: a list of machine code instructions, see add_instruction
+        :return: the address of the first added instruction
+        """
+        if self.size + len(instructions) > self.capacity:
+            error_msg = f"Cannot load {len(instructions)} instructions to virtual memory {self.device_name} because they need {len(instructions) * SLOT_SIZE} bytes, {self.max_mem_size - self.current_size} bytes are free"
+            raise ram_errors.OutOfMemoryError(error_msg)
+
+        slots = [self.ram._encode(instruction) for instruction in instructions]
+
+        first = self.size + 1
+        try:
+            for addr, slot in enumerate(slots, first):
+                self._write(addr, slot)
+        except BaseException:
+            self._discard_unused()
+            raise
+        self.size += len(slots)
+        self.current_size += len(slots) * SLOT_SIZE
+
+        if self.listeners:
+            for addr in range(first, self.size + 1):
+                self._notify(addr)
+
+        return first
+
+    def set_instruction(self, addr: int, instructions: list[str]) -> None:
+        """
+        Overwrite the instruction stored at an existing address
+
+        :param addr: the address of the instruction
+        :param instructions: a list of bytes that are machine code instructions
+        """
+        if addr < 1 or addr > self.size:
+            error_msg = f"Cannot set instruction at address {addr} because it does not exist"
+            raise ram_errors.MemoryNotFoundError(error_msg)
+
+        self._write(addr, self.ram._encode(instructions))
+        self._notify(addr)
+
+    def get_instruction(self, addr: int) -> list[int]:
+        """
+        Get an instruction from virtual memory, paging it in if it isn't resident
+
+        :param addr: the address of the instruction
+        :return: the instruction stored at the address
+        """
+        if addr < 1 or addr > self.size:
+            error_msg = f"Cannot get instruction from address {addr} because it does not exist"
+            raise ram_errors.MemoryNotFoundError(error_msg)
+
+        page, index = divmod(addr - 1, self.page_size)
+        frame = self.page_table.get(page)
+        if frame is None:
+            frame = self._fault(page)
+        self.referenced[frame] = 1
+
+        length, *fields = SLOT.unpack_from(self.memory, frame * self.page_bytes + index * SLOT_SIZE)
+        return fields[:length]
+
+    def set_jump_table(self, targets: list[int]) -> None:
+        """
+        Replace the jump table that jump instructions index into, in place like RAM.set_jump_table
+
+        :param targets: the address every jump index leads to
+        """
+        for target in targets:
+            if target < 1 or target > self.capacity:
+                error_msg = f"Cannot set jump target {target} because it is outside of virtual memory {self.device_name}"
+                raise ram_errors.MemoryNotFoundError(error_msg)
+
+        self.jump_table[:] = targets
+
+    def clear(self) -> None:
+        """
+        Forget every stored instruction, page, jump target and subscriber so the memory can be reused for another program
+        """
+        self.size = 0
+        self.current_size = 0
+        self.page_table.clear()
+        self.frame_pages = [None] * self.frames
+        self.referenced = bytearray(self.frames)
+        self.dirty = bytearray(self.frames)
+        self.hand = 0
+        for page in self.swapped:
+            self._ssd_call(self.ssd.delete_file(self._page_path(page)))
+        self.swapped.clear()
+        self.jump_table.clear()
+        self.listeners.clear()
+
+    def subscribe(self, listener) -> None:
+        """
+        Register a callback that gets called with the address of every write, used to invalidate decoded instructions
+
+        :param listener: a callable taking the written address
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener) -> None:
+        self.listeners.remove(listener)
+
+    def _notify(self, addr: int) -> None:
+        for listener in self.listeners:
+            listener(addr)
+
+    def image(self) -> bytes:
+        """
+        Copy out the raw bytes of every address in use, in the same format as RAM.image
+
+        Pages that aren't resident are read from the SSD without paging them in
+
+        :return: the contents of virtual memory
+        """
+        pages = []
+        for page in range(-(-self.size // self.page_size)):
+            frame = self.page_table.get(page)
+            if frame is not None:
+                offset = frame * self.page_bytes
+                pages.append(bytes(self.memory[offset:offset + self.page_bytes]))
+            else:
+                pages.append(self._ssd_call(self.ssd.read_file(self._page_path(page), read_binary=True)))
+        return b"".join(pages)[:self.current_size]
+
+    def load_image(self, image: bytes) -> None:
+        """
+        Replace the contents of virtual memory with raw bytes taken from image()
+
+        :param image: the contents to load
+        """
+        if len(image) > self.max_mem_size or len(image) % SLOT_SIZE:
+            error_msg = f"Cannot load a {len(image)} byte image into virtual memory {self.device_name}, it holds {self.max_mem_size} bytes in {SLOT_SIZE} byte slots"
+            raise ram_errors.OutOfMemoryError(error_msg)
+
+        listeners = self.listeners
+        jump_table = list(self.jump_table)
+        self.clear()
+        self.listeners = listeners
+        self.jump_table[:] = jump_table
+
+        for first in range(0, len(image), self.page_bytes):
+            frame = self._frame(first // self.page_bytes)
+            page = image[first:first + self.page_bytes]
+            offset = frame * self.page_bytes
+            self.memory[offset:offset + len(page)] = page
+            self.dirty[frame] = 1
+        self.size = len(image) // SLOT_SIZE
+        self.current_size = len(image)
+
+        if self.listeners:
+            for addr in range(1, self.size + 1):
+                self._notify(addr)
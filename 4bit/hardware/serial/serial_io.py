@@ -7,3 +7,14 @@ class SerialIO:
 
     def read_input(self, prompt: str) -> str:
         return input(prompt)
+
+class BufferedSerialIO(SerialIO):
+    def __init__(self):
+        """
+        A serial port that keeps everything written to it instead of printing it
+        """
+        super().__init__()
+        self.messages = []
+
+    def output(self, message: str) -> None:
+        self.messages.append(message)
@@ -0,0 +1,231 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Iterable
+
+import numpy as np
+
+from hardware.cpu.cpu import CPU
+from hardware.cpu.profiler import Profiler
+from hardware.cpu.trace import Tracer
+from hardware.gpu.gpu import GPU
+from hardware.gpu.gpu_ram import GPU_RAM, instruction_size
+from hardware.ram.ram import RAM
+from hardware.serial.serial_io import SerialIO
+from hardware.ssd.ssd import SSD
+from hardware.ssd.block_ssd import BlockSSD
+
+import hardware.snapshot.snapshot_errors as snapshot_errors
+
+# layout of a snapshot file:
+#   header | section table (offset and length of every section) | machine state as JSON | sections
+# sections hold the bulk binary state, the RAM image and the GPU buffers, each starting on an ALIGNMENT boundary
+MAGIC = b"ZSNP"
+VERSION = 2
+
+HEADER = struct.Struct("<4sHHII") # magic, version, reserved, state length, section count
+SECTION = struct.Struct("<QQ") # offset from the start of the file, length
+ALIGNMENT = 8
+
+def _cpu_state(cpu: CPU) -> dict:
+    return {
+        "device_name": cpu.device_name,
+        "cores": cpu.cores,
+        "word_bits": cpu.regs.word_bits,
+        "registers": list(cpu.regs.values),
+        "overflow": cpu.regs.overflow,
+        "zero": cpu.regs.zero,
+        "cycle": cpu.cycle,
+        "pc": cpu.pc,
+        "halted": cpu.halted,
+        "exit_code": cpu.exit_code,
+    }
+
+def _gpu_state(gpu: GPU, sections: list) -> dict:
+    if gpu.consumers:
+        error_msg = f"Cannot snapshot GPU {gpu.device_name} while its consumers are running, stop() it first"
+        raise snapshot_errors.DeviceBusyError(error_msg)
+
+    buffers = []
+    for buffer, values in gpu.buffers.items():
+        buffers.append([buffer, len(sections)])
+        sections.append(values.tobytes())
+
+    sticks = []
+    for stick in gpu.gpu_ram:
+        with stick.condition:
+            sticks.append({
+                "device_name": stick.device_name,
+                "stick_num": stick.stick_num,
+                "max_mem_size": stick.max_mem_size,
+                "queue": list(stick.queue),
+                "enqueued": stick.enqueued,
+                "dequeued": stick.dequeued,
+                "full_waits": stick.full_waits,
+                "closed": stick.closed,
+            })
+
+    return {
+        "device_name": gpu.device_name,
+        "cores": gpu.cores,
+        "word_bits": gpu.word_bits,
+        "max_mem_size": gpu.max_mem_size,
+        "batch_size": gpu.batch_size,
+        "cycle": gpu.cycle,
+        "executed": gpu.executed,
+        "reported": gpu.reported,
+        "completed": gpu.completed,
+        "buffers": buffers,
+        "sticks": sticks,
+    }
+
+def _ssd_state(ssd: SSD | BlockSSD) -> dict:
+    if isinstance(ssd, BlockSSD):
+        ssd.flush() # the directory table in the image is the metadata, mounting reads it back
+        return {"kind": "block", "device_name": ssd.device_name}
+
+    if ssd.cache is not None and (ssd.cache.dirty or ssd.storing):
+        error_msg = f"Cannot snapshot SSD {ssd.device_name} while it holds writes that are not on disk yet, flush() it first"
+        raise snapshot_errors.DeviceBusyError(error_msg)
+    return {
+        "kind": "file",
+        "device_name": ssd.device_name,
+        "max_storage_size": ssd.max_storage_size,
+        "file_sizes": ssd.file_sizes,
+    }
+
+def snapshot(filename: str, cpu: CPU, ssds: Iterable[SSD | BlockSSD] = ()) -> None:
+    """
+    Save a whole machine to one file: the CPU's registers, cycle and program counter, the contents of its RAM,
+    its GPU's buffers and queued GPU-RAM instructions, and the metadata of its SSDs
+
+    The contents of SSDs stay on disk, only what is needed to mount them again is saved.
+    The file is replaced in one step, so a crash while saving leaves the previous snapshot intact
+
+    :param filename: where to save the snapshot
+    :param cpu: the CPU of the machine, stopped between runs, see CPU.run(max_cycles)
+    :param ssds: the SSDs of the machine
+    """
+    if type(cpu.ram) is not RAM:
+        error_msg = f"Cannot snapshot {cpu.ram}, only a RAM stick can be saved"
+        raise snapshot_errors.UnsupportedDeviceError(error_msg)
+
+    sections = [cpu.ram.image()]
+    state = {
+        "cpu": _cpu_state(cpu),
+        "ram": {
+            "device_name": cpu.ram.device_name,
+            "stick_num": cpu.ram.stick_num,
+            "max_mem_size": cpu.ram.max_mem_size,
+            "jump_table": cpu.ram.jump_table,
+            "image": 0,
+        },
+        "gpu": _gpu_state(cpu.gpu, sections) if cpu.gpu is not None else None,
+        "ssds": [_ssd_state(ssd) for ssd in ssds],
+    }
+    encoded = json.dumps(state, separators=(",", ":")).encode()
+
+    table = []
+    offset = -(-(HEADER.size + SECTION.size * len(sections) + len(encoded)) // ALIGNMENT) * ALIGNMENT
+    for section in sections:
+        table.append((offset, len(section)))
+        offset = -(-(offset + len(section)) // ALIGNMENT) * ALIGNMENT
+
+    partial_path = f"{filename}.{os.getpid()}"
+    try:
+        with open(partial_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(encoded), len(sections)))
+            for entry in table:
+                f.write(SECTION.pack(*entry))
+            f.write(encoded)
+            for (offset, _), section in zip(table, sections):
+                f.write(b"\x00" * (offset - f.tell()))
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, filename) # never leave a half-written snapshot in place of a good one
+
+def _restore_gpu(state: dict, view: mmap.mmap, table: list) -> GPU:
+    sticks = []
+    for stick_state in state["sticks"]:
+        stick = GPU_RAM(stick_state["device_name"], stick_state["stick_num"], stick_state["max_mem_size"])
+        stick.queue.extend(stick_state["queue"])
+        stick.current_size = sum(instruction_size(instruction) for instruction in stick.queue)
+        stick.enqueued = stick_state["enqueued"]
+        stick.dequeued = stick_state["dequeued"]
+        stick.full_waits = stick_state["full_waits"]
+        stick.closed = stick_state["closed"]
+        sticks.append(stick)
+
+    gpu = GPU(state["device_name"], state["cores"], sticks, state["word_bits"], state["max_mem_size"], state["batch_size"])
+    for buffer, section in state["buffers"]:
+        offset, length = table[section]
+        gpu.upload(buffer, np.frombuffer(view[offset:offset + length], dtype=np.int64))
+
+    gpu.cycle = state["cycle"]
+    gpu.executed = state["executed"]
+    gpu.reported = state["reported"]
+    gpu.completed = state["completed"]
+    return gpu
+
+def _restore_ssd(state: dict) -> SSD | BlockSSD:
+    if state["kind"] == "block":
+        return BlockSSD.mount(state["device_name"])
+    return SSD.mount(state["device_name"], state["max_storage_size"], state["file_sizes"])
+
+def restore(filename: str, serial_io: SerialIO | None = None, tracer: Tracer | None = None, profiler: Profiler | None = None) -> tuple[CPU, list[SSD | BlockSSD]]:
+    """
+    Boot a machine from a snapshot, ready to continue with CPU.run where it was saved
+
+    The snapshot is memory-mapped, the RAM image is copied straight out of the map into a new RAM stick.
+    Every SSD is mounted again from the filesystem it left behind
+
+    :param filename: the snapshot, see snapshot()
+    :param serial_io: where the program's output goes from now on, default is a new SerialIO
+    :param tracer: records what the CPU executes, see CPU
+    :param profiler: counts and times what the CPU executes, see CPU
+    :return: the CPU, holding the restored RAM and GPU, and the mounted SSDs in the order they were saved
+    """
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        if len(view) < HEADER.size:
+            error_msg = f"Cannot restore {filename} because it is not a snapshot"
+            raise snapshot_errors.InvalidSnapshotError(error_msg)
+        magic, version, _, state_length, section_count = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            error_msg = f"Cannot restore {filename} because it is not a version {VERSION} snapshot"
+            raise snapshot_errors.InvalidSnapshotError(error_msg)
+
+        table = [SECTION.unpack_from(view, HEADER.size + n * SECTION.size) for n in range(section_count)]
+        state_offset = HEADER.size + section_count * SECTION.size
+        if any(offset + length > len(view) for offset, length in table) or state_offset + state_length > len(view):
+            error_msg = f"Cannot restore {filename} because it is truncated"
+            raise snapshot_errors.InvalidSnapshotError(error_msg)
+        state = json.loads(view[state_offset:state_offset + state_length])
+
+        ram_state = state["ram"]
+        ram = RAM(ram_state["device_name"], ram_state["stick_num"], ram_state["max_mem_size"])
+        offset, length = table[ram_state["image"]]
+        with memoryview(view)[offset:offset + length] as image: # released before the map closes, even if loading fails
+            ram.load_image(image)
+        ram.set_jump_table(ram_state["jump_table"])
+
+        gpu = _restore_gpu(state["gpu"], view, table) if state["gpu"] is not None else None
+
+    cpu_state = state["cpu"]
+    serial_io = serial_io if serial_io is not None else SerialIO()
+    cpu = CPU(cpu_state["device_name"], cpu_state["cores"], ram, serial_io, cpu_state["word_bits"], tracer=tracer, gpu=gpu, profiler=profiler)
+    cpu.regs.values[:] = array("q", cpu_state["registers"])
+    cpu.regs.overflow = cpu_state["overflow"]
+    cpu.regs.zero = cpu_state["zero"]
+    cpu.cycle = cpu_state["cycle"]
+    cpu.pc = cpu_state["pc"]
+    cpu.halted = cpu_state["halted"]
+    cpu.exit_code = cpu_state["exit_code"]
+
+    return cpu, [_restore_ssd(ssd_state) for ssd_state in state["ssds"]]
@@ -0,0 +1,11 @@
+class InvalidSnapshotError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class DeviceBusyError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class UnsupportedDeviceError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
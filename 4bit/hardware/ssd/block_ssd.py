@@ -0,0 +1,366 @@
+import os
+import mmap
+import bisect
+import struct
+from typing import Optional, Iterable
+
+import hardware.ssd.ssd_errors as ssd_errors
+
+# layout of a block SSD image:
+#   header | directory table (max_files fixed-size entries) | data blocks
+MAGIC = b"ZSSD"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHIII") # magic, version, reserved, block size, block count, max files
+ENTRY = struct.Struct("<BxHIIQ236s") # kind, name length, first block, block count, size in bytes, name
+MAX_NAME = 236
+
+KIND_FREE = 0
+KIND_FILE = 1
+KIND_DIRECTORY = 2
+
+class BlockSSD:
+    def __init__(self, device_name: Optional[str], max_storage_size: int = 1000000, block_size: int = 4096, max_files: int = 1024, _mount: bool = False) -> None:
+        """
+        Create an SSD Object that keeps its whole filesystem in one preallocated image file
+
+        The image is memory-mapped, file contents live in contiguous runs of blocks handed out by a first-fit allocator
+        and the directory table is stored at the start of the image, so reads and writes are slice copies into the map.
+        Same API as SSD, see BlockSSD.mount to open an image again
+
+        :param device_name: The name of THIS SSD device, the image is storage/<device_name>.img
+        :param max_storage_size: How big the image is in bytes, including the directory table, default is 1000000 (1MB)
+        :param block_size: how many bytes every block holds, default is 4096
+        :param max_files: how many files and directories the directory table holds, default is 1024
+        """
+        self.device_name: str = device_name
+        self.storage_path: str = os.path.join("storage", f"{device_name}.img")
+
+        if _mount:
+            if not os.path.exists(self.storage_path):
+                error_msg = f"Cannot mount SSD {device_name} because {self.storage_path} does not exist"
+                raise ssd_errors.FileNotFoundError(error_msg)
+            self.file = open(self.storage_path, "r+b")
+            self.map = mmap.mmap(self.file.fileno(), 0)
+
+            magic, version, _, block_size, block_count, max_files = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or version != VERSION:
+                self.close()
+                error_msg = f"Cannot mount SSD {device_name} because {self.storage_path} is not a version {VERSION} SSD image"
+                raise ssd_errors.InvalidImageError(error_msg)
+            max_storage_size = len(self.map)
+        elif os.path.exists(self.storage_path):
+            error_msg: str = f"Cannot create SSD {device_name} because that space is allocated to another SSD.\n\t\t\t\tTry changing the device name"
+            raise ssd_errors.DirectoryAlreadyExistsError(error_msg)
+
+        self.max_storage_size: int = max_storage_size
+        self.block_size: int = block_size
+        self.max_files: int = max_files
+
+        directory_end = HEADER.size + max_files * ENTRY.size
+        self.data_offset: int = -(-directory_end // block_size) * block_size # round up to a whole block
+        self.block_count: int = (max_storage_size - self.data_offset) // block_size
+        if self.block_count < 1:
+            error_msg = f"Cannot create SSD {device_name} because {max_storage_size} bytes can't hold a directory of {max_files} files and any data blocks"
+            raise ssd_errors.StorageFullError(error_msg)
+
+        if not _mount:
+            self.file = open(self.storage_path, "w+b")
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(self.file.fileno(), 0, max_storage_size)
+            else:
+                self.file.truncate(max_storage_size)
+            self.map = mmap.mmap(self.file.fileno(), max_storage_size)
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, 0, block_size, self.block_count, max_files)
+
+        # the directory table is the source of truth, these are rebuilt from it on mount
+        self.entries: dict[str, list] = {} # path -> [slot, kind, first block, block count, size]
+        self.free_slots: list[int] = []
+        self.free_extents: list[list[int]] = [] # sorted [first block, block count] runs of free blocks
+        self.currently_storing_size: int = 0
+        self._load_directory()
+
+    def __str__(self):
+        return f"Block SSD Device {self.device_name} with storage size {self.max_storage_size}, currently {(self.currently_storing_size / self.max_storage_size) * 100}% full"
+    def __repr__(self):
+        return self.__str__()
+    def __bool__(self):
+        return bool(self.free_extents)
+
+    @classmethod
+    def mount(cls, device_name: str) -> "BlockSSD":
+        """
+        Open an existing SSD image, keeping every file stored in it
+
+        :param device_name: The name of the SSD device the image was created with
+        :return: the mounted SSD
+        """
+        return cls(device_name, _mount=True)
+
+    def _load_directory(self) -> None:
+        used = []
+        for slot in range(self.max_files):
+            kind, name_length, first, count, size, name = ENTRY.unpack_from(self.map, HEADER.size + slot * ENTRY.size)
+            if kind == KIND_FREE:
+                self.free_slots.append(slot)
+                continue
+
+            self.entries[name[:name_length].decode()] = [slot, kind, first, count, size]
+            self.currently_storing_size += size
+            if count:
+                used.append((first, count))
+
+        self.free_slots.reverse() # pop() hands out the lowest slot first
+
+        block = 0
+        for first, count in sorted(used):
+            if first > block:
+                self.free_extents.append([block, first - block])
+            block = first + count
+        if block < self.block_count:
+            self.free_extents.append([block, self.block_count - block])
+
+    def _key(self, *path: str) -> str:
+        key = os.path.normpath(os.path.join(*path))
+        if key == "." or key.startswith(".."):
+            error_msg = f"The path {os.path.join(*path)} is not inside SSD {self.device_name}"
+            raise ssd_errors.InvalidPathError(error_msg)
+        return key
+
+    def _write_entry(self, key: str) -> None:
+        slot, kind, first, count, size = self.entries[key]
+        name = key.encode()
+        ENTRY.pack_into(self.map, HEADER.size + slot * ENTRY.size, kind, len(name), first, count, size, name)
+
+    def _add_entry(self, key: str, kind: int) -> None:
+        if len(key.encode()) > MAX_NAME:
+            error_msg = f"Cannot create {key} because paths on SSD {self.device_name} are at most {MAX_NAME} bytes"
+            raise ssd_errors.InvalidPathError(error_msg)
+        if not self.free_slots:
+            error_msg = f"Cannot create {key} because the directory table of SSD {self.device_name} holds {self.max_files} entries"
+            raise ssd_errors.StorageFullError(error_msg)
+
+        parent = os.path.dirname(key)
+        if parent and self.entries.get(parent, (None, None))[1] != KIND_DIRECTORY:
+            error_msg = f"Cannot create {key} because the directory {parent} does not exist"
+            raise ssd_errors.DirectoryNotFoundError(error_msg)
+
+        self.entries[key] = [self.free_slots.pop(), kind, 0, 0, 0]
+        self._write_entry(key)
+
+    def _remove_entry(self, key: str) -> None:
+        slot, _, first, count, size = self.entries.pop(key)
+        self._free(first, count)
+        self.currently_storing_size -= size
+
+        ENTRY.pack_into(self.map, HEADER.size + slot * ENTRY.size, KIND_FREE, 0, 0, 0, 0, b"")
+        self.free_slots.append(slot)
+
+    def _allocate(self, count: int) -> int | None:
+        # first fit, the extents stay sorted so freed runs can be merged with their neighbours
+        for i, extent in enumerate(self.free_extents):
+            if extent[1] >= count:
+                first = extent[0]
+                if extent[1] == count:
+                    del self.free_extents[i]
+                else:
+                    extent[0] += count
+                    extent[1] -= count
+                return first
+        return None
+
+    def _grow(self, first: int, count: int, needed: int) -> int | None:
+        # extend a run in place when the blocks right after it are free
+        if not count:
+            return None
+
+        i = bisect.bisect_left(self.free_extents, [first + count])
+        if i == len(self.free_extents) or self.free_extents[i][0] != first + count or self.free_extents[i][1] < needed - count:
+            return None
+
+        extent = self.free_extents[i]
+        if extent[1] == needed - count:
+            del self.free_extents[i]
+        else:
+            extent[0] += needed - count
+            extent[1] -= needed - count
+        return first
+
+    def _free(self, first: int, count: int) -> None:
+        if not count:
+            return
+
+        i = bisect.bisect(self.free_extents, [first, count])
+        extents = self.free_extents
+        if i < len(extents) and extents[i][0] == first + count: # merge with the run after
+            extents[i][0] = first
+            extents[i][1] += count
+        else:
+            extents.insert(i, [first, count])
+
+        if i > 0 and extents[i - 1][0] + extents[i - 1][1] == extents[i][0]: # merge with the run before
+            extents[i - 1][1] += extents[i][1]
+            del extents[i]
+
+    def free_files(self, file_size: int) -> int:
+        """
+        :param file_size: how many bytes each file holds
+        :return: how many more files of that size fit, limited by both the free runs of blocks and the free directory slots
+        """
+        blocks = max(1, -(-file_size // self.block_size))
+        return min(len(self.free_slots), sum(count // blocks for _, count in self.free_extents))
+
+    def flush(self) -> None:
+        """
+        Write every change in the map back to the image file
+        """
+        self.map.flush()
+
+    def close(self) -> None:
+        """
+        Flush and unmap the image, the SSD can be mounted again later
+        """
+        if not self.map.closed:
+            self.map.flush()
+            self.map.close()
+        self.file.close()
+
+    async def delete(self):
+        """
+        Permanently delete the SSD image and object
+        """
+        self.close()
+        if os.path.exists(self.storage_path):
+            os.remove(self.storage_path)
+        del self
+
+    async def create_directory(self, parent_path: str, dir_name: str) -> None:
+        """
+        Create a directory inside this SSD's filesystem
+
+        :param parent_path: the root-directory where the new directory will be created
+        :param dir_name: the name of the new directory
+        """
+        key = self._key(parent_path, dir_name)
+        if key in self.entries:
+            error_msg = f"Cannot create directory {dir_name} because the path {os.path.join(parent_path, dir_name)} already exists"
+            raise ssd_errors.DirectoryAlreadyExistsError(error_msg)
+
+        self._add_entry(key, KIND_DIRECTORY)
+
+    async def delete_directory(self, dir_path: str) -> None:
+        """
+        Delete a directory and everything in it inside this SSD's filesystem
+
+        :param dir_path: where the directory to be deleted is located
+        """
+        key = self._key(dir_path)
+        if self.entries.get(key, (None, None))[1] != KIND_DIRECTORY:
+            error_msg = f"Cannot delete directory {dir_path} because the path {dir_path} does not exist"
+            raise ssd_errors.DirectoryNotFoundError(error_msg)
+
+        prefix = key + os.sep
+        for child in [child for child in self.entries if child.startswith(prefix)]:
+            self._remove_entry(child)
+        self._remove_entry(key)
+
+    async def create_file(self, parent_directory_path: str, file_name: str) -> None:
+        """
+        Create an empty file inside this SSD's filesystem
+
+        :param parent_directory_path: where the file will be located
+        :param file_name: what the file will be called
+        """
+        key = self._key(parent_directory_path, file_name)
+        if key in self.entries:
+            error_msg = f"Cannot create file {file_name} because the path {os.path.join(parent_directory_path, file_name)} already exists"
+            raise ssd_errors.FileAlreadyExistsError(error_msg)
+
+        self._add_entry(key, KIND_FILE)
+
+    def _file(self, file_path: str, action: str) -> list:
+        entry = self.entries.get(self._key(file_path))
+        if entry is None or entry[1] != KIND_FILE:
+            error_msg = f"Cannot {action} file {file_path} because the path {file_path} does not exist"
+            raise ssd_errors.FileNotFoundError(error_msg)
+        return entry
+
+    async def delete_file(self, file_path: str) -> None:
+        """
+        Delete a file inside this SSD's filesystem, its blocks go back to the allocator
+
+        :param file_path: where the file is located
+        """
+        self._file(file_path, "delete")
+        self._remove_entry(self._key(file_path))
+
+    async def read_file(self, file_path: str, read_binary: bool = False) -> str | bytes:
+        """
+        Read from a file inside this SSD's filesystem
+
+        :param file_path: where the file is located
+        :param read_binary: whether or not to read the contents as binary content
+        :return: either the text content or the bytes content
+        """
+        _, _, first, _, size = self._file(file_path, "read")
+        offset = self.data_offset + first * self.block_size
+        content = self.map[offset:offset + size]
+
+        return content if read_binary else content.decode()
+
+    async def write_to_file(self, file_path: str, new_content: str | bytes, write_binary: bool = False) -> None:
+        """
+        Write new content to a file, completely erases old file contents
+        **READ & SAVE OLD FILE CONTENTS FIRST**
+
+        The file keeps its blocks if the new content fits in them, otherwise it moves to a new run of blocks
+
+        :param file_path: where the file is located
+        :param new_content: what is the content to be written to the file
+        :param write_binary: whether the content is bytes
+        """
+        entry = self._file(file_path, "write to")
+        data = new_content if write_binary else new_content.encode()
+        _, _, first, count, size = entry
+
+        needed = -(-len(data) // self.block_size)
+        if needed > count:
+            new_first = self._grow(first, count, needed)
+            if new_first is None:
+                new_first = self._allocate(needed)
+                if new_first is None:
+                    error_msg = f"Cannot write {len(data)} bytes to file {file_path} because SSD {self.device_name} has no run of {needed} free blocks"
+                    raise ssd_errors.StorageFullError(error_msg)
+                self._free(first, count)
+            first = new_first
+        elif needed < count:
+            self._free(first + needed, count - needed)
+
+        offset = self.data_offset + first * self.block_size
+        self.map[offset:offset + len(data)] = data
+
+        entry[2], entry[3], entry[4] = first, needed, len(data)
+        self.currently_storing_size += len(data) - size
+        self._write_entry(self._key(file_path))
+
+    async def write_many(self, writes: dict[str, str | bytes] | Iterable[tuple[str, str | bytes]], write_binary: bool = False) -> None:
+        """
+        Write to many files at once
+
+        :param writes: file path -> new content, as a dict or as pairs
+        :param write_binary: whether the contents are bytes
+        """
+        if isinstance(writes, dict):
+            writes = writes.items()
+        for file_path, content in writes:
+            await self.write_to_file(file_path, content, write_binary)
+
+    async def read_many(self, file_paths: Iterable[str], read_binary: bool = False) -> list[str | bytes]:
+        """
+        Read many files at once
+
+        :param file_paths: where the files are located
+        :param read_binary: whether to read the contents as bytes
+        :return: the contents of every file, in the same order as file_paths
+        """
+        return [await self.read_file(file_path, read_binary) for file_path in file_paths]
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+
+class PageCache:
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Keep the contents of recently used files in memory, evicting the least recently used ones past a byte budget
+
+        Entries can be dirty (written but not stored yet), evicting one hands it back so the owner can write it out
+
+        :param max_bytes: how many bytes of file contents the cache holds at most
+        """
+        self.max_bytes: int = max_bytes
+        self.current_size: int = 0
+
+        self.entries: OrderedDict[str, bytes] = OrderedDict() # least recently used first
+        self.dirty: set[str] = set()
+        # when each file was last invalidated, oldest first, only kept for as many files as there are entries
+        # every invalidation older than floor is forgotten, see generation()
+        self.invalidations: int = 0
+        self.generations: OrderedDict[str, int] = OrderedDict()
+        self.floor: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __str__(self):
+        return f"Page cache: {len(self.entries)} files, {self.current_size} of {self.max_bytes} bytes, {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+    def __repr__(self):
+        return self.__str__()
+    def __len__(self):
+        return len(self.entries)
+    def __contains__(self, key: str):
+        return key in self.entries
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "dirty": len(self.dirty),
+            "bytes": self.current_size,
+        }
+
+    def get(self, key: str) -> bytes | None:
+        """
+        :param key: the file's path
+        :return: the cached contents, None on a miss
+        """
+        content = self.entries.get(key)
+        if content is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def generation(self, key: str) -> int:
+        """
+        Take this before starting a read from disk and pass it to put, so a read that raced a write doesn't cache stale contents
+
+        A read that raced an invalidation the cache already forgot is dropped as well, it just isn't cached
+        """
+        return self.invalidations
+
+    def _invalidated_since(self, key: str, generation: int) -> bool:
+        return self.generations.get(key, self.floor) > generation
+
+    def put(self, key: str, content: bytes, dirty: bool = False, generation: int | None = None) -> list[tuple[str, bytes]]:
+        """
+        Cache a file's contents, evicting least recently used entries until it fits
+
+        :param key: the file's path
+        :param content: the file's contents
+        :param dirty: whether the contents still have to be written to disk
+        :param generation: from generation(), the contents are dropped if the file was invalidated since
+        :return: the dirty entries that were evicted, they have to be written to disk by the caller
+        """
+        if generation is not None and self._invalidated_since(key, generation):
+            return []
+        if len(content) > self.max_bytes:
+            return [] # would evict everything and still not fit
+
+        evicted = []
+        self._remove(key)
+        while self.entries and self.current_size + len(content) > self.max_bytes:
+            old_key, old_content = self.entries.popitem(last=False)
+            self.current_size -= len(old_content)
+            self.evictions += 1
+            if old_key in self.dirty:
+                self.dirty.discard(old_key)
+                evicted.append((old_key, old_content))
+
+        self.entries[key] = content
+        self.current_size += len(content)
+        if dirty:
+            self.dirty.add(key)
+
+        return evicted
+
+    def _remove(self, key: str) -> None:
+        content = self.entries.pop(key, None)
+        if content is not None:
+            self.current_size -= len(content)
+        self.dirty.discard(key)
+
+    def invalidate(self, key: str) -> None:
+        """
+        Drop a file's entry, dirty or not
+
+        :param key: the file's path
+        """
+        self._remove(key)
+        self.invalidations += 1
+        self.generations.pop(key, None)
+        self.generations[key] = self.invalidations
+        while len(self.generations) > len(self.entries) + 1: # deleted files would otherwise stay here forever
+            _, self.floor = self.generations.popitem(last=False)
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        """
+        Drop the entries of every file under a directory
+
+        :param prefix: the directory's path followed by a separator
+        """
+        for key in [key for key in self.entries if key.startswith(prefix)]:
+            self.invalidate(key)
+
+    def take_dirty(self) -> list[tuple[str, bytes]]:
+        """
+        Mark every dirty entry clean, handing their contents over to be written to disk
+
+        :return: (key, contents) of every entry that was dirty
+        """
+        dirty = [(key, self.entries[key]) for key in self.dirty]
+        self.dirty.clear()
+        return dirty
+
+    def clear(self) -> None:
+        for key in list(self.entries):
+            self.invalidate(key)
@@ -1,25 +1,101 @@
+import io
 import os
 import shutil
 import pathlib
-import aiofiles
-from typing import Optional
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Iterable
 
 import hardware.ssd.ssd_errors as ssd_errors
+from hardware.ssd.page_cache import PageCache
+
+def _make_directory(path: str, display_path: str) -> None:
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        error_msg = f"Cannot create directory {os.path.basename(display_path)} because the path {display_path} already exists"
+        raise ssd_errors.DirectoryAlreadyExistsError(error_msg)
+
+def _remove_directory(path: str, display_path: str) -> None:
+    if not os.path.isdir(path):
+        error_msg = f"Cannot delete directory {display_path} because the path {display_path} does not exist"
+        raise ssd_errors.DirectoryNotFoundError(error_msg)
+    shutil.rmtree(path)
+
+def _make_file(path: str, display_path: str) -> None:
+    try:
+        with open(path, "x"):
+            pass
+    except FileExistsError:
+        error_msg = f"Cannot create file {os.path.basename(display_path)} because the path {display_path} already exists"
+        raise ssd_errors.FileAlreadyExistsError(error_msg)
+
+def _remove_file(path: str, display_path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        error_msg = f"Cannot delete file {os.path.basename(display_path)} because the path {display_path} does not exist"
+        raise ssd_errors.FileNotFoundError(error_msg)
+
+def _read(path: str, display_path: str, read_binary: bool) -> str | bytes:
+    try:
+        with open(path, "rb" if read_binary else "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        error_msg = f"Cannot read file {display_path} because the path {display_path} does not exist"
+        raise ssd_errors.FileNotFoundError(error_msg)
+
+def _decode(content: bytes) -> str:
+    # the same decoding and newline translation open(path, "r") applies, so cached text reads match uncached ones
+    return io.TextIOWrapper(io.BytesIO(content)).read()
+
+def _write(path: str, display_path: str, data: bytes) -> None:
+    # r+b instead of wb so a missing file is an error instead of being created
+    try:
+        with open(path, "r+b") as f:
+            f.write(data)
+            f.truncate()
+    except FileNotFoundError:
+        error_msg = f"Cannot write to file {os.path.basename(display_path)} because the path {display_path} does not exist"
+        raise ssd_errors.FileNotFoundError(error_msg)
 
 class SSD:
-    def __init__(self, device_name: Optional[str], max_storage_size: int = 1000000) -> None:
+    def __init__(self, device_name: Optional[str], max_storage_size: int = 1000000, io_workers: int = 4, cache_size: int = 0, write_back: bool = False, _mount: bool = False) -> None:
         """
         Create an SSD Object for storing long-term data in a filesystem.
 
+        Filesystem calls run on a small pool of I/O threads so they never block the event loop,
+        the size of every file is tracked as it is written so quota checks don't touch the disk
+
         :param device_name: The name of THIS SSD device, that will be the base directory for the file system
         :param max_storage_size: How many bytes this SSD will store, default is 1000000 (1MB)
+        :param io_workers: how many filesystem calls can run at the same time, default is 4
+        :param cache_size: how many bytes of file contents to keep in an LRU page cache, default is 0 (no cache)
+        :param write_back: with a cache, keep writes in the cache until they are evicted or flush() is called,
+                           otherwise writes go straight to disk and then into the cache (write-through)
+
+        See SSD.mount to open the filesystem of an SSD again
         """
         self.device_name: str = device_name
         self.storage_path: pathlib.Path = os.path.join("storage", device_name)
         self.max_storage_size: int = max_storage_size
         self.currently_storing_size: int = 0
 
-        if not os.path.exists(self.storage_path):
+        self.file_sizes: dict[str, int] = {} # path inside the SSD -> bytes stored
+        self.executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix=f"ssd-{device_name}")
+
+        self.cache: PageCache | None = PageCache(cache_size) if cache_size > 0 else None
+        self.write_back: bool = write_back and self.cache is not None
+        self.storing: dict[str, bytes] = {} # evicted dirty contents that are on their way to disk
+        self.file_locks: dict[str, asyncio.Lock] = {} # keeps writes and deletes of one file in the order they were issued
+        self.lock_users: dict[str, int] = {} # how many callers hold or wait for each lock, it's dropped at 0
+
+        if _mount:
+            if not os.path.isdir(self.storage_path):
+                error_msg = f"Cannot mount SSD {device_name} because {self.storage_path} does not exist"
+                raise ssd_errors.DirectoryNotFoundError(error_msg)
+        elif not os.path.exists(self.storage_path):
             os.mkdir(self.storage_path)
         else:
             error_msg: str = f"Cannot create SSD {device_name} because that space is allocated to another SSD.\n\t\t\t\tTry changing the device name"
@@ -32,15 +108,93 @@ class SSD:
     def __bool__(self):
         return self.currently_storing_size < self.max_storage_size
 
+    @classmethod
+    def mount(cls, device_name: str, max_storage_size: int = 1000000, file_sizes: Optional[dict[str, int]] = None, **options) -> "SSD":
+        """
+        Open the filesystem an SSD left behind, keeping every file stored in it
+
+        :param device_name: The name of the SSD device the filesystem was created with
+        :param max_storage_size: How many bytes this SSD will store
+        :param file_sizes: path inside the SSD -> bytes stored, like SSD.file_sizes, measured from the files when not given
+        :param options: io_workers, cache_size and write_back, see SSD
+        :return: the mounted SSD
+        """
+        ssd = cls(device_name, max_storage_size, _mount=True, **options)
+
+        if file_sizes is None:
+            file_sizes = {}
+            for directory, _, files in os.walk(ssd.storage_path):
+                for file in files:
+                    path = os.path.join(directory, file)
+                    file_sizes[ssd._key(os.path.relpath(path, ssd.storage_path))] = os.path.getsize(path)
+
+        ssd.file_sizes = dict(file_sizes)
+        ssd.currently_storing_size = sum(file_sizes.values())
+        return ssd
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(function, *args))
+
+    def _key(self, *path: str) -> str:
+        return os.path.normpath(os.path.join(*path))
+
+    async def _run_locked(self, key: str, function, *args):
+        lock = self.file_locks.get(key)
+        if lock is None:
+            lock = self.file_locks[key] = asyncio.Lock()
+        self.lock_users[key] = self.lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                return await self._run(function, *args)
+        finally:
+            self.lock_users[key] -= 1
+            if not self.lock_users[key]: # nobody holds or waits for it, so the next caller can start a new one
+                del self.lock_users[key]
+                del self.file_locks[key]
+
+    async def _store(self, key: str, content: bytes) -> None:
+        try:
+            await self._run_locked(key, _write, os.path.join(self.storage_path, key), key, content)
+        except ssd_errors.FileNotFoundError:
+            pass # the file was deleted while its contents waited to be written
+        finally:
+            if self.storing.get(key) is content:
+                del self.storing[key]
+
+    async def _write_back(self, entries: list[tuple[str, bytes]]) -> None:
+        # reads see the contents through self.storing until they are on disk, this has to happen before anything awaits
+        for key, content in entries:
+            self.storing[key] = content
+        await asyncio.gather(*(self._store(key, content) for key, content in entries))
+
+    def free_files(self, file_size: int) -> int:
+        """
+        :param file_size: how many bytes each file holds
+        :return: how many more files of that size fit in the space that is left
+        """
+        return (self.max_storage_size - self.currently_storing_size) // max(1, file_size)
+
+    async def flush(self) -> None:
+        """
+        Write every file that is only written to the page cache out to disk, nothing to do without write-back caching
+        """
+        if self.cache is not None:
+            await self._write_back(self.cache.take_dirty())
+
     async def _cleanup(self):
-        if os.path.exists(self.storage_path):
-            shutil.rmtree(self.storage_path)
+        if self.cache is not None:
+            self.cache.clear()
+            self.storing.clear()
+        await self._run(shutil.rmtree, self.storage_path, True)
+        self.file_sizes.clear()
+        self.currently_storing_size = 0
 
     async def delete(self):
         """
         Permanently delete the SSD filesystem and object
         """
         await self._cleanup()
+        self.executor.shutdown(wait=False)
         del self
 
     async def create_directory(self, parent_path: str, dir_name: str) -> None:
@@ -52,11 +206,7 @@ class SSD:
         :return:
         """
         path = os.path.join(self.storage_path, parent_path, dir_name)
-        if not os.path.exists(path):
-            os.mkdir(path)
-        else:
-            error_msg = f"Cannot create directory {dir_name} because the path {os.path.join(parent_path, dir_name)} already exists"
-            raise ssd_errors.DirectoryAlreadyExistsError(error_msg)
+        await self._run(_make_directory, path, os.path.join(parent_path, dir_name))
 
     async def delete_directory(self, dir_path: str) -> None:
         """
@@ -66,11 +216,15 @@ class SSD:
         :return:
         """
         path = os.path.join(self.storage_path, dir_path)
-        if os.path.exists(path):
-            shutil.rmtree(path)
-        else:
-            error_msg = f"Cannot delete directory {dir_path} because the path {dir_path} does not exist"
-            raise ssd_errors.DirectoryDoesNotExistError(error_msg)
+        await self._run(_remove_directory, path, dir_path)
+
+        prefix = self._key(dir_path) + os.sep
+        if self.cache is not None:
+            self.cache.invalidate_prefix(prefix)
+            for key in [key for key in self.storing if key.startswith(prefix)]:
+                del self.storing[key]
+        for key in [key for key in self.file_sizes if key.startswith(prefix)]:
+            self.currently_storing_size -= self.file_sizes.pop(key)
 
     async def create_file(self, parent_directory_path: str, file_name: str) -> None:
         """
@@ -81,12 +235,8 @@ class SSD:
         :return:
         """
         path = os.path.join(self.storage_path, parent_directory_path, file_name)
-        if not os.path.exists(path):
-            async with aiofiles.open(path, "w") as f:
-                await f.write("")
-        else:
-            error_msg = f"Cannot create file {file_name} because the path {os.path.join(parent_directory_path, file_name)} already exists"
-            raise ssd_errors.FileAlreadyExistsError(error_msg)
+        await self._run(_make_file, path, os.path.join(parent_directory_path, file_name))
+        self.file_sizes[self._key(parent_directory_path, file_name)] = 0
 
     async def delete_file(self, file_path: str) -> None:
         """
@@ -96,11 +246,12 @@ class SSD:
         :return:
         """
         path = os.path.join(self.storage_path, file_path)
-        if os.path.exists(path):
-            os.remove(path)
-        else:
-            error_msg = f"Cannot delete file {file_path.split('/')[-1]} because the path {file_path} does not exist"
-            raise ssd_errors.FileNotFoundError(error_msg)
+        key = self._key(file_path)
+        if self.cache is not None:
+            self.cache.invalidate(key)
+            self.storing.pop(key, None)
+        await self._run_locked(key, _remove_file, path, file_path)
+        self.currently_storing_size -= self.file_sizes.pop(key, 0)
 
     async def read_file(self, file_path: str, read_binary: bool = False) -> str | bytes:
         """
@@ -111,16 +262,19 @@ class SSD:
         :return: either the text content or the bytes content
         """
         path = os.path.join(self.storage_path, file_path)
-        if not os.path.exists(path):
-            error_msg = f"Cannot read file {file_path} because the path {file_path} does not exist"
-            raise ssd_errors.File(error_msg)
+        if self.cache is None:
+            return await self._run(_read, path, file_path, read_binary)
 
-        if read_binary:
-            async with aiofiles.open(path, "rb") as f:
-                return await f.read()
-        else:
-            async with aiofiles.open(path, "r") as f:
-                return await f.read()
+        key = self._key(file_path)
+        content = self.cache.get(key)
+        if content is None:
+            content = self.storing.get(key)
+        if content is None:
+            generation = self.cache.generation(key)
+            content = await self._run(_read, path, file_path, True)
+            await self._write_back(self.cache.put(key, content, generation=generation))
+
+        return content if read_binary else _decode(content)
 
     async def write_to_file(self, file_path: str, new_content: str | bytes, write_binary: bool = False) -> None:
         """
@@ -133,13 +287,66 @@ class SSD:
         :return:
         """
         path = os.path.join(self.storage_path, file_path)
-        if not os.path.exists(path):
-            error_msg = f"Cannot write to file {file_path.split('/')[-1]} because the path {file_path} does not exist"
-            raise ssd_errors.FileNotFoundError(error_msg)
+        data = new_content if write_binary else new_content.encode()
 
-        if write_binary:
-            async with aiofiles.open(path, "wb") as f:
-                await f.write(new_content)
-        else:
-            async with aiofiles.open(path, "w") as f:
-                await f.write(new_content)
\ No newline at end of file
+        # the space is reserved before the write starts, so concurrent writes can't overrun the quota together
+        key = self._key(file_path)
+        tracked = key in self.file_sizes
+        old_size = self.file_sizes.get(key, 0)
+        new_size = self.currently_storing_size - old_size + len(data)
+        if new_size > self.max_storage_size:
+            error_msg = f"Cannot write {len(data)} bytes to file {file_path} because SSD {self.device_name} would hold {new_size} of its {self.max_storage_size} bytes"
+            raise ssd_errors.StorageFullError(error_msg)
+
+        if self.write_back and len(data) <= self.cache.max_bytes:
+            if not tracked:
+                error_msg = f"Cannot write to file {os.path.basename(file_path)} because the path {file_path} does not exist"
+                raise ssd_errors.FileNotFoundError(error_msg)
+
+            self.currently_storing_size = new_size
+            self.file_sizes[key] = len(data)
+            self.cache.invalidate(key) # so a read that started before this write can't cache what it read
+            await self._write_back(self.cache.put(key, data, dirty=True))
+            return
+
+        self.currently_storing_size = new_size
+        self.file_sizes[key] = len(data)
+        if self.cache is not None:
+            self.cache.invalidate(key)
+        try:
+            await self._run_locked(key, _write, path, file_path, data)
+        except BaseException:
+            self.currently_storing_size += old_size - len(data)
+            if tracked:
+                self.file_sizes[key] = old_size
+            else:
+                self.file_sizes.pop(key, None)
+            raise
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(key) # drop anything a read cached while the file was being written
+
+        if self.cache is not None:
+            # write-through, nothing awaited since the invalidation so no read can have raced it, the next read is a hit
+            await self._write_back(self.cache.put(key, data))
+
+    async def write_many(self, writes: dict[str, str | bytes] | Iterable[tuple[str, str | bytes]], write_binary: bool = False) -> None:
+        """
+        Write to many files at once, the writes run concurrently on the SSD's I/O threads
+
+        :param writes: file path -> new content, as a dict or as pairs
+        :param write_binary: whether the contents are bytes
+        """
+        if isinstance(writes, dict):
+            writes = writes.items()
+        await asyncio.gather(*(self.write_to_file(file_path, content, write_binary) for file_path, content in writes))
+
+    async def read_many(self, file_paths: Iterable[str], read_binary: bool = False) -> list[str | bytes]:
+        """
+        Read many files at once, the reads run concurrently on the SSD's I/O threads
+
+        :param file_paths: where the files are located
+        :param read_binary: whether to read the contents as bytes
+        :return: the contents of every file, in the same order as file_paths
+        """
+        return await asyncio.gather(*(self.read_file(file_path, read_binary) for file_path in file_paths))
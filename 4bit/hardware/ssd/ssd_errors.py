@@ -16,4 +16,12 @@ class FileAlreadyExistsError(Exception):
 
 class FileNotFoundError(Exception):
     def __init__(self, message: str):
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+class InvalidPathError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class InvalidImageError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
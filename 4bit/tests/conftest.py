@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the 4bit toolchain imports its modules from its own directory, like zev_compiler.py run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,53 @@
+import http.server
+import threading
+
+import pytest
+
+from hardware.nic.http_cache import HTTPCache
+from hardware.nic.nic import NIC
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        Handler.requests_seen.append((self.path, body))
+        reply = self.path.encode() + b"|" + body
+        self.send_response(200)
+        self.send_header("Cache-Control", "max-age=60")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    Handler.requests_seen = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def test_get_with_a_body_is_sent_and_not_cached(server):
+    with NIC("test", cache=HTTPCache()) as nic:
+        first = nic._request("GET", f"{server}/a", None, json={"n": 1})
+        second = nic._request("GET", f"{server}/a", None, json={"n": 2})
+    assert first.content == b'/a|{"n": 1}'
+    assert second.content == b'/a|{"n": 2}'
+    assert len(Handler.requests_seen) == 2
+
+def test_params_are_part_of_the_cache_key(server):
+    with NIC("test", cache=HTTPCache()) as nic:
+        one = nic._request("GET", f"{server}/a", None, params={"page": 1})
+        two = nic._request("GET", f"{server}/a", None, params={"page": 2})
+        again = nic._request("GET", f"{server}/a", None, params={"page": 1})
+    assert (one.content, two.content, again.content) == (b"/a?page=1|", b"/a?page=2|", b"/a?page=1|")
+    assert again.from_cache
+    assert len(Handler.requests_seen) == 2
+
+def test_an_ssd_tier_needs_a_budget():
+    with pytest.raises(ValueError):
+        HTTPCache(ssd=object())
@@ -0,0 +1,45 @@
+import pytest
+
+from hardware.ram.ram import RAM, FIELD_MAX, FIELD_MIN
+import hardware.ram.ram_errors as ram_errors
+from hardware.serial.serial_io import SerialIO
+from hardware.cpu.cpu import CPU
+from zev_compiler import create_half_byte_instructions, parse_into_instructions
+
+def run(source: str) -> CPU:
+    stick = RAM("test", 0)
+    stick.load(create_half_byte_instructions(parse_into_instructions(source.splitlines(keepends=True))))
+    cpu = CPU("test", 1, stick, SerialIO())
+    cpu.run()
+    return cpu
+
+@pytest.mark.parametrize("value", [300, 1 << 40, -3, -300])
+def test_immediates_wider_than_a_byte_round_trip(value):
+    stick = RAM("test", 0)
+    addr = stick.add_instruction(["0000", "0001", "0000", format(value, "b")])
+    assert stick.get_instruction(addr) == [0, 1, 0, value]
+
+def test_large_and_negative_immediates_run():
+    cpu = run("MOV    idx0    %300\nOUT    idx0\nMOV    idx1    %-3\nOUT    idx1\nSYSCALL    EXIT    %300;\n")
+    assert cpu.exit_code == 300
+    assert cpu.regs.values[0] == 300
+    assert cpu.regs.values[1] == -3
+
+def test_image_keeps_wide_fields():
+    stick = RAM("test", 0)
+    stick.load([["0000", "0000", "0000", format(FIELD_MAX, "b")], ["1111", "0000", format(FIELD_MIN, "b")]])
+    copy = RAM("copy", 0)
+    copy.load_image(stick.image())
+    assert copy.get_instruction(1) == [0, 0, 0, FIELD_MAX]
+    assert copy.get_instruction(2) == [15, 0, FIELD_MIN]
+
+@pytest.mark.parametrize("value", [FIELD_MAX + 1, FIELD_MIN - 1])
+def test_fields_past_64_bits_are_rejected(value):
+    stick = RAM("test", 0)
+    with pytest.raises(ram_errors.InvalidInstructionError):
+        stick.add_instruction(["0000", "0000", "0000", format(value, "b")])
+    assert len(stick) == 0
+
+def test_too_many_fields_are_rejected():
+    with pytest.raises(ram_errors.InvalidInstructionError):
+        RAM("test", 0).add_instruction(["0000"] * 5)
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from hardware.ssd.ssd import SSD
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    # SSDs keep their files under ./storage
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "storage").mkdir()
+
+def test_write_through_caches_what_it_wrote(storage):
+    async def main():
+        ssd = SSD("cached", cache_size=4096)
+        try:
+            await ssd.create_file("", "a.txt")
+            await ssd.write_to_file("a.txt", b"written", write_binary=True)
+            assert await ssd.read_file("a.txt", read_binary=True) == b"written"
+            assert ssd.cache.hits == 1 and ssd.cache.misses == 0
+        finally:
+            await ssd.delete()
+    asyncio.run(main())
+
+def test_text_reads_match_with_and_without_cache(storage):
+    async def read_twice(ssd: SSD) -> list[str]:
+        try:
+            await ssd.create_file("", "lines.txt")
+            await ssd.write_to_file("lines.txt", "one\r\ntwo\rthree\n")
+            return [await ssd.read_file("lines.txt"), await ssd.read_file("lines.txt")]
+        finally:
+            await ssd.delete()
+
+    uncached = asyncio.run(read_twice(SSD("uncached")))
+    cached = asyncio.run(read_twice(SSD("cached", cache_size=4096)))
+    assert uncached == cached == ["one\ntwo\nthree\n"] * 2
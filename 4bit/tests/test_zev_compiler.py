@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from hardware.cpu.cpu import CPU
+from hardware.ram.ram import RAM
+from hardware.serial.serial_io import SerialIO
+from zev_compiler import run_checkpointed
+
+COMPILER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "zev_compiler.py")
+
+@pytest.mark.parametrize("checkpoint", [0, -1])
+def test_run_checkpointed_rejects_non_positive_checkpoints(tmp_path, checkpoint):
+    stick = RAM("test", 0)
+    stick.load([["1111", "0000", "0000"]])
+    cpu = CPU("test", 1, stick, SerialIO())
+    with pytest.raises(ValueError):
+        run_checkpointed(cpu, str(tmp_path / "machine.zsnap"), checkpoint)
+    assert cpu.cycle == 0
+    assert not (tmp_path / "machine.zsnap").exists()
+
+def test_cli_rejects_a_zero_checkpoint(tmp_path):
+    source = tmp_path / "exit.zev"
+    source.write_text("SYSCALL    EXIT    %0;\n")
+    result = subprocess.run([sys.executable, COMPILER, str(source), "--snapshot", str(tmp_path / "machine.zsnap"), "--checkpoint", "0"],
+                            capture_output=True, text=True, timeout=60, env={**os.environ, "ZEV_CACHE_DIR": str(tmp_path / "cache")})
+    assert result.returncode == 2
+    assert "--checkpoint" in result.stderr
@@ -1,8 +1,26 @@
-from sys import argv
+import argparse
+import hashlib
+import os
+import struct
+from array import array
 
 from hardware.cpu.cpu import CPU
+from hardware.cpu.profiler import Profiler
+from hardware.cpu.trace import Tracer, TRACE_OFF, TRACE_SUMMARY, TRACE_INSTRUCTIONS
 from hardware.ram.ram import RAM
 from hardware.serial.serial_io import SerialIO
+from hardware.snapshot.snapshot import snapshot, restore
+
+ASSEMBLER_VERSION = "4" # bump whenever the assembled output changes, so old cache entries are ignored
+CACHE_DIR = os.environ.get("ZEV_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "zev"))
+CACHE_HEADER = struct.Struct("<I") # how many jump table entries come before the RAM image
+
+JUMP_INSTRUCTIONS = ("JMP", "JZ", "JNZ")
+TRACE_LEVELS = {"off": TRACE_OFF, "summary": TRACE_SUMMARY, "instructions": TRACE_INSTRUCTIONS} # --trace
+
+class SyntaxError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
 
 def read_file(filename: str) -> list:
     with open(filename, "r") as file:
@@ -23,6 +41,40 @@ def parse_into_instructions(lines: list) -> list[list[str]]:
 
     return instructions
 
+def resolve_labels(instructions: list[list[str]]) -> tuple[list[list[str]], list[int]]:
+    """
+    Take the label definitions out of a program and build its jump table
+
+    A label is a line holding only "name:", it marks the address of the instruction after it.
+    Jumps name the label they go to, that name gets replaced by the label's index in the jump table (@index)
+
+    :param instructions: the output of parse_into_instructions
+    :return: the program without its labels, and the address every jump index leads to
+    """
+    labels = {}
+    jump_table = []
+    program = []
+
+    for instruction in instructions:
+        if instruction[0].endswith(":"):
+            label = instruction[0].removesuffix(":")
+            if label in labels:
+                error_msg = f"Label {label} is defined more than once"
+                raise SyntaxError(error_msg)
+            labels[label] = len(jump_table)
+            jump_table.append(len(program) + 1)
+        else:
+            program.append(instruction)
+
+    for instruction in program:
+        if instruction[0] in JUMP_INSTRUCTIONS:
+            if len(instruction) < 2 or instruction[1] not in labels:
+                error_msg = f"Jump to an undefined label: {'    '.join(instruction)}"
+                raise SyntaxError(error_msg)
+            instruction[1] = f"@{labels[instruction[1]]}"
+
+    return program, jump_table
+
 def create_half_byte_instructions(instructions: list[list[str]]) -> list[list[str]]:
     instr_set = {
         "MOV": "0000",
@@ -31,6 +83,11 @@ def create_half_byte_instructions(instructions: list[list[str]]) -> list[list[st
         "MUL": "0011",
         "DIV": "0100",
         "OUT": "0101",
+        "CMP": "0110",
+        "JMP": "0111",
+        "JZ": "1000",
+        "JNZ": "1001",
+        "GPU": "1010",
         "EXIT": "1111"
     }
     
@@ -54,6 +111,9 @@ def create_half_byte_instructions(instructions: list[list[str]]) -> list[list[st
             elif current_instruction.startswith("idx"): # register
                 half_byte = format(int(current_instruction.removeprefix("idx")), f'0{length}b')
                 half_byte_instructions[i].append(half_byte)
+            elif current_instruction.startswith("@"): # jump table index
+                half_byte = format(int(current_instruction.removeprefix("@")), f'0{length}b')
+                half_byte_instructions[i].append(half_byte)
             elif current_instruction.startswith("0x"): # RAM address
                 half_byte = format(int(current_instruction.removeprefix("0x")), f'0{length}b')
                 half_byte_instructions[i].append(half_byte)
@@ -62,20 +122,168 @@ def create_half_byte_instructions(instructions: list[list[str]]) -> list[list[st
 
     return half_byte_instructions
 
-def compile(filename: str):
+def assemble(filename: str) -> tuple[list[list[str]], list[int]]:
     lines = read_file(filename)
-    instructions = parse_into_instructions(lines)
-    half_byte_instructions = create_half_byte_instructions(instructions)
-    print(half_byte_instructions)
+    instructions, jump_table = resolve_labels(parse_into_instructions(lines))
+    return create_half_byte_instructions(instructions), jump_table
+
+def _cache_path(source: bytes) -> str:
+    key = hashlib.sha256(ASSEMBLER_VERSION.encode() + b"\0" + source).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.ram")
+
+def load_program(filename: str, stick: RAM, use_cache: bool = True) -> bool:
+    """
+    Assemble a source file into an empty RAM stick
+
+    Assembled programs are cached on disk by the hash of their source, an unchanged program is loaded straight from the cache
+
+    :param filename: the .zev source
+    :param stick: the RAM to load the program into
+    :param use_cache: whether to read and write the compilation cache
+    :return: whether the program came from the cache
+    """
+    with open(filename, "rb") as file:
+        source = file.read()
+
+    cache_path = _cache_path(source)
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, "rb") as file:
+            entry = file.read()
+        (jumps,) = CACHE_HEADER.unpack_from(entry)
+        image_offset = CACHE_HEADER.size + jumps * 8
+        stick.load_image(entry[image_offset:])
+        stick.set_jump_table(array("q", entry[CACHE_HEADER.size:image_offset]).tolist())
+        return True
+
+    lines = source.decode().splitlines(keepends=True)
+    instructions, jump_table = resolve_labels(parse_into_instructions(lines))
+    first = stick.load(create_half_byte_instructions(instructions))
+    stick.set_jump_table([first - 1 + target for target in jump_table])
+
+    if use_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        partial_path = f"{cache_path}.{os.getpid()}"
+        with open(partial_path, "wb") as file:
+            file.write(CACHE_HEADER.pack(len(stick.jump_table)))
+            file.write(array("q", stick.jump_table).tobytes())
+            file.write(stick.image())
+        os.replace(partial_path, cache_path) # never leave a half-written entry for another process to read
 
+    return False
+
+def execute(stick: RAM, serial: SerialIO, tracer: Tracer | None = None, max_cycles: int | None = None, profiler: Profiler | None = None) -> CPU:
+    """
+    Run the program loaded into a RAM stick
+
+    :param stick: the RAM holding the program
+    :param serial: where the program's output goes
+    :param tracer: records what the CPU executes
+    :param max_cycles: stop the program after this many cycles, None means no limit
+    :param profiler: counts and times what the CPU executes
+    :return: the CPU after it stopped, holding the exit code and cycle count
+    """
+    cpu = CPU("zev compiler", 6, stick, serial, tracer=tracer, profiler=profiler)
+    cpu.predecode()
+    cpu.run(max_cycles)
+
+    return cpu
+
+def run_checkpointed(cpu: CPU, snapshot_file: str, checkpoint: int | None) -> None:
+    """
+    Run a CPU until its program exits, saving a snapshot of the machine every checkpoint cycles,
+    so a run that crashes can be resumed from the last one
+
+    :param cpu: the CPU holding the program
+    :param snapshot_file: where to save the snapshots, each one replaces the last
+    :param checkpoint: how many cycles to run between snapshots, at least 1, None runs without saving any
+    """
+    if checkpoint is not None and checkpoint < 1:
+        error_msg = f"Cannot checkpoint every {checkpoint} cycles, the program would never get to run"
+        raise ValueError(error_msg)
+
+    cpu.predecode()
+    if checkpoint is None:
+        cpu.run()
+        return
+
+    while not cpu.halted:
+        cpu.run(checkpoint)
+        snapshot(snapshot_file, cpu)
+
+def compile(filename: str, trace_level: int = TRACE_OFF, use_cache: bool = True, profile: str | None = None, snapshot_file: str | None = None, checkpoint: int | None = None) -> int | None:
+    """
+    Assemble and run a program
+
+    :param filename: the .zev source
+    :param trace_level: how much of the run to trace, see hardware.cpu.trace
+    :param use_cache: whether to load and store the assembled program in the compilation cache
+    :param profile: profile the run and write it to {profile}.pstats and {profile}.folded, None doesn't profile
+    :param snapshot_file: save the machine here once the program is loaded, so it can be booted again with resume()
+    :param checkpoint: with a snapshot_file, save the machine there again every checkpoint cycles, see run_checkpointed
+    :return: the program's exit code
+    """
     stick = RAM("stick", 0, 1000000000)  # 1GB of RAM
-    serial = SerialIO
+    serial = SerialIO()
 
-    for instruction in half_byte_instructions:
-        stick.add_instruction(instruction)
+    load_program(filename, stick, use_cache)
 
-    CPU("zev compiler", 6, stick, serial)
+    tracer = Tracer(trace_level)
+    profiler = Profiler(os.path.basename(filename)) if profile is not None else None
+    if snapshot_file is None:
+        cpu = execute(stick, serial, tracer, profiler=profiler)
+    else:
+        cpu = CPU("zev compiler", 6, stick, serial, tracer=tracer, profiler=profiler)
+        snapshot(snapshot_file, cpu)
+        run_checkpointed(cpu, snapshot_file, checkpoint)
+
+    return _finish(cpu, tracer, profiler, profile)
+
+def resume(snapshot_file: str, trace_level: int = TRACE_OFF, profile: str | None = None, checkpoint: int | None = None) -> int | None:
+    """
+    Boot a machine from a snapshot and run its program from where it was saved, without assembling anything
+
+    :param snapshot_file: a snapshot saved by compile() or by a checkpoint
+    :param trace_level: how much of the run to trace, see hardware.cpu.trace
+    :param profile: profile the run and write it to {profile}.pstats and {profile}.folded, None doesn't profile
+    :param checkpoint: save the machine back to snapshot_file every checkpoint cycles, see run_checkpointed
+    :return: the program's exit code
+    """
+    tracer = Tracer(trace_level)
+    profiler = Profiler(os.path.basename(snapshot_file)) if profile is not None else None
+    cpu, _ = restore(snapshot_file, SerialIO(), tracer, profiler)
+    run_checkpointed(cpu, snapshot_file, checkpoint)
+
+    return _finish(cpu, tracer, profiler, profile)
+
+def _positive_int(text: str) -> int:
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"{text} is not a positive number")
+    return value
+
+def _finish(cpu: CPU, tracer: Tracer, profiler: Profiler | None, profile: str | None) -> int | None:
+    tracer.dump()
+
+    if profiler is not None:
+        profiler.write_pstats(f"{profile}.pstats")
+        profiler.write_collapsed(f"{profile}.folded")
+        profiler.print_report()
+
+    return cpu.exit_code
 
 if __name__ == "__main__":
-    filename = "calculator.zev"  # argv[1] will be the production assignment
-    compile(filename)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Assemble and run a 4bit .zev program")
+    parser.add_argument("filename", nargs="?", default="calculator.zev")
+    parser.add_argument("--trace", choices=TRACE_LEVELS, default="off", help="trace nothing, one summary per run, or every executed instruction")
+    parser.add_argument("--profile", metavar="PREFIX", help="profile the run, writing PREFIX.pstats and PREFIX.folded")
+    parser.add_argument("--snapshot", metavar="FILE", help="save the machine to FILE once the program is loaded")
+    parser.add_argument("--checkpoint", type=_positive_int, metavar="CYCLES", help="with --snapshot or --restore, save the machine to its file again every CYCLES cycles")
+    parser.add_argument("--restore", metavar="FILE", help="boot the machine saved in FILE and run it from there, instead of a source file")
+    args = parser.parse_args()
+    if args.checkpoint is not None and args.snapshot is None and args.restore is None:
+        parser.error("--checkpoint needs --snapshot or --restore to know where to save the machine")
+
+    trace_level = TRACE_LEVELS[args.trace]
+    if args.restore is not None:
+        exit(resume(args.restore, trace_level, profile=args.profile, checkpoint=args.checkpoint))
+    exit(compile(args.filename, trace_level, profile=args.profile, snapshot_file=args.snapshot, checkpoint=args.checkpoint))
\ No newline at end of file
@@ -1,5 +1,17 @@
 #import threading
-from typing import Any, Optional
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable, Optional
+
+from _image import Image
+from _jit import JIT
+from _profile import Profiler
+
+# opcode -> the name profiles show it under
+MNEMONICS = {1: "EXT", 2: "MOV", 3: "DEL", 4: "INS", 6: "OUT", 7: "ADD", 8: "SUB",
+             9: "MUL", 10: "DIV", 11: "CMP", 12: "JMP", 13: "JZ", 14: "JNZ"}
 
 class OutOfInstructionsError(Exception):
     def __init__(self, message: str):
@@ -17,21 +29,46 @@ class InvalidAddressError(Exception):
     def __init__(self, message: str):
         super().__init__(message)
 
+class DivisionByZeroError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
 
 
 class RAM:
-    def __init__(self):
+    def __init__(self, image: Optional[Image] = None):
+        """
+        :param image: a mapped program object, its instructions take up the first addresses and are read-only
+        """
         self.memory = {}
+        self.image = image
+        self.program_size = len(image) if image is not None else 0
+        self.jump_table = image.jump_table if image is not None else []
 
     def get(self, addr: str) -> Any:
+        if self.program_size and isinstance(addr, str) and addr[2:].isdigit():
+            n = int(addr[2:])
+            if 0 < n <= self.program_size:
+                return self.image.instruction(n)
         return self.memory.get(addr)
 
+    def fetch(self, n: int) -> Any:
+        """
+        Get the instruction at a numeric address without building the address string for program memory
+        """
+        if 0 < n <= self.program_size:
+            return self.image.instruction(n)
+        return self.memory.get(f"0x{n}")
+
     def insert(self, val: Any) -> str:
-        addr = f"0x{len(self.memory) + 1}"
+        addr = f"0x{self.program_size + len(self.memory) + 1}"
         self.memory[addr] = val
         return addr
 
     def delete(self, addr: str) -> None:
+        if addr not in self.memory:
+            error_msg = f"Cannot delete {addr} because it is not in writable memory"
+            raise InvalidAddressError(error_msg)
         del self.memory[addr]
 
     def dump(self):
@@ -40,8 +77,24 @@ class RAM:
 
 
 class CPU():
-    def __init__(self, ram: RAM) -> None:
+    def __init__(self, ram: RAM, word_bits: int = 8, output_format: str = "bin", output: Callable[[str], Any] = print, jit_threshold: Optional[int] = 2, profiler: Optional[Profiler] = None) -> None:
+        """
+        :param ram: the RAM holding the program
+        :param word_bits: how wide the ALU is, results wrap around (two's complement) past this
+        :param output_format: how OUT prints numbers, "bin" for binary strings or "dec" for decimal
+        :param output: what OUT sends its text to, prints to stdout by default
+        :param jit_threshold: how many times an address is reached before the code from there is compiled to Python, None interprets everything.
+                              Only programs loaded from an object get compiled
+        :param profiler: where to count and time executed instructions and RAM accesses, profiling is off when not given.
+                         Profiled programs are interpreted so every instruction gets counted, the JIT is off
+        """
         self.ram = ram
+        self.output = output
+
+        self.word_bits = word_bits
+        self.mask = (1 << word_bits) - 1
+        self.sign_bit = 1 << (word_bits - 1)
+        self.output_format = output_format
 
         self.reg1 = self.reg2 = self.reg3 = self.reg4 = self.reg5 = self.reg6 = self.reg7 = self.reg8 = self.reg9 = self.reg10 = self.reg11 = self.reg12 = self.reg13 = self.reg14 = self.reg15 = None
 
@@ -50,74 +103,50 @@ class CPU():
                      self.reg11, self.reg12, self.reg13, self.reg14, self.reg15]
 
         self.instruction_set = {
-            "1": lambda code=0: self.EXT(code),
-            "10": lambda sto_reg, imm=None, addr=None: self.MOV(sto_reg, imm, addr),
-            "11": lambda this_will_be_none_bc_pointer_stuff, addr: self.DEL(addr),
-            "100": lambda val_reg, sto_reg: self.INS(val_reg, sto_reg),
+            1: lambda code=0: self.EXT(code),
+            2: lambda sto_reg, imm=None, addr=None: self.MOV(sto_reg, imm, addr),
+            3: lambda this_will_be_none_bc_pointer_stuff, addr: self.DEL(addr),
+            4: lambda val_reg, sto_reg: self.INS(val_reg, sto_reg),
             # skip 5 because thats PTR
-            "110": lambda reg: self.OUT(reg)
+            6: lambda reg: self.OUT(reg),
+            7: lambda first_reg, second_reg, sto_reg: self.ADD(first_reg, second_reg, sto_reg),
+            8: lambda first_reg, second_reg, sto_reg: self.SUB(first_reg, second_reg, sto_reg),
+            9: lambda first_reg, second_reg, sto_reg: self.MUL(first_reg, second_reg, sto_reg),
+            10: lambda first_reg, second_reg, sto_reg: self.DIV(first_reg, second_reg, sto_reg),
+            11: lambda first_reg, second_reg: self.CMP(first_reg, second_reg),
+            12: lambda jump: self.JMP(jump),
+            13: lambda jump: self.JZ(jump),
+            14: lambda jump: self.JNZ(jump)
         }
 
         self.cycle = 0
+        self.pc = 1
+        self.zero = False # set by CMP, read by JZ/JNZ
+
+        self.halted = False
+        self.exit_code = None
 
-        self._cycle()
-
-    def _add_two_binary(self, n1: str, n2: str) -> str:
-        maxlen = max(len(n1), len(n2))
-        n1 = n1.zfill(maxlen)
-        n2 = n2.zfill(maxlen)
-
-        added = []
-        carry = 0
-        for i in range(maxlen - 1, -1, -1):
-            total = int(n1[i]) + int(n2[i]) + carry
-            added.append(str(total % 2))
-            carry = total // 2
-
-        if carry:
-            added.append("1")
-
-
-        return "".join(reversed(added)).lstrip("0") or "0"
-
-    def _sub_two_binary(self, n1: str, n2: str) -> str:
-        # 0) Helper to compare magnitudes
-        def is_smaller(a: str, b: str) -> bool:
-            a = a.lstrip('0') or '0'
-            b = b.lstrip('0') or '0'
-            if len(a) != len(b):
-                return len(a) < len(b)
-            return a < b
-
-        # 1) Handle negativity by swapping if needed
-        negative = False
-        if is_smaller(n1, n2):
-            n1, n2 = n2, n1
-            negative = True
-
-        # 2) Pad to equal length
-        maxlen = max(len(n1), len(n2))
-        n1 = n1.zfill(maxlen)
-        n2 = n2.zfill(maxlen)
-
-        result = []
-        borrow = 0
-
-        # 3) Subtract bit-by-bit, LSB→MSB
-        for i in range(maxlen - 1, -1, -1):
-            b1 = int(n1[i])
-            b2 = int(n2[i])
-            diff = b1 - (b2 + borrow)
-            if diff < 0:
-                diff += 2
-                borrow = 1
-            else:
-                borrow = 0
-            result.append(str(diff))
-
-        # 4) Assemble, strip leading zeros, handle zero result
-        res_str = ''.join(reversed(result)).lstrip('0') or '0'
-        return ('-' + res_str) if negative else res_str
+        self.profiler = profiler
+
+        self.jit = None
+        if jit_threshold is not None and ram.image is not None and profiler is None:
+            namespace = {
+                "InvalidRegisterError": InvalidRegisterError,
+                "InvalidAddressError": InvalidAddressError,
+                "DivisionByZeroError": DivisionByZeroError,
+            }
+            self.jit = JIT(ram.image, word_bits, len(self.regs), namespace, jit_threshold)
+
+    def _wrap(self, num: int) -> int:
+        return ((num + self.sign_bit) & self.mask) - self.sign_bit
+
+    def _format(self, val: Any) -> str:
+        if not isinstance(val, int):
+            return val # pointers are stored as address strings
+
+        if self.output_format == "bin":
+            return format(val, "b")
+        return str(val)
 
     def _validate_regs(self, regs: list):
         for i in range(len(regs)):
@@ -125,17 +154,62 @@ class CPU():
                 error_msg = f"Invalid register assignment on line {self.cycle}"
                 raise InvalidRegisterError(error_msg)
 
-    def _cycle(self):
-        self.cycle += 1
-        self._get_next_instruction()
+    def run(self, max_cycles: Optional[int] = None) -> Optional[int]:
+        """
+        Run the program until it exits or the cycle budget is used up
+
+        :param max_cycles: how many cycles to run for before returning, None means no limit
+        :return: the exit code if the program exited, None if it ran out of cycles first
+        """
+        last_cycle = None if max_cycles is None else self.cycle + max_cycles
+        jit = self.jit
+
+        if self.profiler is not None:
+            self._run_profiled(last_cycle)
+            return self.exit_code
+
+        while not self.halted:
+            if last_cycle is not None and self.cycle >= last_cycle:
+                break
+
+            if jit is not None:
+                block = jit.block(self.pc)
+                # blocks run to completion, so near the end of the budget fall back to single steps
+                if block is not None and (last_cycle is None or last_cycle - self.cycle >= block.length):
+                    block(self)
+                    continue
+
+            self.cycle += 1
+            self._get_next_instruction()
+            self.execute()
+
+        return self.exit_code
+
+    def _run_profiled(self, last_cycle: Optional[int]) -> None:
+        # the interpreter loop of run, timing every instruction
+        profiler = self.profiler
+        clock = time.perf_counter
+
+        while not self.halted:
+            if last_cycle is not None and self.cycle >= last_cycle:
+                break
+
+            self.cycle += 1
+            pc = self.pc
+            self._get_next_instruction()
+            profiler.ram_reads += 1 # a fetch
+
+            op = self.current_instruction[0]
+            start = clock()
+            self.execute()
+            profiler.record(pc, MNEMONICS.get(op, op), clock() - start)
 
     def _get_next_instruction(self):
-        addr = f"0x{self.cycle}"
-        self.current_instruction = self.ram.get(addr=addr)
+        self.current_instruction = self.ram.fetch(self.pc)
         if self.current_instruction is None:
             error_msg = "Program ran out of instructions"
             raise OutOfInstructionsError(error_msg)
-        self.execute()
+        self.pc += 1
 
     def execute(self):
         cur_instr = self.current_instruction
@@ -145,28 +219,27 @@ class CPU():
             error_msg = f"Invalid instruction on line {self.cycle}"
             raise InvalidInstructionError(error_msg)
 
-    def EXT(self, code: str):
-        code = int(code, 2)
-
-        exit(code)
-
-    def MOV(self, sto_reg: str, imm: str, addr: str | list):
-        sto_reg = int(sto_reg, 2)
+    def EXT(self, code: int):
+        self.exit_code = code
+        self.halted = True
 
+    def MOV(self, sto_reg: int, imm: int | None, addr: list | None):
         regs = self.regs
 
         self._validate_regs([sto_reg])
 
         if imm is not None:
-            regs[sto_reg] = imm
+            regs[sto_reg] = self._wrap(imm)
         else:
-            ptr_reg = int(addr[1], 2)
+            ptr_reg = addr[1]
 
             if ptr_reg < 0 or ptr_reg > len(regs):
                 error_msg = f"Invalid register assignment on line {self.cycle}"
                 raise InvalidRegisterError(error_msg)
 
             addr = regs[ptr_reg]
+            if self.profiler is not None:
+                self.profiler.ram_reads += 1
             num = self.ram.get(addr)
             if num is None:
                 error_msg = f"Invalid RAM address on line {self.cycle}"
@@ -175,23 +248,18 @@ class CPU():
 
         self.regs = regs
 
-        self._cycle()
-
     def DEL(self, addr: list):
-        reg = int(addr[1], 2)
+        reg = addr[1]
 
         self._validate_regs([reg])
 
         addr = self.regs[reg]
 
         self.ram.delete(addr=addr)
+        if self.profiler is not None:
+            self.profiler.ram_write(addr)
 
-        self._cycle()
-
-    def INS(self, val_reg: str, sto_reg: str) -> str:
-        val_reg = int(val_reg, 2)
-        sto_reg = int(sto_reg, 2)
-
+    def INS(self, val_reg: int, sto_reg: int) -> str:
         regs = self.regs
 
         self._validate_regs([val_reg, sto_reg])
@@ -199,33 +267,22 @@ class CPU():
         val = regs[val_reg]
 
         addr = self.ram.insert(val=val)
+        if self.profiler is not None:
+            self.profiler.ram_write(addr)
         regs[sto_reg] = addr
 
         self.regs = regs
 
-        self._cycle()
-
-
-    def OUT(self, reg: str):
-        reg = int(reg, 2)
-
+    def OUT(self, reg: int):
         self._validate_regs([reg])
 
-        print(self.regs[reg])
-
-        self._cycle()
-
-    def ADD(self, first_reg: str, second_reg: str, sto_reg: str):
-        first_reg = int(first_reg, 2)
-        second_reg = int(second_reg, 2)
-        sto_reg = int(sto_reg, 2)
-
-        regs = self.regs
+        self.output(self._format(self.regs[reg]))
 
+    def _alu_operands(self, first_reg: int, second_reg: int, sto_reg: int) -> tuple[int, int, int]:
         self._validate_regs([first_reg, second_reg, sto_reg])
 
-        num1 = regs[first_reg]
-        num2 = regs[second_reg]
+        num1 = self.regs[first_reg]
+        num2 = self.regs[second_reg]
 
         if num1 is None:
             error_msg = f"Empty register assignment on line {self.cycle}"
@@ -234,35 +291,96 @@ class CPU():
             error_msg = f"Empty register assignment on line {self.cycle}"
             raise InvalidRegisterError(error_msg)
 
-        result = self._add_two_binary(num1, num2)
-        regs[sto_reg] = result
+        return num1, num2, sto_reg
 
-        self.regs = regs
+    def ADD(self, first_reg: int, second_reg: int, sto_reg: int):
+        num1, num2, sto_reg = self._alu_operands(first_reg, second_reg, sto_reg)
 
-        self._cycle()
+        self.regs[sto_reg] = self._wrap(num1 + num2)
 
-    def SUB(self, first_reg: str, second_reg: str, sto_reg: str):
-        first_reg = int(first_reg, 2)
-        second_reg = int(second_reg, 2)
-        sto_reg = int(sto_reg, 2)
+    def SUB(self, first_reg: int, second_reg: int, sto_reg: int):
+        num1, num2, sto_reg = self._alu_operands(first_reg, second_reg, sto_reg)
 
-        regs = self.regs
+        self.regs[sto_reg] = self._wrap(num1 - num2)
 
-        self._validate_regs([first_reg, second_reg, sto_reg])
+    def MUL(self, first_reg: int, second_reg: int, sto_reg: int):
+        num1, num2, sto_reg = self._alu_operands(first_reg, second_reg, sto_reg)
 
-        num1 = regs[first_reg]
-        num2 = regs[second_reg]
+        self.regs[sto_reg] = self._wrap(num1 * num2)
 
-        if num1 is None:
-            error_msg = f"Empty register assignment on line {self.cycle}"
-            raise InvalidRegisterError(error_msg)
-        if num2 is None:
+    def DIV(self, first_reg: int, second_reg: int, sto_reg: int):
+        num1, num2, sto_reg = self._alu_operands(first_reg, second_reg, sto_reg)
+
+        if num2 == 0:
+            error_msg = f"Division by zero on line {self.cycle}"
+            raise DivisionByZeroError(error_msg)
+
+        # truncate toward zero, floor division would round negative quotients down
+        quotient = abs(num1) // abs(num2)
+        if (num1 < 0) != (num2 < 0):
+            quotient = -quotient
+        self.regs[sto_reg] = self._wrap(quotient)
+
+    def CMP(self, first_reg: int, second_reg: int):
+        self._validate_regs([first_reg, second_reg])
+
+        num1 = self.regs[first_reg]
+        num2 = self.regs[second_reg]
+
+        if num1 is None or num2 is None:
             error_msg = f"Empty register assignment on line {self.cycle}"
             raise InvalidRegisterError(error_msg)
 
-        result = self._sub_two_binary(num1, num2)
-        regs[sto_reg] = result
+        self.zero = num1 == num2
 
-        self.regs = regs
+    def _jump_target(self, jump: int) -> int:
+        if jump >= len(self.ram.jump_table):
+            error_msg = f"Invalid jump on line {self.cycle}"
+            raise InvalidAddressError(error_msg)
+
+        return self.ram.jump_table[jump]
+
+    def JMP(self, jump: int):
+        self.pc = self._jump_target(jump)
+
+    def JZ(self, jump: int):
+        target = self._jump_target(jump)
+        if self.zero:
+            self.pc = target
+
+    def JNZ(self, jump: int):
+        target = self._jump_target(jump)
+        if not self.zero:
+            self.pc = target
+
+
+def run_profiled(filename: str, profile: str, **cpu_options) -> Optional[int]:
+    """
+    Run an object under the profiler, writing {profile}.pstats and {profile}.folded and printing a report to stderr
+
+    :param filename: the .zvo object
+    :param profile: where to write the profile, without an extension
+    :param cpu_options: passed on to CPU
+    :return: the program's exit code
+    """
+    profiler = Profiler(os.path.basename(filename))
+    cpu = CPU(RAM(Image(filename)), profiler=profiler, **cpu_options)
+    exit_code = cpu.run()
+
+    profiler.write_pstats(f"{profile}.pstats")
+    profiler.write_collapsed(f"{profile}.folded")
+    profiler.print_report(file=sys.stderr)
+    return exit_code
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a ZVM object")
+    parser.add_argument("filename")
+    parser.add_argument("--profile", metavar="PREFIX", help="profile the run, writing PREFIX.pstats and PREFIX.folded")
+    args = parser.parse_args()
+
+    if args.profile is not None:
+        exit(run_profiled(args.filename, args.profile))
 
-        self._cycle()
\ No newline at end of file
+    ram = RAM(Image(args.filename))
+    cpu = CPU(ram)
+    exit(cpu.run())
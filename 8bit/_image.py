@@ -0,0 +1,169 @@
+import hashlib
+import mmap
+import shutil
+import struct
+import tempfile
+from typing import Iterable
+
+# layout of a compiled .zvo object:
+#   header | instruction stream (one fixed-size record per instruction) | operand table | jump table
+MAGIC = b"ZEVO"
+VERSION = 3
+
+HEADER = struct.Struct("<4sHHIII32s") # magic, version, reserved, instruction count, operand count, jump count, digest
+INSTRUCTION = struct.Struct("<BBI") # opcode, operand count, index of the first operand in the operand table
+OPERAND = struct.Struct("<Bq") # kind, value
+JUMP = struct.Struct("<I") # the address a jump index leads to, unpacked as "<{count}I" when loading
+
+KIND_NONE = 0 # a skipped operand, like the missing immediate of a pointer MOV
+KIND_INT = 1 # a register index, immediate or address
+KIND_PTR = 2 # a pointer through a register (*reg)
+
+PTR_OPCODE = 5 # marks a pointer operand in decoded instructions, [PTR_OPCODE, register]
+
+class InvalidImageError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+def _encode_operand(operand) -> bytes:
+    if operand is None:
+        return OPERAND.pack(KIND_NONE, 0)
+    if isinstance(operand, list): # ["101", reg]
+        return OPERAND.pack(KIND_PTR, int(operand[1], 2))
+    return OPERAND.pack(KIND_INT, int(operand, 2))
+
+class ImageWriter:
+    def __init__(self, filename: str, jump_table: list[int] | None = None) -> None:
+        """
+        Stream instructions into a binary object without holding the program in memory
+
+        Instruction records go straight to the file, the operand table is spooled to a temporary file
+        and appended when the writer is closed, followed by the jump table.
+        The header gets a sha256 digest of the program, so loading it never has to hash the whole object
+
+        :param filename: where to write the object
+        :param jump_table: the address every jump index leads to, only read on close so it can be filled in while writing
+        """
+        self.file = open(filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0, b"")) # the counts and digest get filled in by close()
+        self.operands = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+        self.digest = hashlib.sha256()
+
+        self.jump_table = jump_table if jump_table is not None else []
+
+        self.instruction_count = 0
+        self.operand_count = 0
+
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, instr: list) -> None:
+        """
+        :param instr: one instruction produced by the assembler
+        """
+        record = INSTRUCTION.pack(int(instr[0], 2), len(instr) - 1, self.operand_count)
+        self.file.write(record)
+        self.digest.update(record)
+        for operand in instr[1:]:
+            encoded = _encode_operand(operand)
+            self.operands.write(encoded)
+            self.digest.update(encoded)
+
+        self.instruction_count += 1
+        self.operand_count += len(instr) - 1
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        self.operands.seek(0)
+        shutil.copyfileobj(self.operands, self.file)
+        self.operands.close()
+
+        for target in self.jump_table:
+            jump = JUMP.pack(target or 0)
+            self.file.write(jump)
+            self.digest.update(jump)
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, self.instruction_count, self.operand_count, len(self.jump_table), self.digest.digest()))
+        self.file.close()
+
+def write_image(machine_code: Iterable[list], filename: str, jump_table: list[int] | None = None) -> None:
+    """
+    Write assembled machine code as a binary object
+
+    :param machine_code: the instructions produced by the assembler, any iterable
+    :param filename: where to write the object
+    :param jump_table: the address every jump index leads to, see ImageWriter
+    """
+    with ImageWriter(filename, jump_table) as writer:
+        for instr in machine_code:
+            writer.add(instr)
+
+class Image:
+    def __init__(self, filename: str) -> None:
+        """
+        Map a binary object into memory, instructions are decoded straight out of the map when they are fetched
+
+        :param filename: the .zvo object to load
+        """
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        if len(self.map) < HEADER.size:
+            error_msg = f"{filename} is too small to be a ZVM object"
+            raise InvalidImageError(error_msg)
+
+        magic, version, _, self.instruction_count, self.operand_count, jump_count, self.digest = HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC:
+            error_msg = f"{filename} is not a ZVM object"
+            raise InvalidImageError(error_msg)
+        if version != VERSION:
+            error_msg = f"{filename} is a version {version} object, this ZVM loads version {VERSION}"
+            raise InvalidImageError(error_msg)
+
+        self.instructions_offset = HEADER.size
+        self.operands_offset = self.instructions_offset + self.instruction_count * INSTRUCTION.size
+        self.jumps_offset = self.operands_offset + self.operand_count * OPERAND.size
+
+        if len(self.map) < self.jumps_offset + jump_count * JUMP.size:
+            error_msg = f"{filename} is truncated"
+            raise InvalidImageError(error_msg)
+
+        # small enough to keep unpacked, a jump then costs one list index
+        self.jump_table = list(struct.unpack_from(f"<{jump_count}I", self.view, self.jumps_offset))
+
+    def __len__(self):
+        return self.instruction_count
+
+    def instruction(self, n: int) -> list:
+        """
+        Decode one instruction into the form the ZVM executes
+
+        :param n: the 1-based index of the instruction
+        :return: the opcode followed by its operands, as ints
+        """
+        opcode, count, first = INSTRUCTION.unpack_from(self.view, self.instructions_offset + (n - 1) * INSTRUCTION.size)
+
+        instr = [opcode]
+        offset = self.operands_offset + first * OPERAND.size
+        for _ in range(count):
+            kind, value = OPERAND.unpack_from(self.view, offset)
+            offset += OPERAND.size
+
+            if kind == KIND_NONE:
+                instr.append(None)
+            elif kind == KIND_PTR:
+                instr.append([PTR_OPCODE, value])
+            else:
+                instr.append(value)
+
+        return instr
+
+    def close(self) -> None:
+        self.view.release()
+        self.map.close()
@@ -0,0 +1,243 @@
+from _image import Image
+
+MAX_BLOCK = 256 # longest run of instructions compiled into one function
+JUMP_CONDITIONS = {12: None, 13: "zero", 14: "not zero"} # JMP, JZ, JNZ
+UNTRANSLATED = object()
+
+# (program hash, word width) -> ({entry address: block function, or None when nothing there can be translated}, {address: visits})
+# shared by every CPU in the process, so running the same program again starts out with its blocks compiled
+_programs = {}
+
+def program_hash(image: Image) -> str:
+    return image.digest.hex() # written into the object by the linker, so starting a CPU doesn't hash the program
+
+class JIT:
+    def __init__(self, image: Image, word_bits: int, register_count: int, namespace: dict, threshold: int = 2) -> None:
+        """
+        Translate straight-line runs of ZVM instructions into Python functions that keep registers in local variables
+
+        A block function takes the CPU, runs every instruction in the block, writes the registers back and
+        leaves cycle/pc where the interpreter would have. A jump ends its block, its target is looked up in the
+        jump table at translation time. Anything the translator can't handle is left to the interpreter
+
+        :param image: the program being run, blocks are cached by its hash
+        :param word_bits: the ALU width baked into the generated arithmetic
+        :param register_count: how many registers the CPU has
+        :param namespace: the error classes the generated code raises
+        :param threshold: how many times an address has to be reached before it gets translated
+        """
+        self.image = image
+        self.word_bits = word_bits
+        self.mask = (1 << word_bits) - 1
+        self.sign_bit = 1 << (word_bits - 1)
+        self.register_count = register_count
+        self.namespace = namespace
+        self.threshold = threshold
+
+        self.blocks, self.visits = _programs.setdefault((program_hash(image), word_bits), ({}, {}))
+
+    def block(self, pc: int):
+        """
+        Get the compiled block starting at an address, translating it once the address is hot
+
+        :param pc: the address of the first instruction
+        :return: the block function, or None to interpret the instruction instead
+        """
+        block = self.blocks.get(pc, UNTRANSLATED)
+        if block is not UNTRANSLATED:
+            return block
+
+        visits = self.visits.get(pc, 0) + 1
+        self.visits[pc] = visits
+        if visits < self.threshold:
+            return None
+
+        block = self.translate(pc)
+        self.blocks[pc] = block
+        return block
+
+    def _wrap(self, expression: str) -> str:
+        return f"((({expression}) + {self.sign_bit}) & {self.mask}) - {self.sign_bit}"
+
+    def _reg(self, operand) -> int | None:
+        if not isinstance(operand, int):
+            return None
+        return operand if 0 <= operand < self.register_count else None
+
+    def _translate_instruction(self, instr: list, k: int, known: set, used: set, written: set) -> list[str] | None:
+        # returns the lines for one instruction, or None if the instruction has to be interpreted
+        # k is the instruction's 1-based position in the block, known holds registers that surely hold ints
+        opcode, operands = instr[0], instr[1:]
+        line = f"{{cycle + {k}}}"
+
+        def empty_check(reg: int) -> list[str]:
+            if reg in known:
+                return []
+            return [f"if r{reg} is None:",
+                    f"    raise InvalidRegisterError(f\"Empty register assignment on line {line}\")"]
+
+        if opcode == 2 and len(operands) >= 2:
+            sto = self._reg(operands[0])
+            if sto is None:
+                return None
+            used.add(sto)
+            written.add(sto)
+
+            if operands[1] is not None:
+                known.add(sto)
+                return [f"r{sto} = {((operands[1] + self.sign_bit) & self.mask) - self.sign_bit}"]
+
+            if len(operands) < 3 or not isinstance(operands[2], list):
+                return None
+            ptr = self._reg(operands[2][1])
+            if ptr is None:
+                return None
+            used.add(ptr)
+            known.discard(sto)
+            return [f"value = ram.get(r{ptr})",
+                    "if value is None:",
+                    f"    raise InvalidAddressError(f\"Invalid RAM address on line {line}\")",
+                    f"r{sto} = value"]
+
+        if opcode == 3 and len(operands) == 2 and isinstance(operands[1], list):
+            reg = self._reg(operands[1][1])
+            if reg is None:
+                return None
+            used.add(reg)
+            return [f"ram.delete(addr=r{reg})"]
+
+        if opcode == 4 and len(operands) == 2:
+            val, sto = self._reg(operands[0]), self._reg(operands[1])
+            if val is None or sto is None:
+                return None
+            used.update((val, sto))
+            written.add(sto)
+            known.discard(sto)
+            return [f"r{sto} = ram.insert(val=r{val})"]
+
+        if opcode == 6 and len(operands) == 1:
+            reg = self._reg(operands[0])
+            if reg is None:
+                return None
+            used.add(reg)
+            return [f"output(fmt(r{reg}))"]
+
+        if opcode in (7, 8, 9, 10) and len(operands) == 3:
+            first, second, sto = (self._reg(operand) for operand in operands)
+            if first is None or second is None or sto is None:
+                return None
+            used.update((first, second, sto))
+            written.add(sto)
+
+            lines = empty_check(first) + empty_check(second)
+            if opcode == 10:
+                lines += [f"if r{second} == 0:",
+                          f"    raise DivisionByZeroError(f\"Division by zero on line {line}\")",
+                          f"quotient = abs(r{first}) // abs(r{second})",
+                          f"if (r{first} < 0) != (r{second} < 0):",
+                          "    quotient = -quotient",
+                          f"r{sto} = {self._wrap('quotient')}"]
+            else:
+                symbol = {7: "+", 8: "-", 9: "*"}[opcode]
+                lines.append(f"r{sto} = {self._wrap(f'r{first} {symbol} r{second}')}")
+            known.add(sto)
+            return lines
+
+        if opcode == 11 and len(operands) == 2:
+            first, second = (self._reg(operand) for operand in operands)
+            if first is None or second is None:
+                return None
+            used.update((first, second))
+
+            return empty_check(first) + empty_check(second) + [f"zero = r{first} == r{second}"]
+
+        if opcode == 1 and len(operands) <= 1:
+            code = operands[0] if operands else 0
+            if not isinstance(code, int):
+                return None
+            return ["cpu.halted = True",
+                    f"cpu.exit_code = {code}"]
+
+        return None
+
+    def translate(self, pc: int):
+        """
+        Compile the run of instructions starting at an address into one function
+
+        :param pc: the address of the first instruction
+        :return: the block function, or None if the first instruction can't be translated
+        """
+        body = []
+        known, used, written = set(), set(), set()
+        length = 0
+        next_pc = f"{pc} + done"
+        uses_zero = sets_zero = False
+
+        n = pc
+        while n <= len(self.image) and length < MAX_BLOCK:
+            instr = self.image.instruction(n)
+
+            if instr[0] in JUMP_CONDITIONS: # a jump ends the block, the interpreter handles malformed ones
+                if len(instr) != 2 or not isinstance(instr[1], int) or instr[1] >= len(self.image.jump_table):
+                    break
+                target = self.image.jump_table[instr[1]]
+                condition = JUMP_CONDITIONS[instr[0]]
+
+                length += 1
+                body.append(f"done = {length}")
+                if condition is None:
+                    next_pc = str(target)
+                else:
+                    next_pc = f"{target} if {condition} else {n + 1}"
+                    uses_zero = True
+                break
+
+            lines = self._translate_instruction(instr, length + 1, known, used, written)
+            if lines is None:
+                break
+
+            length += 1
+            body += lines
+            body.append(f"done = {length}")
+            n += 1
+
+            if instr[0] == 11:
+                sets_zero = True
+            if instr[0] == 1: # EXT ends the block
+                break
+
+        if length == 0:
+            return None
+
+        load = [f"r{reg} = regs[{reg}]" for reg in sorted(used)]
+        store = [f"regs[{reg}] = r{reg}" for reg in sorted(written)]
+        if uses_zero or sets_zero:
+            load.append("zero = cpu.zero")
+        if sets_zero:
+            store.append("cpu.zero = zero")
+
+        source = [f"def block_{pc}(cpu):",
+                  "    regs = cpu.regs",
+                  "    ram = cpu.ram",
+                  "    output = cpu.output",
+                  "    fmt = cpu._format",
+                  "    cycle = cpu.cycle",
+                  "    done = 0"]
+        source += ["    " + line for line in load]
+        source.append("    try:")
+        source += ["        " + line for line in body]
+        source.append("    except BaseException:")
+        source += ["        " + line for line in store]
+        source += ["        cpu.cycle = cycle + done + 1",
+                   f"        cpu.pc = {pc} + done + 1",
+                   "        raise"]
+        source += ["    " + line for line in store]
+        source += ["    cpu.cycle = cycle + done",
+                   f"    cpu.pc = {next_pc}"]
+
+        namespace = dict(self.namespace)
+        exec(compile("\n".join(source), f"<zvm block @0x{pc}>", "exec"), namespace)
+
+        block = namespace[f"block_{pc}"]
+        block.length = length
+        return block
@@ -1,14 +1,13 @@
-def link(machine_code: list[list[str]], filename: str) -> None:
-    with open("./zvm.py", "r") as zvm:
-        lines = zvm.readlines()
+from typing import Iterable
 
-    lines.append("\n\n")
-    lines.append("if __name__ == \"__main__\":\n")
-    lines.append("    ram = RAM()\n")
-    for instr in machine_code:
-        lines.append(f"    ram.insert(val={instr})\n")
+from _image import write_image
 
-    lines.append("    cpu = CPU(ram)")
+def link(machine_code: Iterable[list], filename: str, jump_table: list[int] | None = None) -> None:
+    """
+    Link assembled machine code into a binary object that ZVM maps and runs
 
-    with open(filename, "w") as test:
-        test.writelines(lines)
+    :param machine_code: the instructions produced by the assembler, streamed into the object as they come
+    :param filename: where to write the object
+    :param jump_table: the address every jump index leads to, the assembler fills it in while machine_code is consumed
+    """
+    write_image(machine_code, filename, jump_table)
@@ -0,0 +1,102 @@
+import marshal
+import sys
+from typing import TextIO
+
+class Profiler:
+    def __init__(self, program: str = "program") -> None:
+        """
+        Count how often every instruction address and opcode runs and how long it takes, plus the ZVM's RAM reads and writes
+
+        Counted the same way as the 4bit toolchain's profiler: ram_reads is every instruction fetch plus every read of data
+        an instruction makes, ram_writes is every write to RAM while the profiler is attached, loading the program isn't one
+
+        Profiles can be written for pstats (python -m pstats, snakeviz) or as collapsed stacks for flamegraph tools
+
+        :param program: the name of the profiled program, shown as the file in pstats and the root of every stack
+        """
+        self.program = program
+        self.addresses: dict[tuple[int, str], list] = {} # (pc, opcode) -> [count, seconds]
+        self.ram_reads = 0
+        self.ram_writes = 0
+
+    def __str__(self):
+        return f"Profiler for {self.program}: {self.instructions()} instructions at {len(self.addresses)} addresses, {self.ram_reads} RAM reads, {self.ram_writes} RAM writes"
+    def __repr__(self):
+        return self.__str__()
+
+    def record(self, pc: int, op: str, seconds: float) -> None:
+        entry = self.addresses.get((pc, op))
+        if entry is None:
+            entry = self.addresses[(pc, op)] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def ram_write(self, addr: int) -> None:
+        """
+        Count a write, called by the ZVM
+        """
+        self.ram_writes += 1
+
+    def clear(self) -> None:
+        self.addresses.clear()
+        self.ram_reads = 0
+        self.ram_writes = 0
+
+    def instructions(self) -> int:
+        return sum(count for count, _ in self.addresses.values())
+
+    def opcodes(self) -> dict[str, tuple[int, float]]:
+        """
+        :return: opcode -> (count, seconds), summed over every address
+        """
+        totals = {}
+        for (_, op), (count, seconds) in self.addresses.items():
+            total = totals.get(op, (0, 0.0))
+            totals[op] = (total[0] + count, total[1] + seconds)
+        return totals
+
+    def report(self, top: int = 10) -> str:
+        """
+        :param top: how many of the hottest addresses to list
+        :return: a table of every opcode and the addresses that took the most time
+        """
+        total = sum(seconds for _, seconds in self.addresses.values()) or 1
+        lines = [str(self), f"{'opcode':<8}{'count':>12}{'seconds':>12}{'ns/op':>10}{'time':>8}"]
+        for op, (count, seconds) in sorted(self.opcodes().items(), key=lambda item: -item[1][1]):
+            lines.append(f"{op:<8}{count:>12}{seconds:>12.6f}{seconds / count * 1e9:>10.0f}{seconds / total:>8.1%}")
+
+        lines.append(f"{'address':<8}{'opcode':>12}{'count':>12}{'seconds':>10}{'time':>8}")
+        hottest = sorted(self.addresses.items(), key=lambda item: -item[1][1])[:top]
+        for (pc, op), (count, seconds) in hottest:
+            lines.append(f"{pc:<8}{op:>12}{count:>12}{seconds:>10.6f}{seconds / total:>8.1%}")
+        return "\n".join(lines)
+
+    def print_report(self, top: int = 10, file: TextIO = sys.stderr) -> None:
+        print(self.report(top), file=file)
+
+    def write_pstats(self, filename: str) -> None:
+        """
+        Write the profile in the format pstats.Stats loads, every address shows up as a function
+        named after its opcode, with the program as its file and the address as its line number
+
+        :param filename: where to write the profile
+        """
+        stats = {}
+        for (pc, op), (count, seconds) in self.addresses.items():
+            # (primitive calls, calls, own time, cumulative time, callers)
+            stats[(self.program, pc, op)] = (count, count, seconds, seconds, {})
+        with open(filename, "wb") as f:
+            marshal.dump(stats, f)
+
+    def write_collapsed(self, filename: str, weight: str = "time") -> None:
+        """
+        Write the profile as collapsed stacks, one "program;opcode;@address value" line per address,
+        the input format of flamegraph.pl, inferno and speedscope
+
+        :param filename: where to write the stacks
+        :param weight: "time" to weigh every stack by its nanoseconds, "count" by how many times it ran
+        """
+        with open(filename, "w") as f:
+            for (pc, op), (count, seconds) in sorted(self.addresses.items()):
+                value = count if weight == "count" else round(seconds * 1e9)
+                f.write(f"{self.program};{op};@{pc} {value}\n")
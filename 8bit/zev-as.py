@@ -1,35 +1,63 @@
+import argparse
+import filecmp
+import hashlib
+import os
+import shutil
+from typing import Iterable, Iterator
+
+from _image import VERSION as IMAGE_VERSION
 from _linker import link
 
+ASSEMBLER_VERSION = "2" # bump whenever the assembled output changes, so old cache entries are ignored
+CACHE_DIR = os.environ.get("ZEV_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "zev"))
+
 class SyntaxError(Exception):
     def __init__(self, message: str):
         super().__init__(message)
 
-def _get_tokens(lines: list[str]) -> list[list[str]]:
-    unproc_token_sets = []
-    proc_token_sets = []
-    for line in lines:
-        if "\\t" in line and "    " in line:
+def _get_tokens(lines: Iterable[str]) -> Iterator[tuple[int, list[str]]]:
+    """
+    Split source lines into tokens, one line at a time
+
+    :param lines: the source, any iterable of lines such as an open file
+    :return: (line number, tokens) for every line of code
+    """
+    for line_no, line in enumerate(lines, 1):
+        if line.startswith("#"): # filter out full-line comments
+            continue
+
+        if "\t" in line and "    " in line:
             # make sure that they user EITHER tabs OR spaces for each line, but one line can use tabs while another uses spaces
-            error_msg = f"Inconsistent use of tabs and spaces: [{line}] @ [line no.]: {lines.index(line) + 1}"
+            error_msg = f"Inconsistent use of tabs and spaces: [{line.rstrip()}] @ [line no.]: {line_no}"
             raise SyntaxError(error_msg)
         elif "    " in line:
-            if not line.startswith("#"): # filter out full-line comments
-                unproc_token_sets.append(line.removesuffix("\n").split("    "))
-        elif "\\t" in line:
-            if not line.startswith("#"):
-                unproc_token_sets.append(line.removesuffix("\n").split("\\t"))
-
-    for i in range(len(unproc_token_sets)):
-        proc_token_sets.append([])
-        for j in range(len(unproc_token_sets[i])):
-            if not unproc_token_sets[i][j].startswith("#"): # filter out after-code comments
-                proc_token_sets[i].append(unproc_token_sets[i][j])
-
-    return proc_token_sets
-
-def _create_machine_code_instructions(token_set: list[list[str]]) -> list[list[str]]:
-    machine_code_instructions = []
-
+            unproc_tokens = line.rstrip("\r\n").split("    ")
+        elif "\t" in line:
+            unproc_tokens = line.rstrip("\r\n").split("\t")
+        elif line.strip():
+            unproc_tokens = [line.strip()] # a label, or an instruction without operands
+        else:
+            continue
+
+        tokens = []
+        for token in unproc_tokens:
+            if token.startswith("#"): # filter out after-code comments, along with anything after them
+                break
+            tokens.append(token)
+
+        yield line_no, tokens
+
+def _create_machine_code_instructions(token_sets: Iterable[tuple[int, list[str]]], jump_table: list[int] | None = None) -> Iterator[list]:
+    """
+    Encode tokenized lines into machine code, one instruction at a time
+
+    A line holding only "name:" is a label for the instruction after it. Every label gets an index into the jump table
+    the first time it is defined or jumped to, so forward jumps are encoded without a second pass over the source
+
+    :param token_sets: the output of _get_tokens
+    :param jump_table: filled in with the address every jump index leads to, complete once every instruction has been generated
+    :return: one machine code instruction per line of code
+    """
     instruction_set = {
         "EXT": "1", # 1
         "MOV": "10", # 2
@@ -37,51 +65,135 @@ def _create_machine_code_instructions(token_set: list[list[str]]) -> list[list[s
         "INS": "100", # 4
         # skip 5 because thats PTR
         "OUT": "110", # 6
+        "ADD": "111", # 7
+        "SUB": "1000", # 8
+        "MUL": "1001", # 9
+        "DIV": "1010", # 10
+        "CMP": "1011", # 11
+        "JMP": "1100", # 12
+        "JZ": "1101", # 13
+        "JNZ": "1110", # 14
     }
+    jump_instructions = ("1100", "1101", "1110")
+
+    if jump_table is None:
+        jump_table = []
+    labels = {} # label -> jump index
+    first_jumps = {} # label -> line of the first jump to it, for reporting undefined labels
+    address = 0
+
+    def label_index(label: str) -> int:
+        if label not in labels:
+            labels[label] = len(jump_table)
+            jump_table.append(None)
+        return labels[label]
+
+    convert_imm = lambda imm: format(int(imm.removeprefix("$")), "b")
+    convert_reg = lambda reg: format(int(reg.removeprefix("reg")), "b")
+    convert_addr = lambda addr: format(int(addr.removeprefix("0x")), "b")
+
+    for line_no, tokens in token_sets:
+        if tokens and tokens[0].endswith(":"):
+            index = label_index(tokens[0].removesuffix(":"))
+            if jump_table[index] is not None:
+                error_msg = f"Label defined more than once: [{tokens[0]}] @ [line no.]: {line_no}"
+                raise SyntaxError(error_msg)
+            jump_table[index] = address + 1
+            continue
+
+        instruction = []
+        try:
+            for token in tokens:
+                if token in instruction_set:
+                    instruction.append(instruction_set[token])
+                    continue
+
+                if token and instruction and instruction[0] in jump_instructions:
+                    first_jumps.setdefault(token, line_no)
+                    instruction.append(format(label_index(token), "b"))
+                    continue
+
+                if token.startswith("reg"):
+                    instruction.append(convert_reg(token))
+                    continue
+
+                if token.startswith("*"):
+                    reg = convert_reg(token[1:]) # remove the *
+                    instruction.append(None) # so that there is no imm
+                    instruction.append(["101", reg])
+
+                if token.startswith("0x"):
+                    instruction.append(convert_addr(token))
+                    continue
+
+                if token.startswith("$"):
+                    instruction.append(convert_imm(token))
+                    continue
+        except ValueError:
+            error_msg = f"Invalid operand: [{token}] @ [line no.]: {line_no}"
+            raise SyntaxError(error_msg)
 
-    convert_imm = lambda imm: bin(int(imm.removeprefix("$")))[2:]
-    convert_reg = lambda reg: bin(int(reg.removeprefix("reg")))[2:]
-    convert_addr = lambda addr: bin(int(addr.removeprefix("0x")))[2:]
-
-    for tokens in token_set:
-        machine_code_instructions.append([])
-        for token in tokens:
-            if token in instruction_set:
-                machine_code_instructions[-1].append(instruction_set[token])
-                continue
-
-            if token.startswith("reg"):
-                machine_code_instructions[-1].append(convert_reg(token))
-                continue
-
-            if token.startswith("*"):
-                reg = convert_reg(token[1:]) # remove the *
-                machine_code_instructions[-1].append(None) # so that there is no imm
-                machine_code_instructions[-1].append(["101", reg])
-
-            if token.startswith("0x"):
-                machine_code_instructions[-1].append(convert_addr(token))
-                continue
-
-            if token.startswith("$"):
-                machine_code_instructions[-1].append(convert_imm(token))
-                continue
+        address += 1
+        yield instruction
 
-    return machine_code_instructions
+    for label, line_no in first_jumps.items():
+        if jump_table[labels[label]] is None:
+            error_msg = f"Jump to an undefined label: [{label}] @ [line no.]: {line_no}"
+            raise SyntaxError(error_msg)
 
-def compile(filename: str):
+def assemble(filename: str) -> tuple[list[list[str]], list[int]]:
+    jump_table = []
     with open(filename, "r") as f:
-        lines = f.readlines()
-
-    token_sets = _get_tokens(lines)
+        return list(_create_machine_code_instructions(_get_tokens(f), jump_table)), jump_table
+
+def _cache_path(filename: str) -> str:
+    digest = hashlib.sha256(f"{ASSEMBLER_VERSION}/{IMAGE_VERSION}".encode() + b"\0")
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return os.path.join(CACHE_DIR, f"{digest.hexdigest()}.zvo")
+
+def assemble_object(filename: str) -> str:
+    """
+    Assemble and link a source file into the compilation cache
+
+    The source is streamed through the assembler straight into the object, so memory use does not grow with program size.
+    Objects are cached by the hash of their source, an unchanged program skips assembling entirely
+
+    :param filename: the .zev source
+    :return: the path of the cached object
+    """
+    cache_path = _cache_path(filename)
+    if not os.path.exists(cache_path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        partial_path = f"{cache_path}.{os.getpid()}"
+        try:
+            jump_table = []
+            with open(filename, "r") as f:
+                link(_create_machine_code_instructions(_get_tokens(f), jump_table), partial_path, jump_table)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        os.replace(partial_path, cache_path) # never leave a half-written object for another process to read
+
+    return cache_path
 
-    machine_code_instructions = _create_machine_code_instructions(token_sets)
-
-    link(machine_code_instructions, f"{filename.split(".")[0]}.py")
+def compile(filename: str):
+    object_name = f"{filename.split('.')[0]}.zvo"
+    cache_path = assemble_object(filename)
+    if not os.path.exists(object_name) or not filecmp.cmp(cache_path, object_name, shallow=False):
+        shutil.copyfile(cache_path, object_name)
 
-    print(f"Compiled into object: {filename}.py\nTo execute, run \"python {filename}.py\"")
+    print(f"Compiled into object: {object_name}\nTo execute, run \"python ZVM.py {object_name}\"")
 
 if __name__ == "__main__":
-    #from sys import argv
-    filename = "calculator_2.zev" # argv[1]
-    compile(filename)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Assemble a .zev program into a ZVM object")
+    parser.add_argument("filename", nargs="?", default="calculator_2.zev")
+    parser.add_argument("--profile", metavar="PREFIX", help="run the object under the profiler once it is compiled, writing PREFIX.pstats and PREFIX.folded")
+    args = parser.parse_args()
+
+    compile(args.filename)
+    if args.profile is not None:
+        from ZVM import run_profiled
+        exit(run_profiled(f"{args.filename.split('.')[0]}.zvo", args.profile))
\ No newline at end of file
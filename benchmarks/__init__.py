@@ -0,0 +1,15 @@
+"""
+Benchmarks for the 4bit and 8bit toolchains
+
+Run a benchmark from the repository root with `python -m benchmarks.<name>`
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# both toolchains import their modules relative to their own directory
+for toolchain in ("4bit", "8bit"):
+    path = os.path.join(ROOT, toolchain)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,73 @@
+"""
+Measure how many cycles per second the 4bit CPU can run
+
+Usage: python -m benchmarks.cpu_cycles [instructions]
+"""
+import contextlib
+import os
+import time
+from sys import argv
+
+from zev_compiler import parse_into_instructions, create_half_byte_instructions
+from hardware.cpu.cpu import CPU
+from hardware.ram.ram import RAM
+from hardware.serial.serial_io import SerialIO
+
+CALCULATOR_BODY = [
+    "MOV    idx0    %9\n",
+    "OUT    idx0\n",
+    "MOV    idx1    %3\n",
+    "OUT    idx1\n",
+    "ADD    idx0    idx1    idx3\n",
+    "OUT    idx3\n",
+    "MOV    idx0    %6\n",
+    "DIV    idx3    idx0    idx1\n",
+    "OUT    idx1\n",
+]
+CALCULATOR_EXIT = "SYSCALL    EXIT    %0;\n"
+
+def calculator_program(instructions: int) -> list[str]:
+    """
+    Build a calculator.zev-style program by repeating its body
+
+    :param instructions: roughly how many instructions the program should have
+    :return: the source lines of the program
+    """
+    repeats = max(1, instructions // len(CALCULATOR_BODY))
+    return CALCULATOR_BODY * repeats + [CALCULATOR_EXIT]
+
+def load_program(lines: list[str]) -> RAM:
+    half_byte_instructions = create_half_byte_instructions(parse_into_instructions(lines))
+
+    stick = RAM("bench", 0, 1000000000)
+    stick.load(half_byte_instructions)
+
+    return stick
+
+def run(instructions: int) -> tuple[int, float, float]:
+    """
+    Run a scaled calculator program to completion
+
+    :param instructions: roughly how many instructions the program should have
+    :return: the number of cycles executed, how many seconds decoding took and how many seconds executing took
+    """
+    stick = load_program(calculator_program(instructions))
+    cpu = CPU("bench", 1, stick, SerialIO())
+
+    start = time.perf_counter()
+    cpu.predecode()
+    decode_time = time.perf_counter() - start
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        cpu.run()
+        run_time = time.perf_counter() - start
+
+    return cpu.cycle, decode_time, run_time
+
+if __name__ == "__main__":
+    instructions = int(argv[1]) if len(argv) > 1 else 100000
+
+    cycles, decode_time, run_time = run(instructions)
+    print(f"decoded in {decode_time:.3f}s")
+    print(f"{cycles} cycles in {run_time:.3f}s: {cycles / run_time:,.0f} cycles/s")
@@ -0,0 +1,100 @@
+"""
+Generate synthetic .zev programs of any size and opcode mix for both toolchains
+
+Usage: python -m benchmarks.generators 4bit|8bit [instructions] [iterations] [seed]
+"""
+import random
+from sys import argv
+
+DEFAULT_MIX = {"MOV": 3, "ADD": 3, "SUB": 2, "MUL": 1, "DIV": 1, "OUT": 1, "CMP": 1}
+MAX_IMMEDIATE = 255 # the body's MOVs draw their immediates from 0 up to this
+
+# register prefix, immediate prefix, how many registers the program works on, and how it exits
+SYNTAX = {
+    "4bit": ("idx", "%", 5, "SYSCALL    EXIT    %0;"),
+    "8bit": ("reg", "$", 12, "EXT    $0"),
+}
+
+def parse_mix(text: str) -> dict[str, int]:
+    """
+    :param text: an opcode mix written as "MOV=3,ADD=2,DIV=1"
+    :return: opcode -> weight
+    """
+    mix = {}
+    for item in text.split(","):
+        opcode, _, weight = item.partition("=")
+        mix[opcode.strip().upper()] = int(weight or 1)
+    return mix
+
+def generate(toolchain: str, instructions: int, mix: dict[str, int] | None = None, iterations: int = 1, seed: int = 0) -> list[str]:
+    """
+    Build a random program that is valid on a toolchain and always runs to completion
+
+    The body draws its opcodes from the mix and only reads registers that were set first, dividing only by a register
+    that always holds 1, so no program can fault. It is wrapped in a counted loop, which scales how long the program
+    runs without changing how much there is to assemble
+
+    :param toolchain: "4bit" or "8bit"
+    :param instructions: how many instructions the loop body has
+    :param mix: opcode -> relative weight, out of MOV, ADD, SUB, MUL, DIV, OUT and CMP, default is DEFAULT_MIX
+    :param iterations: how many times the body runs, at least 1, the loop counter has to fit in the word of the CPU that runs it
+    :param seed: the same seed always generates the same program
+    :return: the source lines of the program
+    """
+    if toolchain not in SYNTAX:
+        error_msg = f"Unknown toolchain {toolchain}, expected one of {', '.join(SYNTAX)}"
+        raise ValueError(error_msg)
+    if iterations < 1:
+        error_msg = f"Cannot loop {iterations} times, the loop counter has to be at least 1"
+        raise ValueError(error_msg)
+
+    mix = DEFAULT_MIX if mix is None else mix
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown or not any(mix.values()):
+        error_msg = f"Invalid opcode mix {mix}, weigh at least one of {', '.join(DEFAULT_MIX)}"
+        raise ValueError(error_msg)
+
+    reg, imm, registers, exit_line = SYNTAX[toolchain]
+    counter, one, zero = (f"{reg}{n}" for n in range(registers, registers + 3)) # reserved for the loop
+    work = [f"{reg}{n}" for n in range(registers)]
+    rng = random.Random(seed)
+    opcodes = list(mix)
+    weights = [mix[opcode] for opcode in opcodes]
+
+    line = lambda *tokens: "    ".join(tokens) + "\n"
+    lines = [f"# {instructions} instructions looped {iterations} times, generated with seed {seed}\n"]
+    lines += [line("MOV", r, f"{imm}{rng.randint(1, 9)}") for r in work]
+    lines += [line("MOV", counter, f"{imm}{iterations}"), line("MOV", one, f"{imm}1"), line("MOV", zero, f"{imm}0"), "body:\n"]
+
+    for opcode in rng.choices(opcodes, weights, k=instructions):
+        if opcode == "MOV":
+            lines.append(line("MOV", rng.choice(work), f"{imm}{rng.randint(0, MAX_IMMEDIATE)}"))
+        elif opcode == "DIV":
+            lines.append(line("DIV", rng.choice(work), one, rng.choice(work)))
+        elif opcode == "OUT":
+            lines.append(line("OUT", rng.choice(work)))
+        elif opcode == "CMP":
+            lines.append(line("CMP", rng.choice(work), rng.choice(work)))
+        else:
+            lines.append(line(opcode, rng.choice(work), rng.choice(work), rng.choice(work)))
+
+    lines += [line("SUB", counter, one, counter), line("CMP", counter, zero), line("JNZ", "body"), exit_line + "\n"]
+    return lines
+
+def write_program(filename: str, toolchain: str, instructions: int, mix: dict[str, int] | None = None, iterations: int = 1, seed: int = 0) -> str:
+    """
+    Generate a program and save it as a source file, see generate
+
+    :return: the filename
+    """
+    with open(filename, "w") as file:
+        file.writelines(generate(toolchain, instructions, mix, iterations, seed))
+    return filename
+
+if __name__ == "__main__":
+    toolchain = argv[1] if len(argv) > 1 else "4bit"
+    instructions = int(argv[2]) if len(argv) > 2 else 20
+    iterations = int(argv[3]) if len(argv) > 3 else 1
+    seed = int(argv[4]) if len(argv) > 4 else 0
+
+    print("".join(generate(toolchain, instructions, iterations=iterations, seed=seed)), end="")
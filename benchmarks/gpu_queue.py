@@ -0,0 +1,68 @@
+"""
+Overlap command submission with GPU execution through the GPU-RAM command queue
+
+The CPU runs a scalar program in slices and submits a batch of GPU instructions after each slice.
+Run serially, the GPU only starts once everything is submitted, with the consumer threads started
+it works through each batch while the CPU runs its next slice. The stick is kept small, so the CPU
+also has to wait for room whenever it gets ahead of the GPU
+
+Usage: python -m benchmarks.gpu_queue [slices] [elements]
+"""
+import time
+from sys import argv
+
+from hardware.cpu.cpu import CPU
+from hardware.gpu.gpu import GPU, OPCODES
+from hardware.gpu.gpu_ram import GPU_RAM, instruction_size
+from hardware.ram.ram import RAM
+from hardware.serial.serial_io import BufferedSerialIO
+
+from benchmarks.cpu_cycles import calculator_program, load_program
+
+CYCLES_PER_SLICE = 20000
+INSTRUCTIONS_PER_SLICE = 8
+A, B, C = range(3) # GPU buffer ids
+
+def gpu_batch() -> list[list[int]]:
+    return [[OPCODES["ADD"], C, A, B], [OPCODES["MUL"], C, C, B]] * (INSTRUCTIONS_PER_SLICE // 2)
+
+def measure(slices: int, elements: int, overlap: bool) -> tuple[float, GPU]:
+    stick = GPU_RAM("queue", 0, max_mem_size=instruction_size([0, 0, 0, 0]) * INSTRUCTIONS_PER_SLICE * 2)
+    gpu = GPU("bench", 1024, [stick], batch_size=INSTRUCTIONS_PER_SLICE)
+    gpu.upload(A, range(elements))
+    gpu.upload(B, [3] * elements)
+
+    cpu = CPU("bench", 1, load_program(calculator_program(slices * CYCLES_PER_SLICE * 2)), BufferedSerialIO(), gpu=gpu)
+    cpu.predecode()
+
+    start = time.perf_counter()
+    if overlap:
+        gpu.start()
+    pending = []
+    for _ in range(slices):
+        cpu.run(CYCLES_PER_SLICE)
+        if overlap:
+            gpu.submit(gpu_batch())
+        else:
+            pending.extend(gpu_batch())
+    if not overlap:
+        for first in range(0, len(pending), INSTRUCTIONS_PER_SLICE):
+            gpu.submit(pending[first:first + INSTRUCTIONS_PER_SLICE])
+            gpu.run()
+    gpu.run()
+    seconds = time.perf_counter() - start
+
+    gpu.stop()
+    return seconds, gpu
+
+if __name__ == "__main__":
+    slices = int(argv[1]) if len(argv) > 1 else 40
+    elements = int(argv[2]) if len(argv) > 2 else 2000000
+
+    serial, serial_gpu = measure(slices, elements, overlap=False)
+    overlapped, overlapped_gpu = measure(slices, elements, overlap=True)
+    assert (serial_gpu.download(C) == overlapped_gpu.download(C)).all()
+
+    print(f"{'serial':>10}: {slices} slices of {CYCLES_PER_SLICE} CPU cycles and {INSTRUCTIONS_PER_SLICE} GPU instructions in {serial:.3f}s")
+    print(f"{'overlapped':>10}: {slices} slices of {CYCLES_PER_SLICE} CPU cycles and {INSTRUCTIONS_PER_SLICE} GPU instructions in {overlapped:.3f}s ({serial / overlapped:.2f}x), "
+          f"the CPU waited for room {overlapped_gpu.gpu_ram[0].full_waits} times")
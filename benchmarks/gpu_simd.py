@@ -0,0 +1,78 @@
+"""
+Compare the GPU running elementwise ADD/MUL, a SUM reduction and a GATHER over whole buffers
+against the CPU doing the same arithmetic one scalar instruction at a time
+
+The CPU program loads both operands of every element as immediates, adds them and outputs the result,
+the GPU gets the same operands uploaded as buffers and one instruction per operation
+
+Usage: python -m benchmarks.gpu_simd [elements] [gpu cores]
+"""
+import random
+import time
+from sys import argv
+
+import numpy as np
+
+from hardware.cpu.cpu import CPU
+from hardware.gpu.gpu import GPU, OPCODES
+from hardware.gpu.gpu_ram import GPU_RAM
+from hardware.ram.ram import RAM
+from hardware.serial.serial_io import BufferedSerialIO
+
+A, B, SUMS, PRODUCTS, TOTAL, INDICES, GATHERED = range(7) # GPU buffer ids
+
+def scalar_program(a: list[int], b: list[int]) -> list[list[str]]:
+    program = []
+    for x, y in zip(a, b):
+        program.append(["0000", "0000", "0000", format(x, "04b")]) # MOV idx0 %x
+        program.append(["0000", "0001", "0000", format(y, "04b")]) # MOV idx1 %y
+        program.append(["0001", "0000", "0001", "0010"])           # ADD idx0 idx1 idx2
+        program.append(["0101", "0010"])                           # OUT idx2
+    program.append(["1111", "0000", "0000"])                       # EXIT
+    return program
+
+def run_cpu(a: list[int], b: list[int]) -> tuple[float, list[int]]:
+    stick = RAM("bench", 0, 1000000000)
+    stick.load(scalar_program(a, b))
+    serial = BufferedSerialIO()
+    cpu = CPU("bench", 1, stick, serial)
+    cpu.predecode()
+
+    start = time.perf_counter()
+    cpu.run()
+    seconds = time.perf_counter() - start
+    return seconds, [int(message) for message in serial.messages]
+
+def run_gpu(a: list[int], b: list[int], cores: int) -> tuple[float, GPU]:
+    gpu = GPU("bench", cores, [GPU_RAM("bench", 0)])
+
+    start = time.perf_counter()
+    gpu.upload(A, a)
+    gpu.upload(B, b)
+    gpu.upload(INDICES, np.arange(len(a))[::-1])
+    gpu.submit([
+        [OPCODES["ADD"], SUMS, A, B],
+        [OPCODES["MUL"], PRODUCTS, A, B],
+        [OPCODES["SUM"], TOTAL, SUMS],
+        [OPCODES["GATHER"], GATHERED, SUMS, INDICES],
+    ])
+    gpu.run()
+    seconds = time.perf_counter() - start
+    return seconds, gpu
+
+if __name__ == "__main__":
+    elements = int(argv[1]) if len(argv) > 1 else 200000
+    cores = int(argv[2]) if len(argv) > 2 else 1024
+
+    random.seed(0)
+    a = [random.randrange(16) for _ in range(elements)]
+    b = [random.randrange(16) for _ in range(elements)]
+
+    cpu_seconds, sums = run_cpu(a, b)
+    gpu_seconds, gpu = run_gpu(a, b, cores)
+    assert gpu.download(SUMS).tolist() == sums
+    assert gpu.download(TOTAL)[0] == sum(sums)
+
+    print(f"{'CPU':>4}: {elements} elementwise ADDs in {cpu_seconds:.3f}s, {elements / cpu_seconds:,.0f} elements/s")
+    print(f"{'GPU':>4}: ADD, MUL, SUM and GATHER over {elements} elements in {gpu_seconds:.4f}s, "
+          f"{4 * elements / gpu_seconds:,.0f} elements/s ({cpu_seconds / gpu_seconds:,.0f}x), {gpu.cycle} cycles on {cores} cores")
@@ -0,0 +1,104 @@
+"""
+Repeat GETs against a local http.server that counts the requests reaching it, without the NIC's response cache,
+with a memory-only cache and with a small memory tier backed by an SSD tier
+
+The peer serves one resource per caching style: fresh for a minute (max-age), revalidated every time
+through its ETag (no-cache), revalidated through Last-Modified (max-age=0) and not cacheable at all (no-store)
+
+Usage: python -m benchmarks.nic_cache [rounds]
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sys import argv
+
+from hardware.nic.nic import NIC
+from hardware.nic.http_cache import HTTPCache
+from hardware.ssd.block_ssd import BlockSSD
+
+BODY = os.urandom(64 * 1024)
+ETAG = '"v1"'
+LAST_MODIFIED = "Sat, 17 Oct 2026 00:00:00 GMT"
+RESOURCES = {
+    "/max-age": {"Cache-Control": "max-age=60"},
+    "/etag": {"Cache-Control": "no-cache", "ETag": ETAG},
+    "/last-modified": {"Cache-Control": "max-age=0", "Last-Modified": LAST_MODIFIED},
+    "/no-store": {"Cache-Control": "no-store", "ETag": ETAG},
+}
+PATHS = 8 # copies of every resource, /etag/3 and so on, so a small memory tier spills to the SSD tier
+
+class Peer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        resource = "/" + self.path.split("/")[1]
+        headers = RESOURCES[resource]
+        with self.server.lock:
+            self.server.requests += 1
+
+        not_modified = ("ETag" in headers and self.headers.get("If-None-Match") == headers["ETag"]) or \
+                       ("Last-Modified" in headers and self.headers.get("If-Modified-Since") == headers["Last-Modified"])
+        body = b"" if not_modified else BODY
+        with self.server.lock:
+            self.server.body_bytes += len(body)
+
+        self.send_response(304 if not_modified else 200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_peer() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Peer)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.body_bytes = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def measure(name: str, server: ThreadingHTTPServer, rounds: int, cache: HTTPCache | None) -> None:
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    server.requests = server.body_bytes = 0
+
+    start = time.perf_counter()
+    with NIC("benchmark", cache=cache) as nic:
+        for _ in range(rounds):
+            for resource in RESOURCES:
+                for n in range(PATHS):
+                    response = nic.send_get_request(f"{base}{resource}/{n}")
+                    response.raise_for_status()
+                    assert response.content == BODY
+    seconds = time.perf_counter() - start
+
+    gets = rounds * len(RESOURCES) * PATHS
+    print(f"{name:>14}: {gets} GETs in {seconds:.3f}s, {server.requests} reached the peer, {server.body_bytes / 1e6:.1f}MB of bodies sent")
+    if cache is not None:
+        print(f"{'':>16}{cache.stats()}")
+
+if __name__ == "__main__":
+    rounds = int(argv[1]) if len(argv) > 1 else 25
+    server = start_peer()
+
+    try:
+        measure("no cache", server, rounds, None)
+        measure("memory", server, rounds, HTTPCache(max_bytes=len(RESOURCES) * PATHS * len(BODY)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            os.mkdir("storage")
+            ssd = BlockSSD("http_cache", max_storage_size=len(RESOURCES) * PATHS * len(BODY) * 2)
+            cache = HTTPCache(max_bytes=PATHS * len(BODY), ssd=ssd, ssd_max_bytes=len(RESOURCES) * PATHS * len(BODY) * 2)
+            measure("memory + SSD", server, rounds, cache)
+            cache.close()
+            asyncio.run(ssd.delete())
+    finally:
+        server.shutdown()
@@ -0,0 +1,55 @@
+"""
+Poll many slow endpoints one after another, then as one NIC.send_requests batch
+
+Usage: python -m benchmarks.nic_fanout [requests]
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sys import argv
+
+from hardware.nic.nic import NIC, NICRequest
+
+class SlowPeer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(int(self.path.strip("/")) / 1000) # the path is how many milliseconds to take
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    count = int(argv[1]) if len(argv) > 1 else 20
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowPeer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    random.seed(0)
+    delays = [random.randint(50, 200) for _ in range(count)]
+    urls = [f"http://127.0.0.1:{server.server_address[1]}/{delay}" for delay in delays]
+
+    try:
+        with NIC("benchmark", pool_size=count) as nic:
+            start = time.perf_counter()
+            for url in urls:
+                nic.send_get_request(url)
+            one_by_one = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = nic.send_requests([NICRequest("GET", url) for url in urls])
+            batched = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    failed = sum(1 for result in results if not result)
+    print(f"{count} requests, slowest {max(delays)}ms, all together {sum(delays)}ms")
+    print(f"{'one by one':>14}: {one_by_one * 1000:.0f}ms")
+    print(f"{'send_requests':>14}: {batched * 1000:.0f}ms, {failed} failed")
@@ -0,0 +1,55 @@
+"""
+Compare requests per second of one-off requests against the NIC's pooled keep-alive session,
+using a local http.server as the peer
+
+Usage: python -m benchmarks.nic_pool [requests]
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sys import argv
+
+import requests
+
+from hardware.nic.nic import NIC
+
+class Peer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    disable_nagle_algorithm = True # headers and body go out in separate writes, don't let them wait on a delayed ACK
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_peer() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Peer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def requests_per_second(send, url: str, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        send(url).raise_for_status()
+    return count / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    server = start_peer()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    try:
+        unpooled = requests_per_second(lambda url: requests.get(url, timeout=5), url, count)
+        with NIC("benchmark") as nic:
+            pooled = requests_per_second(nic.send_get_request, url, count)
+    finally:
+        server.shutdown()
+
+    print(f"{'requests.get':>14}: {unpooled:,.0f} requests/s")
+    print(f"{'pooled NIC':>14}: {pooled:,.0f} requests/s ({pooled / unpooled:.1f}x)")
@@ -0,0 +1,48 @@
+"""
+Read a small set of hot files over and over, with and without the SSD page cache
+
+Usage: python -m benchmarks.ssd_cache [reads]
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from sys import argv
+
+from hardware.ssd.ssd import SSD
+
+FILES = 200
+HOT_FILES = 20
+FILE_SIZE = 4096
+
+async def measure(name: str, reads: int, cache_size: int) -> tuple[float, SSD]:
+    ssd = SSD(name, max_storage_size=FILES * FILE_SIZE, cache_size=cache_size)
+    for n in range(FILES):
+        await ssd.create_file("", f"{n}.bin")
+    await ssd.write_many({f"{n}.bin": os.urandom(FILE_SIZE) for n in range(FILES)}, write_binary=True)
+
+    # nine reads in ten go to the hot files
+    random.seed(0)
+    paths = [f"{random.randrange(HOT_FILES) if random.random() < 0.9 else random.randrange(FILES)}.bin" for _ in range(reads)]
+
+    start = time.perf_counter()
+    for path in paths:
+        await ssd.read_file(path, read_binary=True)
+    seconds = time.perf_counter() - start
+
+    await ssd.delete()
+    return seconds, ssd
+
+async def main(reads: int) -> None:
+    for cache_size in (0, HOT_FILES * FILE_SIZE * 2):
+        seconds, ssd = await measure(f"cache_{cache_size}", reads, cache_size)
+        stats = "" if ssd.cache is None else f", {ssd.cache.hits} hits, {ssd.cache.misses} misses, {ssd.cache.evictions} evictions"
+        print(f"cache {cache_size:>6} bytes: {reads} reads in {seconds:.3f}s{stats}")
+
+if __name__ == "__main__":
+    reads = int(argv[1]) if len(argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir("storage")
+        asyncio.run(main(reads))
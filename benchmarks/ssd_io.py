@@ -0,0 +1,55 @@
+"""
+Compare writing and reading SSD files one at a time against the write_many/read_many batch calls,
+and the file-per-file SSD against the block-device BlockSSD
+
+Usage: python -m benchmarks.ssd_io [files]
+"""
+import asyncio
+import os
+import tempfile
+import time
+from sys import argv
+
+from hardware.ssd.ssd import SSD
+from hardware.ssd.block_ssd import BlockSSD
+
+FILE_SIZE = 4096
+
+async def one_at_a_time(ssd: SSD, paths: list[str], content: bytes) -> None:
+    for path in paths:
+        await ssd.write_to_file(path, content, write_binary=True)
+    for path in paths:
+        await ssd.read_file(path, read_binary=True)
+
+async def batched(ssd: SSD, paths: list[str], content: bytes) -> None:
+    await ssd.write_many({path: content for path in paths}, write_binary=True)
+    await ssd.read_many(paths, read_binary=True)
+
+async def measure(device, name: str, files: int, run) -> float:
+    if device is BlockSSD:
+        ssd = BlockSSD(name, max_storage_size=(files + 1) * FILE_SIZE * 2, max_files=files)
+    else:
+        ssd = SSD(name, max_storage_size=files * FILE_SIZE)
+    try:
+        for n in range(files):
+            await ssd.create_file("", f"{n}.bin")
+        paths = [f"{n}.bin" for n in range(files)]
+
+        start = time.perf_counter()
+        await run(ssd, paths, os.urandom(FILE_SIZE))
+        return time.perf_counter() - start
+    finally:
+        await ssd.delete()
+
+async def main(files: int) -> None:
+    for device in (SSD, BlockSSD):
+        for name, run in (("one at a time", one_at_a_time), ("write_many/read_many", batched)):
+            seconds = await measure(device, f"{device.__name__}_{run.__name__}", files, run)
+            print(f"{device.__name__:>8} {name:>21}: {files} files written and read in {seconds:.3f}s")
+
+if __name__ == "__main__":
+    files = int(argv[1]) if len(argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir("storage")
+        asyncio.run(main(files))
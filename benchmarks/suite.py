@@ -0,0 +1,248 @@
+"""
+Time every stage of both toolchains on generated programs, plus SSD and NIC I/O, and compare the results against a baseline
+
+4bit and 8bit are each timed while assembling, loading and executing a program from benchmarks.generators,
+the SSD while writing and reading a batch of files and the NIC while sending GETs to a local http.server.
+Both toolchains build their CPU before the execute timing starts, so it only covers decoding and running.
+Every metric is the fastest of several repeats, in seconds. The suite exits with 1 when any metric got slower
+than the baseline by more than the threshold
+
+Usage: python -m benchmarks.suite [--update] [--baseline FILE] [--threshold PERCENT] [--repeat N] [--output FILE]
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import importlib.util
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import ROOT
+from benchmarks.generators import DEFAULT_MIX, parse_mix, write_program
+from benchmarks.nic_pool import start_peer
+
+import zev_compiler
+from hardware.cpu.cpu import CPU
+from hardware.nic.nic import NIC
+from hardware.ram.ram import RAM
+from hardware.serial.serial_io import SerialIO
+from hardware.ssd.ssd import SSD
+
+from _image import Image
+from _linker import link
+import ZVM
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+FILE_SIZE = 4096
+
+# zev-as.py can't be imported by name
+_spec = importlib.util.spec_from_file_location("zev_as", os.path.join(ROOT, "8bit", "zev-as.py"))
+zev_as = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(zev_as)
+
+def fastest(repeat: int, setup, measured, teardown=None) -> float:
+    """
+    :param repeat: how many times to measure
+    :param setup: called before every measurement, untimed, its result is passed to measured
+    :param measured: the code to time
+    :param teardown: called with the result of setup after every measurement, untimed
+    :return: the fastest time in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        gc.disable() # like timeit, so a collection doesn't land in one measurement but not another
+        try:
+            start = time.perf_counter()
+            measured(state)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+            if teardown is not None:
+                teardown(state)
+    return min(times)
+
+def bench_4bit(source: str, repeat: int) -> dict[str, float]:
+    instructions, jump_table = zev_compiler.assemble(source)
+
+    def load(_) -> RAM:
+        stick = RAM("bench", 0, 1000000000)
+        first = stick.load(instructions)
+        stick.set_jump_table([first - 1 + target for target in jump_table])
+        return stick
+
+    # like 8bit.execute, the CPU is built untimed and every instruction is decoded while it runs
+    stick = load(None)
+    boot = lambda: CPU("bench", 1, stick, SerialIO())
+    shut_down = lambda cpu: stick.unsubscribe(cpu._invalidate) # so listeners don't pile up on the shared stick
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return {
+            "4bit.assemble": fastest(repeat, lambda: None, lambda _: zev_compiler.assemble(source)),
+            "4bit.load": fastest(repeat, lambda: None, load),
+            "4bit.execute": fastest(repeat, boot, lambda cpu: cpu.run(), shut_down),
+        }
+
+def bench_8bit(source: str, repeat: int) -> dict[str, float]:
+    obj = f"{source}.zvo"
+
+    def assemble(_) -> None:
+        jump_table = []
+        with open(source, "r") as f:
+            link(zev_as._create_machine_code_instructions(zev_as._get_tokens(f), jump_table), obj, jump_table)
+
+    def load(_) -> ZVM.CPU:
+        # the 4bit CPU's word width, so loop counters past a byte don't wrap
+        return ZVM.CPU(ZVM.RAM(Image(obj)), word_bits=32, output=lambda text: None)
+
+    assemble(None)
+    return {
+        "8bit.assemble": fastest(repeat, lambda: None, assemble),
+        "8bit.load": fastest(repeat, lambda: None, load),
+        "8bit.execute": fastest(repeat, lambda: load(None), lambda cpu: cpu.run()),
+    }
+
+async def bench_ssd(files: int, repeat: int) -> dict[str, float]:
+    ssd = SSD("bench", max_storage_size=files * FILE_SIZE)
+    try:
+        paths = [f"{n}.bin" for n in range(files)]
+        for path in paths:
+            await ssd.create_file("", path)
+        content = os.urandom(FILE_SIZE)
+
+        write_times, read_times = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await ssd.write_many({path: content for path in paths}, write_binary=True)
+            write_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await ssd.read_many(paths, read_binary=True)
+            read_times.append(time.perf_counter() - start)
+    finally:
+        await ssd.delete()
+
+    return {"ssd.write": min(write_times), "ssd.read": min(read_times)}
+
+def bench_nic(count: int, repeat: int) -> dict[str, float]:
+    server = start_peer()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        with NIC("bench") as nic:
+            def round_trips(_) -> None:
+                for _ in range(count):
+                    nic.send_get_request(url).raise_for_status()
+
+            return {"nic.round_trip": fastest(repeat, lambda: None, round_trips)}
+    finally:
+        server.shutdown()
+
+def run_suite(config: dict, repeat: int) -> dict[str, float]:
+    """
+    :param config: the workload, every value the baseline has to match to be comparable
+    :param repeat: how many times each metric is measured
+    :return: metric -> seconds
+    """
+    metrics = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory) # the SSD keeps its files under ./storage
+        try:
+            os.mkdir("storage")
+            for toolchain, bench in (("4bit", bench_4bit), ("8bit", bench_8bit)):
+                source = write_program(f"{toolchain}.zev", toolchain, config["instructions"], config["mix"], config["iterations"], config["seed"])
+                metrics.update(bench(os.path.abspath(source), repeat))
+            metrics.update(asyncio.run(bench_ssd(config["files"], repeat)))
+            metrics.update(bench_nic(config["requests"], repeat))
+        finally:
+            os.chdir(cwd)
+    return metrics
+
+def compare(metrics: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    """
+    Print every metric next to its baseline
+
+    :param threshold: how many percent slower than the baseline a metric may get
+    :return: the metrics that regressed
+    """
+    regressions = []
+    print(f"{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, seconds in metrics.items():
+        if name not in baseline:
+            print(f"{name:<16}{'-':>12}{seconds:>12.6f}{'new':>10}")
+            continue
+
+        change = (seconds / baseline[name] - 1) * 100
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<16}{baseline[name]:>12.6f}{seconds:>12.6f}{change:>+9.1f}%{'  REGRESSED' if regressed else ''}")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark both toolchains, the SSD and the NIC against a stored baseline")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="the baseline JSON file to compare against")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=20.0, metavar="PERCENT", help="fail when a metric is this many percent slower than the baseline")
+    parser.add_argument("--repeat", type=int, default=5, help="how many times each metric is measured, the fastest counts")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--instructions", type=int, default=5000, help="instructions in the generated programs")
+    parser.add_argument("--iterations", type=int, default=100, help="how many times the generated programs loop")
+    parser.add_argument("--mix", default=",".join(f"{opcode}={weight}" for opcode, weight in DEFAULT_MIX.items()), help="the opcode mix, as MOV=3,ADD=2,DIV=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--files", type=int, default=200, help="files the SSD writes and reads")
+    parser.add_argument("--requests", type=int, default=200, help="GETs the NIC sends")
+    args = parser.parse_args()
+
+    config = {
+        "instructions": args.instructions,
+        "iterations": args.iterations,
+        "mix": parse_mix(args.mix),
+        "seed": args.seed,
+        "files": args.files,
+        "requests": args.requests,
+    }
+    metrics = run_suite(config, args.repeat)
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "config": config,
+        "metrics": metrics,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        compare(metrics, {}, args.threshold)
+        print(f"Stored the baseline in {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        compare(metrics, {}, args.threshold)
+        print(f"No baseline at {args.baseline}, run with --update to store one")
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print(f"The baseline in {args.baseline} was measured with {baseline['config']}, rerun with the same options or --update it")
+        return 2
+
+    regressions = compare(metrics, baseline["metrics"], args.threshold)
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.threshold}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
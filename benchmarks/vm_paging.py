@@ -0,0 +1,103 @@
+"""
+Run a program that is larger than its RAM stick through virtual memory paged out to an SSD,
+then read it back with a hot working set, against the same program in a RAM stick it fits in.
+Last, a BlockSSD-backed virtual memory is filled to exactly its capacity and read back, and one more instruction has to be refused
+
+Usage: python -m benchmarks.vm_paging [instructions] [page size]
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from sys import argv
+
+from hardware.cpu.cpu import CPU
+from hardware.ram.ram import RAM, SLOT_SIZE
+import hardware.ram.ram_errors as ram_errors
+from hardware.ram.virtual_memory import VirtualMemory
+from hardware.serial.serial_io import BufferedSerialIO
+from hardware.ssd.block_ssd import BlockSSD, HEADER, ENTRY
+from hardware.ssd.ssd import SSD
+
+from benchmarks.cpu_cycles import calculator_program
+from zev_compiler import parse_into_instructions, create_half_byte_instructions
+
+READS = 200000
+HOT_FRACTION = 0.05 # nine reads in ten go to this fraction of the program
+
+def measure(memory, program: list[list[str]]) -> tuple[float, float]:
+    start = time.perf_counter()
+    memory.load(program)
+    CPU("bench", 1, memory, BufferedSerialIO()).run()
+    run_seconds = time.perf_counter() - start
+
+    random.seed(0)
+    hot = max(1, int(len(program) * HOT_FRACTION))
+    addrs = [random.randrange(1, hot + 1) if random.random() < 0.9 else random.randrange(1, len(program) + 1) for _ in range(READS)]
+    start = time.perf_counter()
+    for addr in addrs:
+        memory.get_instruction(addr)
+    return run_seconds, time.perf_counter() - start
+
+def block_swap(device_name: str, pages: int, page_size: int) -> BlockSSD:
+    # room for the directory table, rounded up to a block, and for every page file plus the swap directory
+    max_files = pages + 1
+    return BlockSSD(device_name, HEADER.size + max_files * ENTRY.size + (pages + 1) * page_size * SLOT_SIZE, block_size=page_size * SLOT_SIZE, max_files=max_files)
+
+def fill(program: list[list[str]], page_size: int) -> None:
+    ssd = block_swap("fill_swap", 6, page_size)
+    memory = VirtualMemory("fill", RAM("frames", 0, 2 * page_size * SLOT_SIZE), ssd, page_size)
+    try:
+        instructions = [program[n % len(program)] for n in range(memory.capacity)]
+        start = time.perf_counter()
+        memory.load(instructions)
+        for addr in random.sample(range(1, memory.capacity + 1), memory.capacity):
+            if memory.get_instruction(addr) != [int(field, 2) for field in instructions[addr - 1]]:
+                raise AssertionError(f"Address {addr} of {memory} does not hold what was loaded there")
+        seconds = time.perf_counter() - start
+
+        try:
+            memory.add_instruction(program[0])
+        except ram_errors.OutOfMemoryError:
+            pass
+        else:
+            raise AssertionError(f"{memory} took an instruction past its capacity")
+        if memory.size != memory.capacity:
+            raise AssertionError(f"{memory} changed when it refused an instruction")
+
+        stats = memory.stats()
+        print(f"{'BlockSSD swap, full':>22}: {memory.capacity} instructions loaded and read back in {seconds:.3f}s, "
+              f"{stats['swapped_pages']} of {stats['swap_pages']} page files in use, one more was refused")
+    finally:
+        memory.close()
+        asyncio.run(ssd.delete())
+
+def main(instructions: int, page_size: int) -> None:
+    program = create_half_byte_instructions(parse_into_instructions(calculator_program(instructions)))
+    size = len(program) * SLOT_SIZE
+
+    run_seconds, read_seconds = measure(RAM("bench", 0, size), program)
+    print(f"{'RAM':>22}: program ran in {run_seconds:.3f}s, {READS} reads in {read_seconds:.3f}s")
+
+    pages = -(-len(program) // page_size)
+    for name, ssd in (("SSD", SSD("swap", size * 2)), ("BlockSSD", block_swap("block_swap", pages, page_size))):
+        for fraction in (4, 16):
+            frames = RAM("frames", 0, size // fraction)
+            memory = VirtualMemory(f"{name}_{fraction}", frames, ssd, page_size)
+            run_seconds, read_seconds = measure(memory, program)
+            stats = memory.stats()
+            print(f"{name:>8} swap, 1/{fraction:<2} RAM: program ran in {run_seconds:.3f}s, {READS} reads in {read_seconds:.3f}s, "
+                  f"{stats['page_faults']} page faults, {stats['page_outs']} page outs, {stats['resident_pages']} resident pages")
+            memory.close()
+        asyncio.run(ssd.delete())
+
+    fill(program, page_size)
+
+if __name__ == "__main__":
+    instructions = int(argv[1]) if len(argv) > 1 else 100000
+    page_size = int(argv[2]) if len(argv) > 2 else 256
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir("storage")
+        main(instructions, page_size)
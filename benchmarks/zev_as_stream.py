@@ -0,0 +1,45 @@
+"""
+Show that zev-as assembles in linear time with a peak memory that does not grow with the size of the source
+
+Usage: python -m benchmarks.zev_as_stream
+"""
+import importlib
+import os
+import tempfile
+import time
+import tracemalloc
+
+assembler = importlib.import_module("zev-as")
+
+SIZES = (10000, 100000, 1000000)
+
+def synthetic_source(filename: str, lines: int) -> None:
+    body = ["MOV    reg0    $24    # a comment",
+            "MOV    reg1    $6",
+            "ADD    reg0    reg1    reg2",
+            "OUT    reg2"]
+    with open(filename, "w") as f:
+        for n in range(lines - 1):
+            f.write(body[n % len(body)] + "\n")
+        f.write("EXT    $0\n")
+
+def assemble(filename: str) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    assembler.assemble_object(filename)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        assembler.CACHE_DIR = os.path.join(directory, "cache") # every run is a cache miss
+
+        print(f"{'lines':>9} {'seconds':>9} {'us/line':>8} {'peak KiB':>9}")
+        for size in SIZES:
+            filename = os.path.join(directory, f"{size}.zev")
+            synthetic_source(filename, size)
+
+            seconds, peak = assemble(filename)
+            print(f"{size:>9} {seconds:>9.3f} {seconds / size * 1e6:>8.2f} {peak // 1024:>9}")
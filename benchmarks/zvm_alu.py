@@ -0,0 +1,101 @@
+"""
+Compare ZVM's native-integer ALU against the old bit-by-bit binary string arithmetic
+
+Usage: python -m benchmarks.zvm_alu [operations]
+"""
+import random
+import timeit
+from sys import argv
+from types import SimpleNamespace
+
+from ZVM import CPU
+
+WIDTHS = (8, 16, 32, 64)
+
+# the string arithmetic ZVM used before it computed on ints, kept here as the reference path
+def add_two_binary(n1: str, n2: str) -> str:
+    maxlen = max(len(n1), len(n2))
+    n1 = n1.zfill(maxlen)
+    n2 = n2.zfill(maxlen)
+
+    added = []
+    carry = 0
+    for i in range(maxlen - 1, -1, -1):
+        total = int(n1[i]) + int(n2[i]) + carry
+        added.append(str(total % 2))
+        carry = total // 2
+
+    if carry:
+        added.append("1")
+
+    return "".join(reversed(added)).lstrip("0") or "0"
+
+def sub_two_binary(n1: str, n2: str) -> str:
+    def is_smaller(a: str, b: str) -> bool:
+        a = a.lstrip('0') or '0'
+        b = b.lstrip('0') or '0'
+        if len(a) != len(b):
+            return len(a) < len(b)
+        return a < b
+
+    negative = False
+    if is_smaller(n1, n2):
+        n1, n2 = n2, n1
+        negative = True
+
+    maxlen = max(len(n1), len(n2))
+    n1 = n1.zfill(maxlen)
+    n2 = n2.zfill(maxlen)
+
+    result = []
+    borrow = 0
+    for i in range(maxlen - 1, -1, -1):
+        diff = int(n1[i]) - (int(n2[i]) + borrow)
+        if diff < 0:
+            diff += 2
+            borrow = 1
+        else:
+            borrow = 0
+        result.append(str(diff))
+
+    res_str = ''.join(reversed(result)).lstrip('0') or '0'
+    return ('-' + res_str) if negative else res_str
+
+def bench_width(word_bits: int, operations: int) -> dict[str, float]:
+    """
+    Time ADD and SUB on random operands that fill the word
+
+    :param word_bits: the ALU width
+    :param operations: how many of each operation to run
+    :return: seconds per million operations for each path
+    """
+    alu = SimpleNamespace(mask=(1 << word_bits) - 1, sign_bit=1 << (word_bits - 1))
+    wrap = CPU._wrap
+
+    limit = (1 << (word_bits - 1)) - 1
+    ints = [(random.randint(0, limit), random.randint(0, limit)) for _ in range(operations)]
+    strings = [(format(a, "b"), format(b, "b")) for a, b in ints]
+
+    def string_path():
+        for a, b in strings:
+            add_two_binary(a, b)
+            sub_two_binary(a, b)
+
+    def native_path():
+        for a, b in ints:
+            wrap(alu, a + b)
+            wrap(alu, a - b)
+
+    scale = 1000000 / (operations * 2)
+    return {
+        "string": timeit.timeit(string_path, number=1) * scale,
+        "native": timeit.timeit(native_path, number=1) * scale,
+    }
+
+if __name__ == "__main__":
+    operations = int(argv[1]) if len(argv) > 1 else 20000
+
+    print(f"{'bits':>4} {'string s/Mop':>13} {'native s/Mop':>13} {'speedup':>8}")
+    for word_bits in WIDTHS:
+        result = bench_width(word_bits, operations)
+        print(f"{word_bits:>4} {result['string']:>13.3f} {result['native']:>13.3f} {result['string'] / result['native']:>7.1f}x")
@@ -0,0 +1,46 @@
+"""
+Compare the ZVM interpreter with its translation tier on a program that is run repeatedly
+
+Usage: python -m benchmarks.zvm_jit [instructions] [runs]
+"""
+import os
+import tempfile
+import time
+from sys import argv
+
+from _image import Image, write_image
+from ZVM import CPU, RAM
+
+def arithmetic_machine_code(instructions: int) -> list[list]:
+    body = [["10", "0", "11000"], ["10", "1", "110"], ["111", "0", "1", "10"], ["1000", "10", "1", "11"],
+            ["1001", "11", "1", "100"], ["1010", "100", "1", "101"], ["110", "101"]]
+    code = body * (instructions // len(body))
+    code.append(["1", "0"])
+    return code
+
+def time_runs(filename: str, runs: int, jit_threshold: int | None) -> list[float]:
+    image = Image(filename)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        CPU(RAM(image), output=lambda text: None, jit_threshold=jit_threshold).run()
+        times.append(time.perf_counter() - start)
+    return times
+
+if __name__ == "__main__":
+    instructions = int(argv[1]) if len(argv) > 1 else 100000
+    runs = int(argv[2]) if len(argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "bench.zvo")
+        write_image(arithmetic_machine_code(instructions), filename)
+
+        interpreted = time_runs(filename, runs, None)
+        translated = time_runs(filename, runs, 2)
+
+    cycles = instructions // 7 * 7 + 1
+    warm = min(translated[2:]) if runs > 2 else translated[-1]
+    print(f"interpreter:            {min(interpreted):.3f}s per run ({cycles / min(interpreted):,.0f} cycles/s)")
+    print(f"first run (profiling):  {translated[0]:.3f}s")
+    print(f"second run (compiling): {translated[1]:.3f}s")
+    print(f"compiled:               {warm:.3f}s per run ({cycles / warm:,.0f} cycles/s)")
@@ -0,0 +1,36 @@
+"""
+Show that loading a ZVM object costs the same no matter how many instructions it holds
+
+Usage: python -m benchmarks.zvm_startup
+"""
+import os
+import resource
+import tempfile
+import time
+
+from _image import Image, write_image
+from ZVM import CPU, RAM
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+def synthetic_machine_code(instructions: int) -> list[list]:
+    body = [["10", "0", "11000"], ["10", "1", "110"], ["111", "0", "1", "10"], ["110", "10"]]
+    code = body * (instructions // len(body))
+    code.append(["1", "0"])
+    return code
+
+def startup_seconds(filename: str) -> float:
+    start = time.perf_counter()
+    CPU(RAM(Image(filename)))
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'instructions':>12} {'object bytes':>13} {'startup ms':>11} {'max rss KiB':>12}")
+        for size in SIZES:
+            filename = os.path.join(directory, f"{size}.zvo")
+            write_image(synthetic_machine_code(size), filename)
+
+            seconds = startup_seconds(filename)
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(f"{size:>12} {os.path.getsize(filename):>13} {seconds * 1000:>11.3f} {rss:>12}")
@@ -0,0 +1,139 @@
+"""
+Assemble and run many .zev programs in a pool of worker processes
+
+Usage: python zev_batch.py {4bit,8bit} <directory or glob> [--output results.jsonl] [--jobs N] [--max-cycles N]
+
+Every program gets one result record with its exit code, output, cycle count and any error.
+A program that fails keeps the output and cycle count it got to before the error.
+Records are written as JSON lines, or as CSV when the output file ends in .csv
+"""
+import argparse
+import csv
+import glob
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+FIELDS = ["source", "exit_code", "cycles", "output", "error", "seconds"]
+
+# per-worker state, set up once by _start_worker and reused by every job the worker runs
+_toolchain = None
+_worker = {}
+
+def _start_worker(arch: str) -> None:
+    global _toolchain
+    _toolchain = arch
+    sys.path.insert(0, os.path.join(ROOT, arch))
+
+    if arch == "4bit":
+        _worker["compiler"] = importlib.import_module("zev_compiler")
+        _worker["ram"] = importlib.import_module("hardware.ram.ram").RAM("batch", 0, 1000000000)
+        _worker["serial_io"] = importlib.import_module("hardware.serial.serial_io")
+    else:
+        _worker["assembler"] = importlib.import_module("zev-as")
+        _worker["image"] = importlib.import_module("_image")
+        _worker["zvm"] = importlib.import_module("ZVM")
+
+# the runners fill in exit_code, cycles and output as far as the program got, even when it fails
+
+def _run_4bit(source: str, max_cycles: int | None, result: dict) -> None:
+    compiler = _worker["compiler"]
+    stick = _worker["ram"]
+    serial = _worker["serial_io"].BufferedSerialIO()
+
+    stick.clear()
+    compiler.load_program(source, stick)
+
+    cpu = compiler.CPU("zev batch", 1, stick, serial)
+    result["output"] = serial.messages
+    try:
+        cpu.predecode()
+        cpu.run(max_cycles)
+    finally:
+        result["exit_code"], result["cycles"] = cpu.exit_code, cpu.cycle
+
+def _run_8bit(source: str, max_cycles: int | None, result: dict) -> None:
+    zvm = _worker["zvm"]
+    image = _worker["image"].Image(_worker["assembler"].assemble_object(source))
+    messages = []
+    try:
+        cpu = zvm.CPU(zvm.RAM(image), output=messages.append)
+        result["output"] = messages
+        try:
+            cpu.run(max_cycles)
+        finally:
+            result["exit_code"], result["cycles"] = cpu.exit_code, cpu.cycle
+    finally:
+        image.close()
+
+def run_program(source: str, max_cycles: int | None = None) -> dict:
+    """
+    Assemble and run one program inside a worker
+
+    :param source: the .zev file
+    :param max_cycles: stop the program after this many cycles, None means no limit
+    :return: the result record
+    """
+    result = dict.fromkeys(FIELDS)
+    result["source"] = source
+
+    start = time.perf_counter()
+    try:
+        run = _run_4bit if _toolchain == "4bit" else _run_8bit
+        run(source, max_cycles, result)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+
+    return result
+
+def find_sources(pattern: str) -> list[str]:
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.zev")
+    return sorted(glob.glob(pattern, recursive=True))
+
+def write_results(results: list[dict], filename: str) -> None:
+    with open(filename, "w", newline="") as f:
+        if filename.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for result in results:
+                writer.writerow(dict(result, output="\n".join(result["output"] or [])))
+        else:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+def run_batch(arch: str, sources: list[str], jobs: int | None = None, max_cycles: int | None = None) -> list[dict]:
+    """
+    Run every program on a pool of warm workers
+
+    :param arch: which toolchain to use, "4bit" or "8bit"
+    :param sources: the .zev files to run
+    :param jobs: how many worker processes to use, one per host CPU by default
+    :param max_cycles: the cycle budget of each program, None means no limit
+    :return: one result record per program, in the same order as sources
+    """
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_start_worker, initargs=(arch,)) as pool:
+        chunksize = max(1, len(sources) // ((jobs or os.cpu_count() or 1) * 4))
+        return list(pool.map(run_program, sources, [max_cycles] * len(sources), chunksize=chunksize))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble and run many .zev programs")
+    parser.add_argument("arch", choices=["4bit", "8bit"])
+    parser.add_argument("sources", help="a directory of .zev files or a glob")
+    parser.add_argument("--output", default="results.jsonl", help="result file, .jsonl or .csv")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, defaults to the host CPU count")
+    parser.add_argument("--max-cycles", type=int, default=None, help="cycle budget per program")
+    args = parser.parse_args()
+
+    sources = [os.path.abspath(source) for source in find_sources(args.sources)]
+    results = run_batch(args.arch, sources, args.jobs, args.max_cycles)
+    write_results(results, args.output)
+
+    failed = sum(1 for result in results if result["error"] is not None)
+    print(f"Ran {len(results)} programs, {failed} failed. Results written to {args.output}")